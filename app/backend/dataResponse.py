@@ -0,0 +1,123 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from fastapi import Request
+from fastapi.responses import JSONResponse as BaseJSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+
+def frame_columns(df):
+    # Same layout as DataFrame.to_dict(orient='list'). Numeric columns are
+    # kept as arrays, which orjson serializes without creating Python objects
+    columns = {}
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if orjson is not None and values.dtype.kind in 'biuf':
+            columns[str(col)] = np.ascontiguousarray(values)
+        else:
+            columns[str(col)] = values.tolist()
+
+    return columns
+
+
+def to_builtin(obj):
+    '''Converts the objects the JSON encoders do not serialize.
+
+    :param obj: Object to serialize
+    :type obj: any
+    :raises TypeError: The object cannot be serialized
+    :return: Serializable object
+    :rtype: any
+    '''
+
+    if isinstance(obj, pd.DataFrame):
+        return frame_columns(obj)
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return obj.tolist()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, Path):
+        return str(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class JSONResponse(BaseJSONResponse):
+    '''Drop-in replacement of :class:`fastapi.responses.JSONResponse()`
+    serializing DataFrames, NumPy arrays and scalars directly. It uses
+    orjson when it is installed and the standard encoder otherwise.
+    '''
+
+    def render(self, content):
+
+        if orjson is not None:
+            return orjson.dumps(content, default=to_builtin,
+                                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                          separators=(',', ':'), default=to_builtin).encode('utf-8')
+
+
+def arrow_stream(df):
+    '''Serializes a table in the Arrow IPC stream format.
+
+    :param df: Table
+    :type df: pandas.DataFrame
+    :return: Arrow IPC stream
+    :rtype: bytes
+    '''
+
+    # Columns filled with '' for the JSON clients mix strings and numbers
+    mixed = {col: str for col in df.columns
+             if df[col].dtype == object and pd.api.types.infer_dtype(df[col]).startswith('mixed')}
+    table = pa.Table.from_pandas(df.astype(mixed) if mixed else df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue().to_pybytes()
+
+
+def table_response(request: Request, table, offset=0, limit=None):
+    '''Response with a page of a table, as an Arrow IPC stream if the client
+    accepts it and pyarrow is installed, otherwise as JSON columns like
+    DataFrame.to_dict(orient='list'). The X-Total-Rows, X-Offset and X-Rows
+    headers tell the number of rows of the table and the rows returned.
+
+    :param request: Request, for the accepted media types
+    :type request: :class:`fastapi.Request()`
+    :param table: Table, or columns of values by name
+    :type table: pandas.DataFrame or dict[str, list] or NoneType
+    :param offset: Index of the first row returned, defaults to 0
+    :type offset: int, optional
+    :param limit: Maximum number of rows returned.
+    If None, all the rows are returned, defaults to None
+    :type limit: int, optional
+    :rtype: :class:`fastapi.responses.Response()`
+    '''
+
+    if table is None:
+        return JSONResponse(content=None)
+    if not isinstance(table, pd.DataFrame):
+        table = pd.DataFrame(table)
+    offset = max(offset, 0)
+    page = table.iloc[offset:None if limit is None else offset + max(limit, 0)]
+    headers = {'X-Total-Rows': str(len(table)), 'X-Offset': str(offset),
+               'X-Rows': str(len(page)), 'Vary': 'Accept'}
+
+    if pa is not None and ARROW_STREAM in request.headers.get('accept', ''):
+        return Response(content=arrow_stream(page), media_type=ARROW_STREAM, headers=headers)
+    return JSONResponse(content=page, headers=headers)
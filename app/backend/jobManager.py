@@ -0,0 +1,259 @@
+import time
+import uuid
+import asyncio
+import threading
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+class JobCancelled(Exception):
+    '''Raised by :meth:`Job.update` when the job is cancelled.'''
+
+
+class JobLimitError(Exception):
+    '''Raised when a user has too many jobs waiting to run.'''
+
+
+@dataclass
+class Job:
+    '''A long operation run by the :class:`JobManager`. The operation
+    is called with the job as first argument, so it can report its
+    progress with :meth:`update`.
+    '''
+
+    user: str
+    name: str
+    func: Callable
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    state: str = 'queued'
+    progress: float = 0.0
+    message: str = ''
+    result: Any = None
+    error: str | None = None
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    future: Future = field(default_factory=Future)
+
+    @property
+    def cancelled(self):
+
+        return self.cancel_event.is_set()
+
+    @property
+    def done(self):
+
+        return self.state in ('completed', 'failed', 'cancelled')
+
+    def update(self, progress=None, message=None):
+        '''Report the progress of the job. Raises :class:`JobCancelled`
+        once the job is cancelled, so the operation stops at the next update.
+
+        :param progress: Fraction of the job done, between 0 and 1, defaults to None
+        :type progress: float, optional
+        :param message: Description of the current step, defaults to None
+        :type message: str, optional
+        '''
+
+        if self.cancelled:
+            raise JobCancelled(f'Job {self.id} is cancelled')
+        if progress is not None:
+            self.progress = min(max(float(progress), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    def info(self):
+
+        return {'job_id': self.id, 'user': self.user, 'name': self.name,
+                'state': 'cancelling' if self.cancelled and not self.done else self.state,
+                'progress': self.progress, 'message': self.message,
+                'error': self.error, 'created': self.created,
+                'started': self.started, 'finished': self.finished}
+
+
+class JobManager:
+    '''Runs long operations in a local thread pool, so requests return
+    immediately with a job id. The number of running jobs is capped
+    globally and per user, the other jobs wait in submission order.
+    Threads are used because the jobs work on the layouts loaded in
+    the server memory.
+    '''
+
+    def __init__(self, max_workers=4, max_per_user=2, max_queued_per_user=20, keep_time=3600):
+        '''Initialization of the :class:`JobManager()` class
+
+        :param max_workers: Maximum number of running jobs, defaults to 4
+        :type max_workers: int, optional
+        :param max_per_user: Maximum number of running jobs of a user, defaults to 2
+        :type max_per_user: int, optional
+        :param max_queued_per_user: Maximum number of jobs of a user
+        waiting to run, defaults to 20
+        :type max_queued_per_user: int, optional
+        :param keep_time: Time in seconds the finished jobs and their
+        results are kept, defaults to 3600
+        :type keep_time: float, optional
+        '''
+
+        self.max_workers = max_workers
+        self.max_per_user = max_per_user
+        self.max_queued_per_user = max_queued_per_user
+        self.keep_time = keep_time
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='job')
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.queued = []
+        self.running = Counter()
+
+    def submit(self, user, name, func, *args, **kwargs):
+        '''Submit an operation. It is called as func(job, *args, **kwargs).
+
+        :param user: User submitting the job
+        :type user: str
+        :param name: Name of the operation
+        :type name: str
+        :param func: Operation to run
+        :type func: callable
+        :raises JobLimitError: The user has too many jobs waiting to run
+        :return: Submitted job
+        :rtype: Job
+        '''
+
+        with self.lock:
+            self._purge()
+            if sum(job.user == user for job in self.queued) >= self.max_queued_per_user:
+                raise JobLimitError(f'{user} has already {self.max_queued_per_user} '
+                                    f'jobs waiting to run')
+            job = Job(user, name, func, args, kwargs)
+            self.jobs[job.id] = job
+            self.queued.append(job)
+            self._dispatch()
+
+        return job
+
+    def _dispatch(self):
+
+        for job in list(self.queued):
+            if sum(self.running.values()) >= self.max_workers:
+                break
+            if self.running[job.user] >= self.max_per_user:
+                continue
+            self.queued.remove(job)
+            self.running[job.user] += 1
+            job.state = 'running'
+            job.started = time.time()
+            self.executor.submit(self._run, job)
+
+    def _run(self, job):
+
+        error = None
+        try:
+            result = job.func(job, *job.args, **job.kwargs)
+            state = 'cancelled' if job.cancelled else 'completed'
+        except JobCancelled:
+            result, state = None, 'cancelled'
+        except Exception as exc:
+            result, state, error = None, 'failed', exc
+            job.error = f'{type(exc).__name__}: {exc}'
+            traceback.print_exc()
+
+        with self.lock:
+            job.finished = time.time()
+            job.state = state
+            if state == 'completed':
+                job.result = result
+                job.progress = 1.0
+            self.running[job.user] -= 1
+            self._dispatch()
+
+        if state == 'completed':
+            job.future.set_result(result)
+        elif state == 'failed':
+            job.future.set_exception(error)
+        else:
+            job.future.cancel()
+
+    def _purge(self):
+
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.done and now - job.finished > self.keep_time:
+                del self.jobs[job_id]
+
+    def get(self, job_id):
+        '''Get a job.
+
+        :param job_id: Job id
+        :type job_id: str
+        :raises KeyError: The job does not exist or expired
+        :rtype: Job
+        '''
+
+        with self.lock:
+            return self.jobs[job_id]
+
+    def list(self, user=None):
+        '''List the jobs, oldest first.
+
+        :param user: Only list the jobs of this user, defaults to None
+        :type user: str, optional
+        :rtype: list[Job]
+        '''
+
+        with self.lock:
+            self._purge()
+            return [job for job in self.jobs.values() if user is None or job.user == user]
+
+    def cancel(self, job_id):
+        '''Cancel a job. A waiting job is cancelled immediately, a running
+        job stops at its next progress update and its result is discarded.
+
+        :param job_id: Job id
+        :type job_id: str
+        :raises KeyError: The job does not exist or expired
+        :rtype: Job
+        '''
+
+        with self.lock:
+            job = self.jobs[job_id]
+            if job.done:
+                return job
+            job.cancel_event.set()
+            if job in self.queued:
+                self.queued.remove(job)
+                job.state = 'cancelled'
+                job.finished = time.time()
+                job.future.cancel()
+
+        return job
+
+    async def wait(self, job):
+        '''Wait for a job to finish without blocking the event loop.
+
+        :param job: Job to wait for
+        :type job: Job
+        :raises asyncio.CancelledError: The job was cancelled
+        :return: Result of the job
+        '''
+
+        return await asyncio.wrap_future(job.future)
+
+    def stats(self):
+
+        with self.lock:
+            states = Counter(job.info()['state'] for job in self.jobs.values())
+            return {'max_workers': self.max_workers, 'max_per_user': self.max_per_user,
+                    'running': sum(self.running.values()), 'queued': len(self.queued),
+                    'states': dict(states)}
+
+    def shutdown(self):
+
+        with self.lock:
+            for job in self.jobs.values():
+                job.cancel_event.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
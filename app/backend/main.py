@@ -8,15 +8,18 @@ import time
 import shutil
 from pathlib import Path
 from dataclasses import dataclass
+from contextlib import contextmanager
 from typing import Any
 import json
 
-from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, Response
 
 import asyncio
 import queue
+import concurrent.futures
 import uvicorn
 
 from src.models.NewProject import NewProject
@@ -53,15 +56,28 @@ from src.models.BoxesToPortsInfo import BoxesToPortsInfo
 from src.models.ReducePortsInfo import ReducePortsInfo
 from src.models.SinksVrmsToPortsInfo import SinksVrmsToPortsInfo
 from src.models.PathContent import PathContent
+from src.models.TreeQuery import TreeQuery
 from src.models.ServerInfo import ServerInfo
+from src.models.UploadInfo import UploadInfo
+
+from jobManager import JobManager, JobLimitError
+from uploadManager import UploadManager, UploadError
+from progressChannel import ProgressChannel
+from sessionManager import SessionManager, request_session_id
+# Serializes DataFrames and NumPy arrays directly, see dataResponse
+from dataResponse import JSONResponse, table_response
 
 import thinkpi.backend_api.api as api
 from thinkpi.backend_api import lib
-#from thinkpi.config import thinkpi_conf as cfg
+from thinkpi.backend_api.layout_cache import LayoutNotLoaded
+from thinkpi.config import thinkpi_conf as cfg
 from thinkpi import __version__
 
 app = FastAPI()
 
+# Minimum size in bytes of the compressed responses
+gzip_min_size = 4096
+
 origins = [
     # "http://localhost.tiangolo.com",
     # "https://localhost.tiangolo.com",
@@ -96,9 +112,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Rows", "X-Offset", "X-Rows"],
 )
 
-processed_Dbapi_object = {}
+# Responses are compressed for the clients accepting gzip
+app.add_middleware(GZipMiddleware, minimum_size=gzip_min_size)
+
+# Loaded layouts by path, kept in the memory budgeted api.loaded_layouts
+processed_Dbapi_object = api.DbApiCache()
 all_queues = {}
 current_queue = None
 
@@ -106,6 +127,18 @@ lib_manager_path = r'D:\jrosenfe\ThinkPI\lib_manager'
 material_path = r'D:\jrosenfe\ThinkPI\material\\'
 spd_path = r'D:\jrosenfe\ThinkPI\spd_files\\'
 
+# Long operations run as jobs, capped globally and per user
+max_jobs = 4
+max_jobs_per_user = 2
+jobs = JobManager(max_workers=max_jobs, max_per_user=max_jobs_per_user)
+
+# Seconds after which a session without websocket is dropped
+session_idle_timeout = 3600
+
+# Uploaded layouts, stored once per content, and their pre-loading jobs by layout path
+uploads = UploadManager('upload')
+preloaded_layouts = {}
+
 '''
 @dataclass
 class CurrentQueue:
@@ -144,11 +177,24 @@ def update():
     return JSONResponse(content={'result': 'success'})
 
 @app.post("/path")
-async def path(val: PathContent):
+def path(val: PathContent):
     lib_mgr = lib.LibManager()
     res = lib_mgr.get_path_content(val.path)
     return JSONResponse(content=res)
 
+@app.post("/tree")
+def tree(val: TreeQuery):
+    # Lazy browsing of the project library, one page of a folder at a time
+    lib_mgr = lib.LibManager(root=lib_manager_path)
+    try:
+        res = lib_mgr.subtree(val.path, val.depth, val.offset, val.limit,
+                              val.file_types, val.dirs_only)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return JSONResponse(content=res)
+
 '''
 @app.post("/resource-info")
 async def get_resource_info():
@@ -181,31 +227,123 @@ class ConnectionManager:
         for connection in self.active_connections:
             await connection.send_text(message)
 
-class SharedData:
-    def __init__(self):
-        self.session_queues = {}
-        self.ports = None
-
 ws_manager = ConnectionManager()
-sd = SharedData()
+# Each client session has its own port handler and progress channel
+sessions = SessionManager(api.PortHandler, idle_timeout=session_idle_timeout)
+
+async def send_progress(websocket: WebSocket, channel: ProgressChannel):
+    # Forward the progress messages as soon as they are put in the channel
+    try:
+        while True:
+            message = await channel.get()
+            await ws_manager.send_personal_message(str(message), websocket)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
 
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
     await ws_manager.connect(websocket)
-    que = queue.Queue()
-    sd.session_queues[session_id] = que
-    sd.ports = api.PortHandler(que)
-    while True:
-        # data = await websocket.receive_text()
-        try:
-            data = que.get_nowait()
-            await ws_manager.send_personal_message(data, websocket)
-        except queue.Empty:
-            await asyncio.sleep(1)
-        except WebSocketDisconnect:
-            ws_manager.disconnect(websocket)
-            del sd.session_queues[session_id]
-            await manager.broadcast(f"User #{session_id} left")
+    channel = ProgressChannel()
+    sessions.attach(session_id, channel)
+    sender = asyncio.create_task(send_progress(websocket, channel))
+    try:
+        # Receiving is needed to observe the disconnection
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        channel.close()
+        ws_manager.disconnect(websocket)
+        # A new connection of the same session may have replaced the channel
+        sessions.detach(session_id, channel)
+
+@contextmanager
+def session_ports(request: Request, *layouts, session_id=None):
+    # Port handler of the session of the request, used by one request at a
+    # time. The layouts, shared by the sessions, are not evicted meanwhile
+    names = [fname for fname in layouts if fname]
+    with sessions.use(request_session_id(request, session_id), exclusive=True) as session:
+        with api.loaded_layouts.use(*names):
+            yield session.ports
+
+def submit_job(request: Request, name, func, *args, user=None, layouts=(), **kwargs):
+    def run_with_layouts(job, *args, **kwargs):
+        # The layouts used by the job are not evicted while it runs
+        names = [fname for fname in layouts if fname]
+        # Progress messages of the job go to the session of its user
+        with sessions.use(job.user), api.loaded_layouts.use(*names):
+            try:
+                return func(job, *args, **kwargs)
+            finally:
+                # The job may have modified the layouts, their tiles are built again
+                for db in filter(None, map(api.loaded_layouts.get, names)):
+                    api.layer_tiles.invalidate(db)
+
+    return jobs.submit(request_session_id(request, user), name, run_with_layouts, *args, **kwargs)
+
+async def run_job(request: Request, name, func, *args, user=None, layouts=(), background=False, **kwargs):
+    # Run a long operation as a job. The response is sent once the job is
+    # done, or immediately with the job id when background is True.
+    try:
+        job = submit_job(request, name, func, *args, user=user, layouts=layouts, **kwargs)
+    except JobLimitError as e:
+        return JSONResponse(status_code=429, content={'error': str(e)})
+    if background:
+        return JSONResponse(status_code=202, content=job.info())
+    try:
+        result = await jobs.wait(job)
+    except asyncio.CancelledError:
+        if job.state != 'cancelled':
+            raise
+        return JSONResponse(status_code=409, content=job.info())
+
+    return JSONResponse(content=result)
+
+def get_job(job_id):
+    try:
+        return jobs.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f'Job {job_id} not found')
+
+@app.get("/jobs")
+def list_jobs(user: str | None = None):
+    return JSONResponse(content={'jobs': [job.info() for job in jobs.list(user)],
+                                 'stats': jobs.stats()})
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return JSONResponse(content=get_job(job_id).info())
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = get_job(job_id)
+    if job.state != 'completed':
+        return JSONResponse(status_code=409, content=job.info())
+
+    return JSONResponse(content=job.result)
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    get_job(job_id)
+    return JSONResponse(content=jobs.cancel(job_id).info())
+
+@app.on_event("shutdown")
+def shutdown_jobs():
+    jobs.shutdown()
+
+@app.exception_handler(LayoutNotLoaded)
+async def layout_not_loaded(request: Request, exc: LayoutNotLoaded):
+    return JSONResponse(status_code=409, content={'error': f'{exc.args[0]}, load it again'})
+
+@app.get("/sessions")
+def list_sessions():
+    return JSONResponse(content={'sessions': sessions.list(), 'idle_timeout': sessions.idle_timeout})
+
+@app.get("/layout-cache")
+def layout_cache_stats():
+    return JSONResponse(content=api.loaded_layouts.stats())
 
 @app.post("/new-project")
 def new_project(val: NewProject):
@@ -298,29 +436,97 @@ def new_rail(val: NewProject):
 
     return JSONResponse(content=res)
 
+@app.exception_handler(UploadError)
+async def upload_error(request: Request, exc: UploadError):
+    return JSONResponse(status_code=exc.status_code, content={'error': str(exc)})
+
+def preload_layout(request: Request, upload, session_id=None):
+    # Load an uploaded layout in the background, /load-spd-data then uses it
+    fpath = upload['path']
+    def load(job):
+        job.update(message=f'Pre-loading {fpath}')
+        db_api = api.DbApi(fpath)
+        db_api.load_data()
+        processed_Dbapi_object[fpath] = db_api
+        return {'layout_fname': fpath}
+
+    try:
+        job = submit_job(request, 'preload-spd', load, user=session_id, layouts=[fpath])
+    except JobLimitError as e:
+        return {**upload, 'preload_error': str(e)}
+    preloaded_layouts[api.loaded_layouts.key(fpath)] = job
+
+    return {**upload, 'preload_job': job.info()}
+
 @app.post("/upload-spd")
-def upload_spd(file: UploadFile = File(...)):
-    with open(f'upload/{file.filename}', "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+def upload_spd(request: Request, file: UploadFile = File(...), preload: bool = False,
+               session_id: str | None = None):
+    upload = uploads.save(file.filename, file.file)
+    if preload and upload['path'] not in processed_Dbapi_object:
+        upload = preload_layout(request, upload, session_id)
+
+    return upload
+
+# Chunked uploads: create the upload, send the chunks in order with their
+# offset, then complete it. An interrupted upload resumes from the
+# received size, given by creating it again or by its status.
+@app.post("/uploads")
+def create_upload(info: UploadInfo):
+    return uploads.create(info.filename, info.size, info.sha256)
+
+@app.get("/uploads/{upload_id}")
+def upload_status(upload_id: str):
+    return uploads.status(upload_id)
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(request: Request, upload_id: str, offset: int):
+    data = await request.body()
+    return await asyncio.to_thread(uploads.write, upload_id, offset, data)
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(request: Request, upload_id: str, preload: bool = False,
+                          session_id: str | None = None):
+    upload = await asyncio.to_thread(uploads.complete, upload_id)
+    if preload and upload['path'] not in processed_Dbapi_object:
+        upload = preload_layout(request, upload, session_id)
+
+    return upload
+
+@app.delete("/uploads/{upload_id}")
+def cancel_upload(upload_id: str):
+    uploads.cancel(upload_id)
 
-    return {"file_name": file.filename}
+    return {"status": "success"}
 
 @app.post("/load-spd-data")
-def load_SPD_data(data: SpdData):
+async def load_SPD_data(data: SpdData, request: Request, background: bool = False):
     #path = name.filename
     #all_queues[path] = current_queue.queue
-    db_api = api.DbApi(data.layout_fname, sd.session_queues[data.session_id])
-    j = db_api.load_data()
-    processed_Dbapi_object[data.layout_fname] = db_api
-
-    return JSONResponse(content=j)
+    def load(job):
+        preload = preloaded_layouts.pop(api.loaded_layouts.key(data.layout_fname), None)
+        if preload is not None and preload.state == 'running':
+            job.update(message=f'Waiting for {data.layout_fname} to be pre-loaded')
+            concurrent.futures.wait([preload.future])
+        elif preload is not None and not preload.done:
+            jobs.cancel(preload.id)
+        if (preload is not None and preload.state == 'completed'
+                and data.layout_fname in processed_Dbapi_object):
+            return processed_Dbapi_object[data.layout_fname].summary()
+
+        job.update(message=f'Loading {data.layout_fname}')
+        db_api = api.DbApi(data.layout_fname)
+        j = db_api.load_data()
+        processed_Dbapi_object[data.layout_fname] = db_api
+        return j
+
+    return await run_job(request, 'load-spd-data', load, user=data.session_id,
+                         layouts=[data.layout_fname], background=background)
 
 @app.post("/delete-spd")
 def delete_SPD(name: SpdData):
-    filename = name.filename
-    api.loaded_layouts[filename].pop(filename)
-    processed_Dbapi_object[filename].pop(filename)
-    del all_queues[filename]
+    filename = name.layout_fname
+    processed_Dbapi_object.pop(filename)
+    all_queues.pop(filename, None)
 
     return {"status": "success"}
 
@@ -335,6 +541,34 @@ def load_SPD_by_Layer(name: SpdLayerData):
 
     return JSONResponse(content=j)
 
+@app.post("/layer-tile-info")
+def layer_tile_info(name: SpdLayerData):
+    try:
+        info = processed_Dbapi_object[name.filename].layer_tile_info(name.layer)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return JSONResponse(content=info)
+
+@app.get("/layer-tile/{level}/{x}/{y}")
+def layer_tile(request: Request, filename: str, layer: str, level: int, x: int, y: int):
+    # Binary tile of the layer geometry, see thinkpi.backend_api.layer_geometry
+    try:
+        data, tag = processed_Dbapi_object[filename].layer_tile(layer, level, x, y)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    etag = f'"{tag}"'
+    # Clients revalidate the tiles, they change when the layout is modified
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=data, media_type='application/octet-stream', headers=headers)
+
+@app.get("/layer-tile-cache")
+def layer_tile_cache_stats():
+    return JSONResponse(content=api.layer_tiles.stats())
+
 @app.post("/load-material-data")
 def load_material_data(data: MaterialData):
     #db_api = api.DbApi(data.layout_fname)
@@ -374,47 +608,56 @@ def save_stackup(data: SaveStackupData):
                         )
 
 @app.post('/apply-stackup')
-def apply_stackup(data: ApplyStackupData):
-    if Path(data.stackup_fname).name == data.stackup_fname:
-        data.stackup_fname = str(Path(data.spd_fname).parent / Path(data.stackup_fname))
-    processed_Dbapi_object[data.spd_fname].apply_stackup(
-        data.stackup_fname, data.material_fname
-    )
+async def apply_stackup(data: ApplyStackupData, request: Request, background: bool = False):
+    def run(job):
+        if Path(data.stackup_fname).name == data.stackup_fname:
+            data.stackup_fname = str(Path(data.spd_fname).parent / Path(data.stackup_fname))
+        processed_Dbapi_object[data.spd_fname].apply_stackup(
+            data.stackup_fname, data.material_fname
+        )
+
+    return await run_job(request, 'apply-stackup', run, user=data.session_id, layouts=[data.spd_fname], background=background)
 
 @app.post("/auto-setup-stackup")
-def auto_setup_Stackup(data: AutoStackupData):
-    spd_filename = data.spd_filename
-    filename = data.filename
-    unit = data.unit
-    dielec_thickness = float(
-        data.dielec_thickness) if data.dielec_thickness else None
-    metal_thickness = float(
-        data.metal_thickness) if data.metal_thickness else None
-    core_thickness = float(
-        data.core_thickness) if data.core_thickness else None
-    conduct = float(data.conduct) if data.conduct else None
-
-    dielec_material = data.dielec_material
-    metal_material = data.metal_material
-    core_material = data.core_material
-    fillin_dielec_material = data.fillin_dielec_material
-    er = data.er
-    loss_tangent = data.loss_tangent
-
-    stackup_response = processed_Dbapi_object[spd_filename].auto_setup_stackup(
-        filename, unit, dielec_thickness, metal_thickness, core_thickness,
-        conduct, str(dielec_material), metal_material, core_material,
-        fillin_dielec_material, er, loss_tangent)
-
-    return JSONResponse(content=stackup_response)
+async def auto_setup_Stackup(data: AutoStackupData, request: Request, background: bool = False):
+    def run(job):
+        spd_filename = data.spd_filename
+        filename = data.filename
+        unit = data.unit
+        dielec_thickness = float(
+            data.dielec_thickness) if data.dielec_thickness else None
+        metal_thickness = float(
+            data.metal_thickness) if data.metal_thickness else None
+        core_thickness = float(
+            data.core_thickness) if data.core_thickness else None
+        conduct = float(data.conduct) if data.conduct else None
+
+        dielec_material = data.dielec_material
+        metal_material = data.metal_material
+        core_material = data.core_material
+        fillin_dielec_material = data.fillin_dielec_material
+        er = data.er
+        loss_tangent = data.loss_tangent
+
+        stackup_response = processed_Dbapi_object[spd_filename].auto_setup_stackup(
+            filename, unit, dielec_thickness, metal_thickness, core_thickness,
+            conduct, str(dielec_material), metal_material, core_material,
+            fillin_dielec_material, er, loss_tangent)
+
+        return stackup_response
+
+    return await run_job(request, 'auto-setup-stackup', run, user=data.session_id, layouts=[data.spd_filename], background=background)
 
 @app.post('/apply-padstack')
-def apply_stackup(data: ApplyPadstackData):
-    if Path(data.padstack_fname).name == data.padstack_fname:
-        data.padstack_fname = str(Path(data.spd_fname).parent / Path(data.padstack_fname))
-    processed_Dbapi_object[data.spd_fname].apply_padstack(
-        data.padstack_fname, data.material_fname
-    )
+async def apply_stackup(data: ApplyPadstackData, request: Request, background: bool = False):
+    def run(job):
+        if Path(data.padstack_fname).name == data.padstack_fname:
+            data.padstack_fname = str(Path(data.spd_fname).parent / Path(data.padstack_fname))
+        processed_Dbapi_object[data.spd_fname].apply_padstack(
+            data.padstack_fname, data.material_fname
+        )
+
+    return await run_job(request, 'apply-padstack', run, user=data.session_id, layouts=[data.spd_fname], background=background)
 
 @app.post("/get-padstack")
 def get_PadStack(data: SpdData):
@@ -423,22 +666,25 @@ def get_PadStack(data: SpdData):
     return JSONResponse(content=j)
 
 @app.post("/auto-setup-padstack")
-def auto_setup_padstack(data: PadStackData):
-    if data.material == 'Default':
-        data.material = None
-    if data.inner_fill_material == 'Default':
-        data.inner_fill_material = None
-    if data.outer_coating_material == 'Default':
-        data.outer_coating_material = None
-
-    padstack_response = processed_Dbapi_object[data.spd_fname].auto_setup_padstack(
-        data.csv_fname, data.layout_type, data.brd_plating,
-        data.pkg_gnd_plating, data.pkg_pwr_plating, data.conduct, data.material,
-        data.inner_fill_material, data.outer_thickness,
-        data.outer_coating_material, data.unit
-    )
-
-    return JSONResponse(content=padstack_response)
+async def auto_setup_padstack(data: PadStackData, request: Request, background: bool = False):
+    def run(job):
+        if data.material == 'Default':
+            data.material = None
+        if data.inner_fill_material == 'Default':
+            data.inner_fill_material = None
+        if data.outer_coating_material == 'Default':
+            data.outer_coating_material = None
+
+        padstack_response = processed_Dbapi_object[data.spd_fname].auto_setup_padstack(
+            data.csv_fname, data.layout_type, data.brd_plating,
+            data.pkg_gnd_plating, data.pkg_pwr_plating, data.conduct, data.material,
+            data.inner_fill_material, data.outer_thickness,
+            data.outer_coating_material, data.unit
+        )
+
+        return padstack_response
+
+    return await run_job(request, 'auto-setup-padstack', run, user=data.session_id, layouts=[data.spd_fname], background=background)
 
 def prepend_path(layout_fname, other_fname):
     if other_fname is not None and Path(other_fname).name == other_fname:
@@ -447,86 +693,97 @@ def prepend_path(layout_fname, other_fname):
         return other_fname
 
 @app.post("/preprocess")
-def preprocess(data: PreprocessData):
-    data.stackup_fname = prepend_path(data.layout_fname, data.stackup_fname)
-    data.padstack_fname = prepend_path(data.layout_fname, data.padstack_fname)
-    data.material_fname = prepend_path(data.layout_fname, data.material_fname)
-    data.post_processed_fname = prepend_path(data.layout_fname, data.post_processed_fname)
-
-    # if data.stackup_fname is not None and Path(data.stackup_fname).name == data.stackup_fname:
-    #     data.stackup_fname = str(Path(data.layout_fname).parent / Path(data.stackup_fname))
-    # if data.padstack_fname is not None and Path(data.padstack_fname).name == data.padstack_fname:
-    #     data.padstack_fname = str(Path(data.layout_fname).parent / Path(data.padstack_fname))
-    # if data.material_fname is not None and Path(data.material_fname).name == data.material_fname:
-    #     data.material_fname = str(Path(data.layout_fname).parent / Path(data.material_fname))
-    # if data.post_processed_fname is not None and Path(data.post_processed_fname).name == data.post_processed_fname:
-    #     data.post_processed_fname = str(Path(data.layout_fname).parent / Path(data.post_processed_fname))
+async def preprocess(data: PreprocessData, request: Request, background: bool = False):
+    def run(job):
+        data.stackup_fname = prepend_path(data.layout_fname, data.stackup_fname)
+        data.padstack_fname = prepend_path(data.layout_fname, data.padstack_fname)
+        data.material_fname = prepend_path(data.layout_fname, data.material_fname)
+        data.post_processed_fname = prepend_path(data.layout_fname, data.post_processed_fname)
+
+        # if data.stackup_fname is not None and Path(data.stackup_fname).name == data.stackup_fname:
+        #     data.stackup_fname = str(Path(data.layout_fname).parent / Path(data.stackup_fname))
+        # if data.padstack_fname is not None and Path(data.padstack_fname).name == data.padstack_fname:
+        #     data.padstack_fname = str(Path(data.layout_fname).parent / Path(data.padstack_fname))
+        # if data.material_fname is not None and Path(data.material_fname).name == data.material_fname:
+        #     data.material_fname = str(Path(data.layout_fname).parent / Path(data.material_fname))
+        # if data.post_processed_fname is not None and Path(data.post_processed_fname).name == data.post_processed_fname:
+        #     data.post_processed_fname = str(Path(data.layout_fname).parent / Path(data.post_processed_fname))
     
-    processed_Dbapi_object[data.layout_fname].preprocess(
-        data.power_nets, data.ground_nets,
-        data.stackup_fname, data.padstack_fname,
-        data.material_fname, data.default_conduct,
-        data.cut_margin, data.post_processed_fname,
-        data.delete_unused_nets
-    )
+        processed_Dbapi_object[data.layout_fname].preprocess(
+            data.power_nets, data.ground_nets,
+            data.stackup_fname, data.padstack_fname,
+            data.material_fname, data.default_conduct,
+            data.cut_margin, data.post_processed_fname,
+            data.delete_unused_nets
+        )
     
-    return {"status": "success"}
-
-@app.post("/motherboard")
-def motherboard(data: MotherboardData):
-    filename = data.spd_filename
-    #ports = api.PortHandler(all_queues[filename])
-    ports_fname = data.ports_fname
-    # pwr_net_name = ["P1V1_L", "P3V3_E"]
-    pwr_net_name = data.pwr_net_name
-    cap_layer_top = data.cap_layer_top if data.cap_layer_top else None
-    reduce_num_top = int(data.reduce_num_top) if data.reduce_num_top else None
-    cap_layer_bot = data.cap_layer_bot if data.cap_layer_bot else None
-    reduce_num_bot = int(data.reduce_num_bot) if data.reduce_num_bot else None
-    vrm_layer = data.vrm_layer if data.vrm_layer else None
-    socket_mode = data.socket_mode if data.socket_mode else None
-    from_db_side = data.from_db_side if data.from_db_side else None
-    skt_num_ports = int(data.skt_num_ports) if data.skt_num_ports else None
-    pkg_fname = data.pkg_fname if data.pkg_fname else None
-    cap_finder = data.cap_finder if data.cap_finder else None
-    ref_z = float(data.ref_z) if data.ref_z else None
+        return {"status": "success"}
 
-    motherboard_response = ports.setup_motherboard_ports(filename,
-                                                         pwr_net_name, cap_finder, cap_layer_top, reduce_num_top,
-                                                         cap_layer_bot, reduce_num_bot, vrm_layer, ref_z,
-                                                         socket_mode, from_db_side, skt_num_ports, pkg_fname)
+    return await run_job(request, 'preprocess', run, user=data.session_id, layouts=[data.layout_fname], background=background)
 
-    return JSONResponse(content=motherboard_response)
+@app.post("/motherboard")
+async def motherboard(data: MotherboardData, request: Request, background: bool = False):
+    def run(job):
+        filename = data.spd_filename
+        #ports = api.PortHandler(all_queues[filename])
+        ports_fname = data.ports_fname
+        # pwr_net_name = ["P1V1_L", "P3V3_E"]
+        pwr_net_name = data.pwr_net_name
+        cap_layer_top = data.cap_layer_top if data.cap_layer_top else None
+        reduce_num_top = int(data.reduce_num_top) if data.reduce_num_top else None
+        cap_layer_bot = data.cap_layer_bot if data.cap_layer_bot else None
+        reduce_num_bot = int(data.reduce_num_bot) if data.reduce_num_bot else None
+        vrm_layer = data.vrm_layer if data.vrm_layer else None
+        socket_mode = data.socket_mode if data.socket_mode else None
+        from_db_side = data.from_db_side if data.from_db_side else None
+        skt_num_ports = int(data.skt_num_ports) if data.skt_num_ports else None
+        pkg_fname = data.pkg_fname if data.pkg_fname else None
+        cap_finder = data.cap_finder if data.cap_finder else None
+        ref_z = float(data.ref_z) if data.ref_z else None
+
+        with sessions.use(job.user, exclusive=True) as session:
+            motherboard_response = session.ports.setup_motherboard_ports(filename,
+                                                                         pwr_net_name, cap_finder, cap_layer_top, reduce_num_top,
+                                                                         cap_layer_bot, reduce_num_bot, vrm_layer, ref_z,
+                                                                         socket_mode, from_db_side, skt_num_ports, pkg_fname)
+
+        return motherboard_response
+
+    return await run_job(request, 'motherboard', run, user=data.session_id, layouts=[data.spd_filename], background=background)
 
 @app.post("/package")
-def package(data: PackageData):
-    filename = data.spd_filename
-    #ports = api.PortHandler(all_queues[filename])
-    sinks_mode = data.sinks_mode if data.sinks_mode else None
-    ports_fname = data.ports_fname
-    #pwr_net_name = ["P1V1_L", "P3V3_E"]
-    pwr_net_name = data.pwr_net_name
-    cap_finder = data.cap_finder
-    cap_layer_top = data.cap_layer_top if data.cap_layer_top else None
-    reduce_num_top = int(data.reduce_num_top) if data.reduce_num_top else None
-    cap_layer_bot = data.cap_layer_bot if data.cap_layer_bot else None
-    reduce_num_bot = int(data.reduce_num_bot) if data.reduce_num_bot else None
-    socket_mode = data.socket_mode if data.socket_mode else None
-    ref_z = float(data.ref_z) if data.ref_z else None
-    boxes_fname = data.boxes_fname if data.boxes_fname else None
-    sinks_layer = data.sinks_layer if data.sinks_layer else None
-    sinks_num_ports = data.sinks_num_ports if data.sinks_num_ports else None
-    sinks_area = data.sinks_area if data.sinks_area else None
-    from_db_side = data.from_db_side if data.from_db_side else None
-    skt_num_ports = int(data.skt_num_ports) if data.skt_num_ports else None
-    brd_fname = data.brd_fname if data.brd_fname else None
-
-    package_response = ports.setup_pkg_ports(
-        filename, sinks_mode, pwr_net_name, cap_finder, cap_layer_top, reduce_num_top,
-        cap_layer_bot, reduce_num_bot, socket_mode, ref_z, sinks_layer, sinks_num_ports,
-        sinks_area, from_db_side, skt_num_ports, brd_fname)
-
-    return JSONResponse(content=package_response)
+async def package(data: PackageData, request: Request, background: bool = False):
+    def run(job):
+        filename = data.spd_filename
+        #ports = api.PortHandler(all_queues[filename])
+        sinks_mode = data.sinks_mode if data.sinks_mode else None
+        ports_fname = data.ports_fname
+        #pwr_net_name = ["P1V1_L", "P3V3_E"]
+        pwr_net_name = data.pwr_net_name
+        cap_finder = data.cap_finder
+        cap_layer_top = data.cap_layer_top if data.cap_layer_top else None
+        reduce_num_top = int(data.reduce_num_top) if data.reduce_num_top else None
+        cap_layer_bot = data.cap_layer_bot if data.cap_layer_bot else None
+        reduce_num_bot = int(data.reduce_num_bot) if data.reduce_num_bot else None
+        socket_mode = data.socket_mode if data.socket_mode else None
+        ref_z = float(data.ref_z) if data.ref_z else None
+        boxes_fname = data.boxes_fname if data.boxes_fname else None
+        sinks_layer = data.sinks_layer if data.sinks_layer else None
+        sinks_num_ports = data.sinks_num_ports if data.sinks_num_ports else None
+        sinks_area = data.sinks_area if data.sinks_area else None
+        from_db_side = data.from_db_side if data.from_db_side else None
+        skt_num_ports = int(data.skt_num_ports) if data.skt_num_ports else None
+        brd_fname = data.brd_fname if data.brd_fname else None
+
+        with sessions.use(job.user, exclusive=True) as session:
+            package_response = session.ports.setup_pkg_ports(
+                filename, sinks_mode, pwr_net_name, cap_finder, cap_layer_top, reduce_num_top,
+                cap_layer_bot, reduce_num_bot, socket_mode, ref_z, sinks_layer, sinks_num_ports,
+                sinks_area, from_db_side, skt_num_ports, brd_fname)
+
+        return package_response
+
+    return await run_job(request, 'package', run, user=data.session_id, layouts=[data.spd_filename], background=background)
 
 
 @app.post("/auto-copy")
@@ -602,16 +859,19 @@ def rotate_copy(data: RotateCopyData):
     return JSONResponse(content=response)
 
 @app.post("/report")
-def report(data: ReportData):
-    report_fname = data.layout_fname.replace(Path(data.layout_fname).suffix, '_report.txt')
+async def report(data: ReportData, request: Request, background: bool = False):
+    def run(job):
+        report_fname = data.layout_fname.replace(Path(data.layout_fname).suffix, '_report.txt')
     
-    response = processed_Dbapi_object[data.layout_fname].report(
-                                                            data.nets,
-                                                            report_fname,
-                                                            data.cap_finder
-    )
+        response = processed_Dbapi_object[data.layout_fname].report(
+                                                                data.nets,
+                                                                report_fname,
+                                                                data.cap_finder
+        )
 
-    return JSONResponse(content=response)
+        return response
+
+    return await run_job(request, 'report', run, user=data.session_id, layouts=[data.layout_fname], background=background)
 
 @app.post("/auto-vrm-ports")
 def auto_vrm_ports(data: AutoVrmPortsData):
@@ -641,61 +901,75 @@ def transfer_socket_ports(data: TransferSocketPortsData):
     return JSONResponse(content=response)
 
 @app.post("/auto-socket-ports")
-def auto_socket_ports(data: AutoSocketPortsData):
-    db = data.spd_filename
-    #ports = api.PortHandler(all_queues[db])
-    num_ports = data.num_ports
-    side = data.side
-    ref_z = float(data.ref_z) if data.ref_z else None
+async def auto_socket_ports(data: AutoSocketPortsData, request: Request, background: bool = False):
+    def run(job):
+        db = data.spd_filename
+        #ports = api.PortHandler(all_queues[db])
+        num_ports = data.num_ports
+        side = data.side
+        ref_z = float(data.ref_z) if data.ref_z else None
 
-    response = ports.auto_socket_ports(api.loaded_layouts[db].db, num_ports, side, ref_z)
-    return JSONResponse(content=response)
+        with sessions.use(job.user, exclusive=True) as session:
+            response = session.ports.auto_socket_ports(api.loaded_layouts[db], num_ports, side, ref_z)
+        return response
+
+    return await run_job(request, 'auto-socket-ports', run, user=data.session_id, layouts=[data.spd_filename], background=background)
 
 @app.post("/get-port-info")
-def get_port_info(data: GetPortInfoData):
+def get_port_info(data: GetPortInfoData, request: Request):
     data.csv_fname = prepend_path(data.layout_fname, data.csv_fname)
-    response = sd.ports.get_port_info(data.layout_fname, data.csv_fname)
+    with session_ports(request, data.layout_fname, session_id=data.session_id) as ports:
+        response = ports.get_port_info(data.layout_fname, data.csv_fname, as_frame=True)
 
-    return JSONResponse(content=response)
+    return table_response(request, response, data.offset, data.limit)
 
 @app.post("/modify-port-info")
-def modify_port_info(data: ModifyPortInfo):
+def modify_port_info(data: ModifyPortInfo, request: Request):
     data.csv_fname = prepend_path(data.layout_fname, data.csv_fname)
-    response = sd.ports.modify_port_info(data.layout_fname, data.csv_fname,
-                                        data.port_info)
+    with session_ports(request, data.layout_fname, session_id=data.session_id) as ports:
+        response = ports.modify_port_info(data.layout_fname, data.csv_fname,
+                                          data.port_info)
 
 @app.post("/get-sink-info")
-def get_sink_info(data: SinksVrmsLdosInfo):
+def get_sink_info(data: SinksVrmsLdosInfo, request: Request):
     data.csv_fname = prepend_path(data.layout_fname, data.csv_fname)
-    response = sd.ports.get_sinks_vrms_ldos_info(data.layout_fname, 'sink', data.csv_fname)
+    with session_ports(request, data.layout_fname, session_id=data.session_id) as ports:
+        response = ports.get_sinks_vrms_ldos_info(data.layout_fname, 'sink', data.csv_fname,
+                                                  as_frame=True)
     
-    return JSONResponse(content=response)
+    return table_response(request, response, data.offset, data.limit)
 
 @app.post("/get-vrm-info")
-def get_vrm_info(data: SinksVrmsLdosInfo):
+def get_vrm_info(data: SinksVrmsLdosInfo, request: Request):
     data.csv_fname = prepend_path(data.layout_fname, data.csv_fname)
-    response = sd.ports.get_sinks_vrms_ldos_info(data.layout_fname, 'vrm', data.csv_fname)
+    with session_ports(request, data.layout_fname, session_id=data.session_id) as ports:
+        response = ports.get_sinks_vrms_ldos_info(data.layout_fname, 'vrm', data.csv_fname,
+                                                  as_frame=True)
     
-    return JSONResponse(content=response)
+    return table_response(request, response, data.offset, data.limit)
 
 @app.post("/get-ldo-info")
-def get_ldo_info(data: SinksVrmsLdosInfo):
+def get_ldo_info(data: SinksVrmsLdosInfo, request: Request):
     data.csv_fname = prepend_path(data.layout_fname, data.csv_fname)
-    response = sd.ports.get_sinks_vrms_ldos_info(data.layout_fname, 'ldo', data.csv_fname)
+    with session_ports(request, data.layout_fname, session_id=data.session_id) as ports:
+        response = ports.get_sinks_vrms_ldos_info(data.layout_fname, 'ldo', data.csv_fname,
+                                                  as_frame=True)
     
-    return JSONResponse(content=response)
+    return table_response(request, response, data.offset, data.limit)
 
 @app.post("/modify-sink-info")
-def modify_sink_info(data: ModifySinkInfo):
+def modify_sink_info(data: ModifySinkInfo, request: Request):
     data.csv_fname = prepend_path(data.layout_fname, data.csv_fname)
-    response = sd.ports.modify_sink_info(data.layout_fname, data.csv_fname,
-                                        data.sink_info)
+    with session_ports(request, data.layout_fname, session_id=data.session_id) as ports:
+        response = ports.modify_sink_info(data.layout_fname, data.csv_fname,
+                                          data.sink_info)
 
 @app.post("/modify-vrm-info")
-def modify_vrm_info(data: ModifyVrmInfo):
+def modify_vrm_info(data: ModifyVrmInfo, request: Request):
     data.csv_fname = prepend_path(data.layout_fname, data.csv_fname)
-    response = sd.ports.modify_vrm_info(data.layout_fname, data.csv_fname,
-                                        data.vrm_info)
+    with session_ports(request, data.layout_fname, session_id=data.session_id) as ports:
+        response = ports.modify_vrm_info(data.layout_fname, data.csv_fname,
+                                         data.vrm_info)
 
 @app.post("/auto-ports")
 def auto_ports(data: AutoPortsInfo):
@@ -758,7 +1032,32 @@ def get_ip_list():
 @app.post("/servers-info")
 async def root(servers: ServerInfo):
     lib_mgr = lib.LibManager()
+    # Answered from the readings polled in the background, the readings
+    # sent by the client are only scored until the first poll is done
+    telemetry = lib.LibManager.telemetry
+    if telemetry is not None and telemetry.has_readings():
+        return JSONResponse(content=lib_mgr.servers_info())
     return JSONResponse(content=lib_mgr.score_servers(servers.info))
 
+@app.get("/servers-telemetry")
+def servers_telemetry():
+    telemetry = lib.LibManager.telemetry
+    return JSONResponse(content=[] if telemetry is None else telemetry.status())
+
+@app.on_event("startup")
+def start_telemetry():
+    # Only the front-end server polls the simulation servers, which
+    # run this backend too
+    if not cfg.SERVER_TELEMETRY:
+        return
+    try:
+        lib.LibManager().start_telemetry()
+    except OSError as e:
+        print(f'Servers are not polled: {e}')
+
+@app.on_event("shutdown")
+def stop_telemetry():
+    lib.LibManager().stop_telemetry()
+
 
 if __name__ == "__main__": uvicorn.run(app, host="0.0.0.0", port=8000)
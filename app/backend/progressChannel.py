@@ -0,0 +1,66 @@
+import asyncio
+
+
+class ProgressChannel:
+    '''Delivers the progress messages of worker threads to an asyncio
+    consumer. Producers use it like a :class:`queue.Queue`, e.g. the
+    Database logger calls put(), and each message wakes the consumer
+    immediately through the event loop.
+    '''
+
+    def __init__(self, loop=None, maxsize=10000):
+        '''Initialization of the :class:`ProgressChannel()` class. Must be
+        created in the event loop thread when loop is not given.
+
+        :param loop: Event loop of the consumer, defaults to None
+        :type loop: asyncio.AbstractEventLoop, optional
+        :param maxsize: Maximum number of undelivered messages. The oldest
+        messages are dropped when a slow consumer falls behind, defaults to 10000
+        :type maxsize: int, optional
+        '''
+
+        self.loop = asyncio.get_running_loop() if loop is None else loop
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, message, block=True, timeout=None):
+        '''Send a message from any thread. Messages sent after the
+        channel is closed are discarded.
+
+        :param message: Progress message
+        :type message: str
+        '''
+
+        if self.closed:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The event loop is closed
+            self.closed = True
+
+    def put_nowait(self, message):
+
+        self.put(message)
+
+    def _put(self, message):
+
+        if self.closed:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        '''Wait for the next message.
+
+        :rtype: str
+        '''
+
+        return await self.queue.get()
+
+    def close(self):
+
+        self.closed = True
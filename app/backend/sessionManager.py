@@ -0,0 +1,206 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from fastapi import Request, HTTPException
+
+from thinkpi import logger
+
+
+def request_session_id(request: Request, session_id=None):
+    '''Session id of a request, given in the request data or in the
+    x-session-id header. The client address is never used, the users
+    behind the same host would share their session.
+
+    :param request: Request
+    :type request: :class:`fastapi.Request()`
+    :param session_id: Session id given in the request data, defaults to None
+    :type session_id: str, optional
+    :raises HTTPException: 400 if the request has no session id
+    :rtype: str
+    '''
+
+    session_id = session_id or request.headers.get('x-session-id')
+    if not session_id:
+        raise HTTPException(status_code=400,
+                            detail='A session id is required, as session_id or in the x-session-id header')
+
+    return session_id
+
+
+class Session:
+    '''State of a client session: its own port handler, with its port
+    report, and the progress channel of its websocket.
+    '''
+
+    def __init__(self, session_id, handler):
+
+        self.id = session_id
+        self.ports = handler
+        self.channel = None
+        # The handler is used by one request or job of the session at a time
+        self.lock = threading.RLock()
+        self.busy = 0
+        self.created = self.last_used = time.monotonic()
+
+    def touch(self):
+
+        self.last_used = time.monotonic()
+
+    def info(self):
+
+        return {'session_id': self.id, 'connected': self.channel is not None,
+                'busy': self.busy, 'idle': round(time.monotonic() - self.last_used, 1),
+                'age': round(time.monotonic() - self.created, 1)}
+
+
+class SessionManager:
+    '''Sessions of the backend clients, by session id.
+
+    Each session gets its own port handler, so concurrent users do not
+    share port reports. The progress messages logged while a session is
+    used, i.e. in :meth:`use`, are sent to the websocket channel of this
+    session only. Layouts stay shared by all the sessions in the layout
+    cache. Sessions without websocket and not used for idle_timeout
+    seconds are dropped.
+    '''
+
+    format = "[{time:MM-DD-YYYY HH:mm:ss}] [{level}] [{function}] {message}"
+
+    def __init__(self, handler_factory, idle_timeout=3600):
+        '''Initialization of the :class:`SessionManager()` class
+
+        :param handler_factory: Creates the port handler of a session,
+        called with its progress queue
+        :type handler_factory: callable
+        :param idle_timeout: Seconds after which an idle session
+        is dropped, defaults to 3600
+        :type idle_timeout: float, optional
+        '''
+
+        self.handler_factory = handler_factory
+        self.idle_timeout = idle_timeout
+        self.lock = threading.RLock()
+        self.sessions = {}
+        # One sink sends the messages to the session logging them
+        self.sink_id = logger.add(self._dispatch, format=self.format, level='DEBUG',
+                                  filter=lambda record: 'session' in record['extra'])
+
+    def _dispatch(self, message):
+
+        session = self.sessions.get(message.record['extra']['session'])
+        channel = None if session is None else session.channel
+        if channel is not None:
+            channel.put(message)
+
+    def get(self, session_id):
+        '''Get a session, created if it does not exist.
+
+        :param session_id: Session id
+        :type session_id: str
+        :rtype: :class:`Session()`
+        '''
+
+        with self.lock:
+            self.expire()
+            session = self.sessions.get(session_id)
+            if session is None:
+                # Messages are routed by the sessions, not by the handler queue
+                session = self.sessions[session_id] = Session(session_id,
+                                                              self.handler_factory(None))
+            session.touch()
+
+            return session
+
+    @contextmanager
+    def use(self, session_id, exclusive=False):
+        '''Use a session, e.g. in a request or a job. The messages logged
+        meanwhile are sent to the session, and it does not expire.
+
+        :param session_id: Session id
+        :type session_id: str
+        :param exclusive: Wait for the other exclusive uses of the session
+        to finish, e.g. to use its port handler, defaults to False
+        :type exclusive: bool, optional
+        '''
+
+        with self.lock:
+            session = self.get(session_id)
+            session.busy += 1
+        try:
+            if exclusive:
+                session.lock.acquire()
+            try:
+                with logger.contextualize(session=session_id):
+                    yield session
+            finally:
+                if exclusive:
+                    session.lock.release()
+        finally:
+            with self.lock:
+                session.busy -= 1
+                session.touch()
+
+    def attach(self, session_id, channel):
+        '''Send the progress messages of a session to a channel, e.g. the
+        websocket of the session. Replaces the previous channel.
+
+        :param session_id: Session id
+        :type session_id: str
+        :param channel: Progress channel, with a put() method
+        :type channel: :class:`ProgressChannel()`
+        :rtype: :class:`Session()`
+        '''
+
+        with self.lock:
+            session = self.get(session_id)
+            session.channel = channel
+
+            return session
+
+    def detach(self, session_id, channel):
+        '''Stop sending the progress messages of a session to a channel,
+        unless another channel replaced it.
+
+        :param session_id: Session id
+        :type session_id: str
+        :param channel: Progress channel
+        :type channel: :class:`ProgressChannel()`
+        '''
+
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None and session.channel is channel:
+                session.channel = None
+                session.touch()
+
+    def expire(self):
+        '''Drop the sessions idle for more than idle_timeout seconds.
+
+        :return: Ids of the dropped sessions
+        :rtype: list[str]
+        '''
+
+        now = time.monotonic()
+        with self.lock:
+            expired = [session_id for session_id, session in self.sessions.items()
+                       if session.channel is None and not session.busy
+                       and now - session.last_used > self.idle_timeout]
+            for session_id in expired:
+                del self.sessions[session_id]
+                logger.info(f'Session {session_id} expired')
+
+        return expired
+
+    def list(self):
+
+        with self.lock:
+            self.expire()
+            return [session.info() for session in self.sessions.values()]
+
+    def close(self):
+
+        try:
+            logger.remove(self.sink_id)
+        except ValueError:
+            pass
@@ -4,4 +4,5 @@ class ApplyPadstackData(BaseModel):
   spd_fname: str
   padstack_fname: str
   material_fname: str | None = None
+  session_id: str | None = None
 
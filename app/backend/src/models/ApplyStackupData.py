@@ -4,4 +4,5 @@ class ApplyStackupData(BaseModel):
   spd_fname: str
   stackup_fname: str
   material_fname: str | None = None
+  session_id: str | None = None
 
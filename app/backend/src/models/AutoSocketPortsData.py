@@ -4,4 +4,5 @@ class AutoSocketPortsData(BaseModel):
   spd_filename: str
   num_ports: str
   side: str
-  ref_z: str
\ No newline at end of file
+  ref_z: str
+  session_id: str | None = None
@@ -14,3 +14,4 @@ class AutoStackupData(BaseModel):
   metal_material: str = None
   core_material: str = None
   fillin_dielec_material: str = None
+  session_id: str | None = None
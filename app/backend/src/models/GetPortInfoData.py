@@ -3,3 +3,6 @@ from pydantic import BaseModel
 class GetPortInfoData(BaseModel):
   layout_fname: str
   csv_fname: str | None = None
+  offset: int = 0
+  limit: int | None = None
+  session_id: str | None = None
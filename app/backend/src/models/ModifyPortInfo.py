@@ -4,3 +4,4 @@ class ModifyPortInfo(BaseModel):
   layout_fname: str
   csv_fname: str
   port_info: dict
+  session_id: str | None = None
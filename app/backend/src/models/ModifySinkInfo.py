@@ -4,3 +4,4 @@ class ModifySinkInfo(BaseModel):
   layout_fname: str
   csv_fname: str
   sink_info: dict
+  session_id: str | None = None
@@ -3,4 +3,5 @@ from pydantic import BaseModel
 class ModifyVrmInfo(BaseModel):
   layout_fname: str
   csv_fname: str
-  vrm_info: dict
\ No newline at end of file
+  vrm_info: dict
+  session_id: str | None = None
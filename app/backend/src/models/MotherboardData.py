@@ -15,3 +15,4 @@ class MotherboardData(BaseModel):
   skt_num_ports: int
   pkg_fname: str
   ref_z: float
+  session_id: str | None = None
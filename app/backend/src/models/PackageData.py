@@ -19,5 +19,5 @@ class PackageData(BaseModel):
   from_db_side: str
   skt_num_ports: str
   brd_fname: str
-
+  session_id: str | None = None
 
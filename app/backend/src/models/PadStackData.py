@@ -13,3 +13,4 @@ class PadStackData(BaseModel):
   pkg_gnd_plating: float | None = None
   pkg_pwr_plating: float | None = None
   outer_coating_material: str | None = None
+  session_id: str | None = None
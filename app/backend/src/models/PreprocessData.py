@@ -11,3 +11,4 @@ class PreprocessData(BaseModel):
   cut_margin: float = 0
   post_processed_fname: str | None = None
   delete_unused_nets: bool = False
+  session_id: str | None = None
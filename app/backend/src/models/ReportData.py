@@ -4,3 +4,4 @@ class ReportData(BaseModel):
   layout_fname: str
   cap_finder: str
   nets: list
+  session_id: str | None = None
@@ -0,0 +1,11 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+class TreeQuery(BaseModel):
+  path: Optional[str] = None
+  depth: int = 1
+  offset: int = 0
+  limit: Optional[int] = None
+  file_types: Optional[List[str]] = None
+  dirs_only: bool = False
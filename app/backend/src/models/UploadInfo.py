@@ -0,0 +1,8 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+class UploadInfo(BaseModel):
+  filename: str
+  size: int
+  sha256: Optional[str] = None
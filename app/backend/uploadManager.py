@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+
+
+class UploadError(Exception):
+    '''Raised when an upload request cannot be fulfilled.'''
+
+    def __init__(self, message, status_code=400):
+
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadManager:
+    '''Stores uploaded files in a folder, with chunked and resumable uploads.
+
+    An upload is created with the name, size and optionally the SHA-256 of
+    the file. Its chunks are written at their offset in a partial file, so
+    an interrupted upload resumes from the received size, also after the
+    server restarts. Completed files are checked against their hash and
+    moved in place atomically. A file already stored with the same content
+    is not stored again, the existing copy is returned instead. A file with
+    the name of a different stored file is renamed.
+    '''
+
+    def __init__(self, root='upload', max_size=8e9, chunk_size=8*2**20, keep_time=24*3600):
+        '''Initialization of the :class:`UploadManager()` class
+
+        :param root: Folder of the uploaded files, defaults to 'upload'
+        :type root: str, optional
+        :param max_size: Maximum file size in bytes, defaults to 8e9
+        :type max_size: float, optional
+        :param chunk_size: Chunk size in bytes suggested to the clients, defaults to 8 MB
+        :type chunk_size: int, optional
+        :param keep_time: Time in seconds unfinished uploads are kept, defaults to 24 hours
+        :type keep_time: float, optional
+        '''
+
+        self.root = Path(root)
+        self.partial = self.root / '.partial'
+        self.partial.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / '.index.json'
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.keep_time = keep_time
+        self.lock = threading.RLock()
+        # Running hash of the uploads received in order, by upload id
+        self.hashers = {}
+
+    @staticmethod
+    def file_hash(fpath, block_size=2**20):
+
+        hasher = hashlib.sha256()
+        with open(fpath, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                hasher.update(block)
+
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _fsync_dir(path):
+
+        # Makes a rename durable, not supported on Windows
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _load_index(self):
+
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+
+        tmp_path = self.index_path.with_name(f'{self.index_path.name}.{uuid.uuid4().hex}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def find(self, sha256):
+        '''Find a stored file by its content hash.
+
+        :param sha256: SHA-256 of the file content
+        :type sha256: str
+        :return: File name, or None if no stored file has this content
+        :rtype: str
+        '''
+
+        with self.lock:
+            index = self._load_index()
+            entry = index.get(sha256.lower())
+            if entry is None:
+                return None
+            try:
+                stat = (self.root / entry['name']).stat()
+            except OSError:
+                stat = None
+            # The file was deleted or modified since it was stored
+            if stat is None or stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime']:
+                del index[sha256.lower()]
+                self._save_index(index)
+                return None
+
+            return entry['name']
+
+    def _meta_path(self, upload_id):
+
+        return self.partial / f'{upload_id}.json'
+
+    def _part_path(self, upload_id):
+
+        return self.partial / f'{upload_id}.part'
+
+    def _meta(self, upload_id):
+
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError(f'Upload {upload_id} not found', 404)
+
+    def _purge(self):
+
+        now = time.time()
+        for meta_path in self.partial.glob('*.json'):
+            try:
+                expired = now - meta_path.stat().st_mtime > self.keep_time
+            except OSError:
+                continue
+            if expired:
+                self._remove(meta_path.stem)
+
+    def _remove(self, upload_id):
+
+        self.hashers.pop(upload_id, None)
+        for fpath in (self._part_path(upload_id), self._meta_path(upload_id)):
+            try:
+                fpath.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _stored(self, name, sha256, size):
+
+        return {'upload_id': None, 'file_name': name, 'path': str((self.root / name).resolve()),
+                'sha256': sha256, 'size': size, 'received': size,
+                'duplicate': True, 'complete': True}
+
+    def create(self, filename, size, sha256=None):
+        '''Start an upload, or resume the unfinished upload of the same file.
+
+        :param filename: File name
+        :type filename: str
+        :param size: File size in bytes
+        :type size: int
+        :param sha256: SHA-256 of the file content. If given, a file already
+        stored with this content is returned instead, defaults to None
+        :type sha256: str, optional
+        :raises UploadError: Invalid file name or size
+        :return: Upload status, see :meth:`status`
+        :rtype: dict
+        '''
+
+        name = Path(filename.replace('\\', '/')).name
+        if name in ('', '.', '..') or name.startswith('.'):
+            raise UploadError(f'Invalid file name {filename}')
+        if size < 0:
+            raise UploadError(f'Invalid file size {size}')
+        if size > self.max_size:
+            raise UploadError(f'{name} is larger than {self.max_size/1e9:.1f} GB', 413)
+
+        with self.lock:
+            self._purge()
+            if sha256 is not None:
+                sha256 = sha256.lower()
+                existing = self.find(sha256)
+                if existing is not None:
+                    return self._stored(existing, sha256, size)
+                # The same file is uploaded again with the same id, so it resumes
+                upload_id = hashlib.sha256(f'{name}:{size}:{sha256}'.encode()).hexdigest()[:32]
+            else:
+                upload_id = uuid.uuid4().hex
+            if not self._meta_path(upload_id).exists():
+                with open(self._meta_path(upload_id), 'w') as f:
+                    json.dump({'file_name': name, 'size': size, 'sha256': sha256,
+                               'created': time.time()}, f)
+                self._part_path(upload_id).touch()
+
+            return self.status(upload_id)
+
+    def status(self, upload_id):
+        '''Status of an upload.
+
+        :param upload_id: Upload id
+        :type upload_id: str
+        :raises UploadError: The upload does not exist
+        :return: Upload id, file name, size, received size, hash and the
+        suggested chunk size
+        :rtype: dict
+        '''
+
+        meta = self._meta(upload_id)
+        try:
+            received = self._part_path(upload_id).stat().st_size
+        except OSError:
+            received = 0
+
+        return {'upload_id': upload_id, 'file_name': meta['file_name'], 'size': meta['size'],
+                'received': received, 'sha256': meta['sha256'],
+                'chunk_size': self.chunk_size, 'duplicate': False, 'complete': False}
+
+    def write(self, upload_id, offset, data):
+        '''Write a chunk of an upload. Chunks are sent in order, a chunk may
+        be sent again from any offset already received, e.g. after a failure.
+
+        :param upload_id: Upload id
+        :type upload_id: str
+        :param offset: Offset of the chunk in the file
+        :type offset: int
+        :param data: Chunk content
+        :type data: bytes
+        :raises UploadError: The upload does not exist, the offset is past
+        the received size, or the chunk ends past the file size
+        :return: Upload status, see :meth:`status`
+        :rtype: dict
+        '''
+
+        with self.lock:
+            meta = self._meta(upload_id)
+            part_path = self._part_path(upload_id)
+            received = part_path.stat().st_size
+            if not 0 <= offset <= received:
+                raise UploadError(f'Chunk offset {offset} does not follow the '
+                                  f'{received} bytes received', 409)
+            if offset + len(data) > meta['size']:
+                raise UploadError(f'Chunk ends past the {meta["size"]} bytes of the file', 413)
+            with open(part_path, 'r+b') as f:
+                f.seek(offset)
+                f.write(data)
+                f.truncate()
+
+            hasher, hashed = self.hashers.get(upload_id, (None, None))
+            if hasher is None and offset == 0:
+                hasher, hashed = hashlib.sha256(), 0
+            if hasher is not None and hashed == offset:
+                hasher.update(data)
+                self.hashers[upload_id] = (hasher, offset + len(data))
+            else:
+                # Hashed again from the file when the upload completes
+                self.hashers.pop(upload_id, None)
+            os.utime(self._meta_path(upload_id))
+
+            return self.status(upload_id)
+
+    def complete(self, upload_id):
+        '''Finish an upload: check its size and hash and move the file in place.
+
+        :param upload_id: Upload id
+        :type upload_id: str
+        :raises UploadError: The upload does not exist, is not fully
+        received, or its content does not match its hash
+        :return: Stored file name, path, hash and size, and whether the
+        file was already stored
+        :rtype: dict
+        '''
+
+        with self.lock:
+            meta = self._meta(upload_id)
+            part_path = self._part_path(upload_id)
+            received = part_path.stat().st_size
+            if received != meta['size']:
+                raise UploadError(f'Only {received} of {meta["size"]} bytes received', 409)
+            hasher, hashed = self.hashers.pop(upload_id, (None, None))
+            digest = hasher.hexdigest() if hashed == received else self.file_hash(part_path)
+            if meta['sha256'] is not None and digest != meta['sha256']:
+                self._remove(upload_id)
+                raise UploadError(f'{meta["file_name"]} does not match its SHA-256, upload it again', 422)
+
+            return self._store(upload_id, meta['file_name'], digest)
+
+    def _store(self, upload_id, name, digest):
+
+        part_path = self._part_path(upload_id)
+        existing = self.find(digest)
+        if existing is not None:
+            size = part_path.stat().st_size
+            self._remove(upload_id)
+            return self._stored(existing, digest, size)
+
+        target = self.root / name
+        num = 1
+        while target.exists():
+            target = self.root / f'{Path(name).stem}_{num}{Path(name).suffix}'
+            num += 1
+        with open(part_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(part_path, target)
+        self._fsync_dir(self.root)
+        self._remove(upload_id)
+
+        stat = target.stat()
+        index = self._load_index()
+        index[digest] = {'name': target.name, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        self._save_index(index)
+
+        return {'upload_id': upload_id, 'file_name': target.name, 'path': str(target.resolve()),
+                'sha256': digest, 'size': stat.st_size, 'received': stat.st_size,
+                'duplicate': False, 'complete': True}
+
+    def save(self, filename, fileobj):
+        '''Store a whole file read from a file object, e.g. a form upload.
+
+        :param filename: File name
+        :type filename: str
+        :param fileobj: Binary file object
+        :type fileobj: file
+        :raises UploadError: Invalid file name or the file is too large
+        :return: Stored file, see :meth:`complete`
+        :rtype: dict
+        '''
+
+        upload = self.create(filename, 0)
+        upload_id = upload['upload_id']
+        hasher, size = hashlib.sha256(), 0
+        try:
+            with open(self._part_path(upload_id), 'wb') as f:
+                for block in iter(lambda: fileobj.read(self.chunk_size), b''):
+                    size += len(block)
+                    if size > self.max_size:
+                        raise UploadError(f'{upload["file_name"]} is larger than '
+                                          f'{self.max_size/1e9:.1f} GB', 413)
+                    hasher.update(block)
+                    f.write(block)
+            with self.lock:
+                return self._store(upload_id, upload['file_name'], hasher.hexdigest())
+        except BaseException:
+            with self.lock:
+                self._remove(upload_id)
+            raise
+
+    def cancel(self, upload_id):
+        '''Cancel an upload and delete the received data.
+
+        :param upload_id: Upload id
+        :type upload_id: str
+        :raises UploadError: The upload does not exist
+        '''
+
+        with self.lock:
+            self._meta(upload_id)
+            self._remove(upload_id)
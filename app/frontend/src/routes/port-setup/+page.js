@@ -1,6 +1,7 @@
 import { get } from 'svelte/store';
 import {
 	selectedServerInfoStore,
+	sessionId,
 	activeLayoutStore,
 	portsFileStore
 } from '../../store/stores.js';
@@ -12,6 +13,7 @@ export const load = async ({ fetch }) => {
     const response = await fetch(`http://${serverInfo.ip_address}:${serverInfo.port}/get-port-info`, {
         method: 'POST',
         body: JSON.stringify({
+            session_id: get(sessionId),
             layout_fname: get(activeLayoutStore),
             csv_fname: portsFileName === '' ? null : portsFileName
         }),
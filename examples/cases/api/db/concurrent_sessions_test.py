@@ -0,0 +1,104 @@
+import sys
+import time
+import queue
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import uvicorn
+from fastapi import FastAPI, Request
+
+sys.path.append(str(Path(__file__).parents[4] / 'app' / 'backend'))
+from sessionManager import SessionManager, request_session_id
+
+from thinkpi import logger
+
+
+class ReportHandler:
+    # Stands for api.PortHandler, keeps a report across the calls of a session
+
+    def __init__(self, queue):
+
+        self.port_report = []
+
+    def add_ports(self, layout_fname):
+
+        logger.info(f'Adding ports to {layout_fname}')
+        time.sleep(0.05)
+        self.port_report.append(layout_fname)
+        return list(self.port_report)
+
+
+app = FastAPI()
+sessions = SessionManager(ReportHandler, idle_timeout=1)
+
+@app.post("/add-ports")
+def add_ports(layout_fname: str, request: Request, session_id: str | None = None):
+    # Same session resolution as the backend: header or session_id, never the client address
+    with sessions.use(request_session_id(request, session_id), exclusive=True) as session:
+        return session.ports.add_ports(layout_fname)
+
+@app.get("/sessions")
+def list_sessions():
+    return sessions.list()
+
+
+def client(port, session_id, num_calls, use_header=True):
+    # Calls of one user, the report must only list its own layouts. The
+    # session is sent in the header, or as session_id like the frontend does
+
+    with requests.Session() as http:
+        for idx in range(num_calls):
+            params = {'layout_fname': f'{session_id}_{idx}.spd'}
+            if use_header:
+                headers = {'x-session-id': session_id}
+            else:
+                headers = {}
+                params['session_id'] = session_id
+            report = http.post(f'http://127.0.0.1:{port}/add-ports',
+                               params=params, headers=headers).json()
+    return report
+
+
+if __name__ == '__main__':
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=8765, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.1)
+
+    # The websockets of the sessions are replaced by queues
+    users = ['alice', 'bob', 'carol']
+    channels = {user: queue.Queue() for user in users}
+    for user, channel in channels.items():
+        sessions.attach(user, channel)
+
+    with ThreadPoolExecutor(len(users)) as pool:
+        reports = dict(zip(users, pool.map(client, [8765]*len(users), users, [10]*len(users))))
+
+    for user in users:
+        messages = list(channels[user].queue)
+        print(f'{user}: {len(reports[user])} layouts in the report, only its own: '
+              f'{all(fname.startswith(user) for fname in reports[user])}, '
+              f'{len(messages)} progress messages, only its own: '
+              f'{all(user in message for message in messages)}')
+
+    # Two clients on the same host without the header are kept apart by their session_id
+    with ThreadPoolExecutor(2) as pool:
+        same_host = dict(zip(['dave', 'erin'], pool.map(client, [8765]*2, ['dave', 'erin'],
+                                                        [5]*2, [False]*2)))
+    for user, report in same_host.items():
+        print(f'{user} (same host, no header): {len(report)} layouts in the report, only its own: '
+              f'{all(fname.startswith(user) for fname in report)}')
+
+    # Requests without a session are rejected, not grouped by client address
+    response = requests.post('http://127.0.0.1:8765/add-ports', params={'layout_fname': 'anon.spd'})
+    print(f'Request without a session: {response.status_code} {response.json()}')
+
+    # Sessions without websocket expire after being idle
+    for user, channel in channels.items():
+        sessions.detach(user, channel)
+    time.sleep(1.5)
+    print(f"Sessions after 1.5 s idle: {requests.get('http://127.0.0.1:8765/sessions').json()}")
+
+    server.should_exit = True
@@ -0,0 +1,32 @@
+import queue
+
+from thinkpi.backend_api import api
+from thinkpi.backend_api.layer_geometry import decode_tile
+
+que = queue.Queue()
+
+
+if __name__ == '__main__':
+
+    db_api = api.DbApi(r'..\thinkpi_test_db\DNH\brd_DPS_pk187_080421.spd', que)
+    db_api.load_data()
+    layer = db_api.db.layer_names(verbose=False)[0]
+
+    info = db_api.layer_tile_info(layer)
+    print(f"Layer {layer}: {info['max_level'] + 1} levels, bounds {info['bounds']}")
+
+    # The whole layer in one tile, then one tile of the deepest level
+    for level, x, y in [(0, 0, 0), (info['max_level'], 0, 0)]:
+        data, tag = db_api.layer_tile(layer, level, x, y)
+        tile = decode_tile(data)
+        print(f'Tile {level}/{x}/{y}: {len(data)} bytes, {len(tile["poly_color"])} polygons, '
+              f'{len(tile["circle_color"])} circles, tag {tag}')
+
+    # Served from the cache, with the same tag
+    data, tag = db_api.layer_tile(layer, 0, 0, 0)
+    assert db_api.layer_tile(layer, 0, 0, 0) == (data, tag)
+    print(api.layer_tiles.stats())
+
+    # A modified layout gets new tags
+    api.layer_tiles.invalidate(db_api.db)
+    assert db_api.layer_tile(layer, 0, 0, 0)[1] != tag
@@ -0,0 +1,59 @@
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from thinkpi.backend_api import lib
+
+
+def fake_server(host_name, cpu_per, delay=0):
+    # Answers /get-server-info like a simulation server, after a delay
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            time.sleep(delay)
+            body = json.dumps({'host_name': host_name, 'cpu_per': cpu_per,
+                               'used_memory_per': 40, 'total_memory_GB': 256,
+                               'num_cpus': 32, 'users': [], 'num_users': 0}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except BrokenPipeError: # The client timed out
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'127.0.0.1:{server.server_port}'
+
+
+if __name__ == '__main__':
+    servers = {fake_server('idle', 5): 'idle',
+               fake_server('busy', 90): 'busy',
+               fake_server('slow', 10, delay=3): 'slow',
+               '127.0.0.1:9': 'dead'}
+
+    lib_mgr = lib.LibManager()
+    telemetry = lib_mgr.start_telemetry(servers, interval=2, timeout=1)
+
+    # Scores are answered from the cache, without waiting for the servers
+    time.sleep(1.5)
+    start = time.perf_counter()
+    scores = lib_mgr.servers_info()
+    print(f'Scored in {(time.perf_counter() - start)*1e3:.1f} ms')
+    for server in scores:
+        print(f"\t{server['host_name']}: {server['score']}")
+
+    # The dead and slow servers are polled less and less often
+    time.sleep(6)
+    for status in telemetry.status():
+        print(f"{status['host_name']}: {status['failures']} failures, "
+              f"next poll in {status['next_poll']:.1f} s, {len(status['history'])} readings")
+
+    lib_mgr.stop_telemetry()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+import numpy as np
+
+from thinkpi.flows import search
+
+# Locally simulated IDEM+HSPICE mean squared error. It has a narrow
+# optimum in bandwidth, prefers the lower reference impedance and
+# high orders, and fails to fit some of the small bandwidths.
+def simulated_mse(params):
+
+    rng = np.random.default_rng([int(params['bw']), int(params['refz']), params['order_max']])
+    if params['bw'] < 110e6 and params['order_max'] < 16:
+        return np.inf
+    bw_err = ((params['bw'] - 163e6)/20e6)**2
+    bw_err += 0.3*np.sin(params['bw']/4e6)**2
+    order_err = 0.5*(24 - params['order_max'])/8
+    refz_err = 0.3*np.log10(params['refz'])
+
+    return 1e-6*10**(bw_err + order_err + refz_err)*(1 + 0.05*rng.random())
+
+
+if __name__ == '__main__':
+    candidates = [{'bw': float(bw), 'refz': float(refz), 'order_max': order}
+                  for refz in [1, 10] for order in [16, 20, 24]
+                  for bw in np.linspace(100e6, 200e6, 100)]
+    target = min(simulated_mse(cand) for cand in candidates)*1.05
+    budget = len(candidates)//2
+
+    evals = {}
+    for name in ['grid', 'random', 'surrogate']:
+        evals[name] = []
+        for seed in range(5):
+            strategy = search.STRATEGIES[name](seed=seed)
+            history = search.run_search(strategy, candidates, simulated_mse,
+                                        workers=4, max_evals=budget, target=target)
+            evals[name].append(len(history) if history.best[1] <= target else np.nan)
+        print(f'{name}: evaluations to reach mse {target:.3e} -> {evals[name]}')
+
+    # An interrupted search resumes from the stored points
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        points_fname = os.path.join(tmp_dir, 'search_points.json')
+        strategy = search.SurrogateSearch(seed=0)
+        history = search.EvalHistory(points_fname, resume=False)
+        search.run_search(strategy, candidates, simulated_mse, workers=4,
+                          max_evals=10, history=history)
+        history = search.EvalHistory(points_fname)
+        history = search.run_search(strategy, candidates, simulated_mse, workers=4,
+                                    max_evals=budget, target=target, history=history)
+        print(f'Resumed search: {len(history)} evaluations, best mse {history.best[1]:.3e}')
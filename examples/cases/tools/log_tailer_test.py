@@ -0,0 +1,36 @@
+import os
+import time
+import tempfile
+from threading import Thread, Event
+
+from thinkpi.tools.sysutils import LogTailer
+
+
+def write_fake_log(fname, num_lines=50, fail=False):
+
+    with open(fname, 'wt') as f:
+        for line_num in range(num_lines):
+            f.write(f'INFO -- Extracting layer {line_num}\n')
+            f.flush()
+            time.sleep(0.02)
+        if fail:
+            f.write('ERROR -- Simulation failed\n')
+        else:
+            f.write('INFO -- sigrity::close document\n')
+
+
+if __name__ == '__main__':
+    path = tempfile.mkdtemp()
+    event = Event()
+    writer = Thread(target=write_fake_log, args=(os.path.join(path, 'fake_run.log'),))
+    tailer = LogTailer(path, 'fake_run*.log',
+                        newer_than=time.time() - 1,
+                        on_line=print,
+                        success='sigrity::close document',
+                        failure='ERROR')
+
+    writer.start()
+    # Stop as soon as the completion line is read
+    status = tailer.follow(event, stop_on_status=True)
+    writer.join()
+    print(f'Run succeeded: {status}, bytes read: {tailer.offset}')
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+from thinkpi.tools.hspice_deck import DeckFactory, DeckBuildState
+from thinkpi.tools.runjournal import RunJournal
+
+# Stands in for HSPICE: writes the .lis file and fails on decks containing FAIL
+FAKE_HSPICE = '''import sys, time
+deck, lis = sys.argv[sys.argv.index('-i') + 1], sys.argv[sys.argv.index('-o') + 1]
+text = open(deck).read()
+time.sleep(0.2)
+open(lis, 'w').write('fake hspice run of ' + deck)
+sys.exit(1 if 'FAIL' in text else 0)
+'''
+
+
+if __name__ == '__main__':
+    path = tempfile.mkdtemp()
+    tool = os.path.join(path, 'fake_hspice.py')
+    with open(tool, 'w') as f:
+        f.write(FAKE_HSPICE)
+    decks = []
+    for num in range(4):
+        decks.append(os.path.join(path, f'main_{num}.sp'))
+        with open(decks[-1], 'w') as f:
+            f.write(f'* deck {num}\n' + ('FAIL\n' if num == 2 else '') + '.end\n')
+
+    factory = DeckFactory()
+    factory.journal = RunJournal(os.path.join(path, 'journal.db'))
+    factory.batch = 'demo'
+    factory.state = DeckBuildState.MAIN_RUN
+    tool_cmd = f'"{sys.executable}" {tool}'
+
+    print(f'First session: {factory.run_main_files(tool_cmd, decks)} decks run')
+    # Only the failed deck runs again
+    print(f'Resumed session: {factory.run_main_files(tool_cmd, decks)} decks run')
+
+    # Fix the deck and retry the failed jobs only
+    with open(decks[2], 'w') as f:
+        f.write('* deck 2\n.end\n')
+    factory.retry_failed()
+
+    # A changed deck runs again even if it completed before
+    with open(decks[0], 'a') as f:
+        f.write('* changed\n')
+    print(f'Changed deck: {factory.run_main_files(tool_cmd, decks)} decks run')
+
+    # Jobs left running by a killed session are reported as interrupted
+    factory.journal.add('demo', 'MAIN_RUN', decks[3])
+    factory.journal.start('demo', 'MAIN_RUN', decks[3])
+    print(f"Interrupted jobs: {factory.journal.interrupt('demo')}")
+    factory.run_summary()
@@ -14,8 +14,12 @@ from thinkpi.flows import tasks
 from thinkpi.operations import pman as pm
 from thinkpi.config import thinkpi_conf as cfg
 from thinkpi import logger
+from thinkpi.backend_api.layout_cache import LayoutCache
+from thinkpi.backend_api.layer_geometry import LayerTileCache
 
-loaded_layouts = {}
+loaded_layouts = LayoutCache(cfg.LAYOUT_CACHE_MAX_MEMORY)
+layer_tiles = LayerTileCache(cfg.LAYER_TILE_CACHE_MAX_MEMORY, cfg.LAYER_TILE_PIXELS,
+                             cfg.LAYER_TILE_MAX_LEVEL)
 
 class DbApi:
     '''This class is responsible to provide all the required functionality APIs
@@ -31,6 +35,20 @@ class DbApi:
 
         self.db = spd.Database(db_path, queue)
 
+    @classmethod
+    def from_database(cls, db):
+        '''Create the APIs of an already loaded layout.
+
+        :param db: Loaded layout
+        :type db: :class:`speed.Database()`
+        :rtype: :class:`DbApi()`
+        '''
+
+        db_api = cls.__new__(cls)
+        db_api.db = db
+
+        return db_api
+
     def cdn(self):
         '''Current CDN source for Bokeh plots.
 
@@ -49,7 +67,16 @@ class DbApi:
 
         self.db.load_flags['plots'] = False
         self.db.load_data()
-        loaded_layouts[self.db.name] = self.db
+        loaded_layouts[LayoutCache.layout_path(self.db)] = self.db
+
+        return self.summary()
+
+    def summary(self):
+        '''Summary of the loaded layout.
+
+        :return: Layer names, the first layer html view and the net names by type
+        :rtype: dict[list, str, dict]
+        '''
         
         # Sort out net names by type
         nets_by_type = defaultdict(list)
@@ -86,6 +113,35 @@ class DbApi:
             if prev_doc:
                 prev_doc.remove_root(model)
         return html_layer
+
+    def layer_tile_info(self, layer_name):
+        '''Describe the geometry tiles of a layer: bounds, zoom levels,
+        color palette and kinds of primitives.
+
+        :param layer_name: Layer name
+        :type layer_name: str
+        :return: Layer geometry description
+        :rtype: dict
+        '''
+
+        return layer_tiles.geometry(self.db, layer_name).info()
+
+    def layer_tile(self, layer_name, level, x, y):
+        '''Binary geometry tile of a layer, see :mod:`layer_geometry` for its format.
+
+        :param layer_name: Layer name
+        :type layer_name: str
+        :param level: Zoom level
+        :type level: int
+        :param x: Tile column, from the left
+        :type x: int
+        :param y: Tile row, from the bottom
+        :type y: int
+        :return: Encoded tile and its tag
+        :rtype: tuple[bytes, str]
+        '''
+
+        return layer_tiles.tile(self.db, layer_name, level, x, y)
     
     def get_material(self, fname):
         '''Load material file.
@@ -339,6 +395,31 @@ class DbApi:
         return reports
 
 
+class DbApiCache:
+    ''':class:`DbApi()` objects of the layouts cached in loaded_layouts,
+    by layout file path. Layouts evicted from loaded_layouts or changed
+    on disk raise :class:`layout_cache.LayoutNotLoaded()`.
+    '''
+
+    def __getitem__(self, layout_fname):
+
+        return DbApi.from_database(loaded_layouts[layout_fname])
+
+    def __setitem__(self, layout_fname, db_api):
+
+        if loaded_layouts.get(layout_fname) is not db_api.db:
+            loaded_layouts[layout_fname] = db_api.db
+
+    def __contains__(self, layout_fname):
+
+        return layout_fname in loaded_layouts
+
+    def pop(self, layout_fname, default=None):
+
+        db = loaded_layouts.pop(layout_fname, None)
+        return default if db is None else DbApi.from_database(db)
+
+
 class DbHandler:
 
     def __init__(self):
@@ -361,8 +442,8 @@ class DbHandler:
         """        
 
         if isinstance(src_db, str):
-            if Path(src_db).name in loaded_layouts:
-                src = loaded_layouts[Path(src_db).name]
+            if src_db in loaded_layouts:
+                src = loaded_layouts[src_db]
             else:
                 src = spd.Database(src_db, self.queue)
                 if flags is None:
@@ -371,13 +452,13 @@ class DbHandler:
                     for flag_name, val in flags.items():
                         src.load_flags[flag_name] = val
                 src.load_data()
-                loaded_layouts[src.name] = src
+                loaded_layouts[src_db] = src
         else:
             src = src_db
 
         if dst_db is None:
             dst = None
-        elif isinstance(dst_db, str) and Path(dst_db).name not in loaded_layouts:
+        elif isinstance(dst_db, str) and dst_db not in loaded_layouts:
             dst = spd.Database(dst_db, self.queue)
             if flags is None:
                 dst.load_flags['plots'] = False
@@ -385,11 +466,17 @@ class DbHandler:
                 for flag_name, val in flags.items():
                     dst.load_flags[flag_name] = val
             dst.load_data()
-            loaded_layouts[dst.name] = dst
+            loaded_layouts[dst_db] = dst
         else:
             dst = dst_db
 
         return src, dst
+
+    @staticmethod
+    def _table(df, as_frame=False):
+
+        # Tables are serialized directly by the backend responses
+        return df if as_frame else df.to_dict(orient='list')
     
     def report_results(self, dst_ports, add_ports=True):
         """Generates layer plots with ports and report.
@@ -444,25 +531,29 @@ class PortHandler(DbHandler):
         self.queue = queue
         self.db_ops = DbApi()
     
-    def get_port_info(self, db, csv_fname=None):
+    def get_port_info(self, db, csv_fname=None, as_frame=False):
         """Provides layout port information.
 
         :param db: The name or object of layout to extract port information from
         :type db: str or :class:`speed.Database()`
         :param csv_fname: Name of the csv file with ports setup definition, defaults to None
         :type csv_fname: str, optional
+        :param as_frame: Return a DataFrame instead of a dictionary of columns,
+        defaults to False
+        :type as_frame: bool, optional
         :return: Existing port information
-        :rtype: dict
+        :rtype: dict or pandas.DataFrame
         """
 
         if csv_fname is not None:
-            return pd.read_csv(csv_fname).fillna('').to_dict(orient='list')
+            return self._table(pd.read_csv(csv_fname).fillna(''), as_frame)
         
         db_ports = pm.PortGroup(self.db_loader(db)[0])
         if db_ports.db.ports:
             ports_fname = f'{Path(db_ports.db.name).stem}_portinfo.csv'
             logger.info(f'Ports setup file {Path(db_ports.db.path) / Path(ports_fname)} is created')
-            return db_ports.export_port_info(Path(db_ports.db.path) / Path(ports_fname)).to_dict(orient='list')
+            return self._table(db_ports.export_port_info(Path(db_ports.db.path) / Path(ports_fname)),
+                               as_frame)
         else:
             logger.warning('Ports do not exist in this layout')
             return None
@@ -484,6 +575,43 @@ class PortHandler(DbHandler):
         logger.info(f'Sinks setup file {ports_fname} is created')
         db_ports.import_port_info(ports_fname)
 
+    def place_cap_ports(self, db_ports, pwr_net_names, cap_finder,
+                        cap_layers, ref_z=50, workers=None):
+        """Places and reduces capacitor ports of all power nets and layers
+        in parallel, then adds them to the layout in the order of the nets.
+
+        :param db_ports: Ports object of the layout to place ports on
+        :type db_ports: :class:`pman.PortGroup()`
+        :param pwr_net_names: Power net name(s) to place ports
+        :type pwr_net_names: list[str]
+        :param cap_finder: Keyword to find capacitor components.
+        Wildcards can be also used.
+        :type cap_finder: str
+        :param cap_layers: Pairs of layer name and number of ports to reduce to
+        :type cap_layers: list[tuple[str, int]]
+        :param ref_z: Port reference impedance, defaults to 50
+        :type ref_z: float, optional
+        :param workers: Number of worker processes, defaults to None
+        :type workers: int, optional
+        :return: The last added ports object
+        :rtype: :class:`pman.PortGroup()`
+        """
+
+        pool = pm.PlacementPool(db_ports.db, cfg.PORT_PLACEMENT_WORKERS
+                                                if workers is None else workers)
+        for placed, reduced in pool.comp_ports(pwr_net_names, cap_layers,
+                                                cap_finder, ref_z):
+            placed.add_ports(save=False)
+            self.record_status(placed)
+            for port_names in reduced.group_info.values():
+                for port_name in port_names:
+                    del db_ports.db.ports[port_name]
+            reduced.add_ports(save=False)
+            self.record_status(reduced)
+            db_ports = reduced
+
+        return db_ports
+
     def setup_motherboard_ports(self, db, pwr_net_names,
                                 cap_finder,
                                 cap_layer_top, reduce_num_top,
@@ -491,7 +619,8 @@ class PortHandler(DbHandler):
                                 vrm_layer, ref_z, socket_mode,
                                 from_db_side=None,
                                 skt_num_ports=None,
-                                pkg_fname=None):
+                                pkg_fname=None,
+                                workers=None):
         '''Create ports for a typical motherboard extraction.
 
         :param db: The name or object of layout to use to place ports
@@ -529,6 +658,10 @@ class PortHandler(DbHandler):
         If so, user must provide the package layout name from which the ports are copied,
         defaults to None
         :type pkg_fname: str, optional
+        :param workers: Number of worker processes used to place ports of
+        all the nets in parallel. If None, PORT_PLACEMENT_WORKERS from the
+        configuration is used, defaults to None
+        :type workers: int, optional
         :return: Layer views and report of the placed ports
         :rtype: dict
         '''
@@ -536,29 +669,11 @@ class PortHandler(DbHandler):
         self.clear_status()
         db_ports = pm.PortGroup(self.db_loader(db)[0])
         
+        db_ports = self.place_cap_ports(db_ports, pwr_net_names, cap_finder,
+                                        [(cap_layer_top, reduce_num_top),
+                                         (cap_layer_bot, reduce_num_bot)],
+                                        ref_z, workers)
         for pwr_net_name in pwr_net_names:
-            db_ports = db_ports.auto_port_comp(layer=cap_layer_top,
-                                                net_name=pwr_net_name,
-                                                comp_find=cap_finder,
-                                                ref_z=ref_z)
-            db_ports.add_ports(save=False)
-            self.record_status(db_ports)
-            db_ports = db_ports.reduce_ports(layer=cap_layer_top,
-                                            num_ports=reduce_num_top,
-                                            select_ports=[port.name for port in db_ports.ports])
-            db_ports.add_ports(save=False)
-            self.record_status(db_ports)
-            db_ports = db_ports.auto_port_comp(layer=cap_layer_bot,
-                                                net_name=pwr_net_name,
-                                                comp_find=cap_finder,
-                                                ref_z=ref_z)
-            db_ports.add_ports(save=False)
-            self.record_status(db_ports)
-            db_ports = db_ports.reduce_ports(layer=cap_layer_bot,
-                                            num_ports=reduce_num_bot,
-                                            select_ports=[port.name for port in db_ports.ports])
-            db_ports.add_ports(save=False)
-            self.record_status(db_ports)
             db_ports_vrm = db_ports.auto_vrm_ports(layer=vrm_layer,
                                                 net_name=pwr_net_name,
                                                 ref_z=ref_z)
@@ -602,7 +717,8 @@ class PortHandler(DbHandler):
                         sinks_area=None,
                         from_db_side=None,
                         skt_num_ports=None,
-                        brd_fname=None):
+                        brd_fname=None,
+                        workers=None):
         '''Create ports for a typical package extraction.
 
         :param db: The name or object of layout to use to place ports
@@ -652,6 +768,10 @@ class PortHandler(DbHandler):
         If so, user must provide the board layout name from which the ports are copied,
         defaults to None
         :type brd_fname: str, optional
+        :param workers: Number of worker processes used to place ports of
+        all the nets in parallel. If None, PORT_PLACEMENT_WORKERS from the
+        configuration is used, defaults to None
+        :type workers: int, optional
         :return: Layer views and report of the placed ports
         :rtype: dict
         '''
@@ -662,7 +782,9 @@ class PortHandler(DbHandler):
         if sinks_mode.lower() == 'boxes':
             db_ports = db_ports.boxes_to_ports(ref_z=ref_z)
         elif sinks_mode.lower() == 'auto':
-            db_ports = db_ports.auto_port(layer=sinks_layer,
+            pool = pm.PlacementPool(db_ports.db, cfg.PORT_PLACEMENT_WORKERS
+                                                    if workers is None else workers)
+            db_ports = pool.auto_ports(layer=sinks_layer,
                                         net_name=pwr_net_names,
                                         num_ports=sinks_num_ports,
                                         area=sinks_area,
@@ -685,28 +807,11 @@ class PortHandler(DbHandler):
         return self.port_report
         '''
     
+        db_ports = self.place_cap_ports(db_ports, pwr_net_names, cap_finder,
+                                        [(cap_layer_top, reduce_num_top),
+                                         (cap_layer_bot, reduce_num_bot)],
+                                        workers=workers)
         for pwr_net_name in pwr_net_names:
-            db_ports = db_ports.auto_port_comp(layer=cap_layer_top,
-                                                net_name=pwr_net_name,
-                                                comp_find=cap_finder)
-            db_ports.add_ports(save=False)
-            self.record_status(db_ports)
-            db_ports = db_ports.reduce_ports(layer=cap_layer_top,
-                                            num_ports=reduce_num_top,
-                                            select_ports=[port.name for port in db_ports.ports])
-            db_ports.add_ports(save=False)
-            self.record_status(db_ports)
-            db_ports = db_ports.auto_port_comp(layer=cap_layer_bot,
-                                                net_name=pwr_net_name,
-                                                comp_find=cap_finder)
-            db_ports.add_ports(save=False)
-            self.record_status(db_ports)
-            db_ports = db_ports.reduce_ports(layer=cap_layer_bot,
-                                            num_ports=reduce_num_bot,
-                                            select_ports=[port.name for port in db_ports.ports])
-            db_ports.add_ports(save=False)
-            self.record_status(db_ports)
-
             if socket_mode.lower() == 'create':
                 db_ports = db_ports.auto_port_conn(num_ports=skt_num_ports,
                                                     side='bottom',
@@ -944,7 +1049,7 @@ class PortHandler(DbHandler):
         
         return self.report_results(dst_ports)
     
-    def get_sinks_vrms_ldos_info(self, db, source_type, csv_fname=None):
+    def get_sinks_vrms_ldos_info(self, db, source_type, csv_fname=None, as_frame=False):
         """Finds and returns sink and vrm information in the given layout.
 
         :param src_db: The name of the layout with the sinks and/or vrms,
@@ -954,33 +1059,30 @@ class PortHandler(DbHandler):
         :type csv_fname: str, optional
         :param source_type: Source or sink type. Can only accept 'sink', 'vrm', or 'ldo'
         :type source_type: str
+        :param as_frame: Return a DataFrame instead of a dictionary of columns,
+        defaults to False
+        :type as_frame: bool, optional
         :return: A dictionary with sink and vrm information
-        :rtype: dict
+        :rtype: dict or pandas.DataFrame
         """        
 
         if csv_fname is not None:
-            return pd.read_csv(csv_fname).fillna('').to_dict(orient='list')
+            return self._table(pd.read_csv(csv_fname).fillna(''), as_frame)
         
         db_sinks_vrms_ldos = tasks.PdcTask(self.db_loader(db)[0])
 
         if source_type == 'sink':
             sinks_fname = Path(db_sinks_vrms_ldos.db.path) / Path(f'{Path(db_sinks_vrms_ldos.db.name).stem}_sinksinfo.csv')
             logger.info(f'Sinks setup file {sinks_fname} is created')
-            return db_sinks_vrms_ldos.export_sink_setup(sinks_fname).to_dict(orient='list')
+            return self._table(db_sinks_vrms_ldos.export_sink_setup(sinks_fname), as_frame)
         elif source_type == 'vrm':
             vrms_fname = Path(db_sinks_vrms_ldos.db.path) / Path(f'{Path(db_sinks_vrms_ldos.db.name).stem}_vrmsinfo.csv')
             logger.info(f'VRMs setup file {vrms_fname} is created')
-            return db_sinks_vrms_ldos.export_vrm_setup(vrms_fname).to_dict(orient='list')
+            return self._table(db_sinks_vrms_ldos.export_vrm_setup(vrms_fname), as_frame)
         elif source_type == 'ldo':
-<<<<<<< HEAD
             ldos_fname = Path(db_sinks_vrms_ldos.db.path) / Path(f'{Path(db_sinks_vrms_ldos.db.name).stem}_ldosinfo.csv')
             logger.info(f'LDOs setup file {ldos_fname} is created')
-            return db_sinks_vrms_ldos.export_ldo_setup(ldos_fname).to_dict(orient='list')
-=======
-            ldos_fname = Path(db_sinks_vrms_ldos.db.path) / Path(f'{Path(db_sinks_vrms_ldos.db.name).stem}_ldossinfo.csv')
-            logger.info(f'LDOs setup file {ldos_fname} is created')
-            return db_sinks_vrms_ldos.export_vrm_setup(ldos_fname).to_dict(orient='list')
->>>>>>> 1c6304a4c09f18c88dd2e91926471b4e2ffc3c7e
+            return self._table(db_sinks_vrms_ldos.export_ldo_setup(ldos_fname), as_frame)
         else:
             return None
     
@@ -999,11 +1101,7 @@ class PortHandler(DbHandler):
         df_sinks_info = pd.DataFrame(sink_info)
         df_sinks_info.to_csv(sinks_fname, index=False)
         logger.info(f'Sinks setup file {sinks_fname} is created')
-<<<<<<< HEAD
 
-=======
-        
->>>>>>> 1c6304a4c09f18c88dd2e91926471b4e2ffc3c7e
         db_sinks.import_sink_setup(sinks_fname)
         db_sinks.db.save()
 
@@ -1025,7 +1123,6 @@ class PortHandler(DbHandler):
 
         db_vrms.import_vrm_setup(vrms_fname)
         db_vrms.db.save()
-<<<<<<< HEAD
 
     def modify_ldo_info(self, db, ldos_fname, ldo_info):
         """Modifies LDO parameters as specified by the user in the frontend.
@@ -1045,8 +1142,6 @@ class PortHandler(DbHandler):
 
         db_ldos.import_ldo_setup(ldos_fname)
         db_ldos.db.save()
-=======
->>>>>>> 1c6304a4c09f18c88dd2e91926471b4e2ffc3c7e
     
     def sinks_vrms_to_ports(self, db, stimuli, to_fname=None,
                             ref_z=10, sink_suffix=None, vrm_suffix=None):
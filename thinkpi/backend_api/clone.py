@@ -0,0 +1,285 @@
+import os
+import json
+import uuid
+import errno
+import shutil
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+# ioctl sharing the data blocks of two files on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    '''Copy a file sharing its data blocks, so the copy takes no space
+    until one of the files is modified.
+
+    :param src: Source file
+    :type src: str
+    :param dst: Destination file
+    :type dst: str
+    :raises OSError: The file system does not support it
+    '''
+
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported', str(src))
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        raise
+    shutil.copystat(src, dst)
+
+
+class CloneManifest:
+    '''Record of the files shared by hardlinks between the cloned projects
+    of a library, kept in the library root.
+
+    Writing to a hardlinked file in place would modify all its links, so
+    a shared file is materialized, i.e. replaced by its own copy, before
+    it is first written with :meth:`materialize` or :func:`materialize`.
+    Reflinked files do not need it, the file system copies their blocks
+    when they are written.
+    '''
+
+    fname = '.thinkpi_clones.json'
+    # Shared by the manifests of all the libraries, they are rarely written
+    lock = threading.RLock()
+
+    def __init__(self, root):
+        '''Initialization of the :class:`CloneManifest()` class
+
+        :param root: Library root
+        :type root: str
+        '''
+
+        self.root = Path(os.path.abspath(root))
+        self.path = self.root / self.fname
+
+    def _load(self):
+
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'groups': {}}
+
+    def _save(self, manifest):
+
+        manifest['groups'] = {gid: members for gid, members in manifest['groups'].items()
+                              if len(members) > 1}
+        tmp_path = self.path.with_name(f'{self.fname}.{uuid.uuid4().hex}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _rel(self, path):
+
+        return Path(os.path.abspath(path)).relative_to(self.root).as_posix()
+
+    @staticmethod
+    def _find(manifest, rel):
+
+        for gid, members in manifest['groups'].items():
+            if rel in members:
+                return gid
+        return None
+
+    def add(self, links):
+        '''Record hardlinked files.
+
+        :param links: Source and destination of each hardlink
+        :type links: list[tuple[str, str]]
+        '''
+
+        if not links:
+            return
+        with self.lock:
+            manifest = self._load()
+            for src, dst in links:
+                src_rel, dst_rel = self._rel(src), self._rel(dst)
+                gid = self._find(manifest, src_rel)
+                if gid is None:
+                    gid = uuid.uuid4().hex
+                    manifest['groups'][gid] = [src_rel]
+                manifest['groups'][gid].append(dst_rel)
+            self._save(manifest)
+
+    def shared(self, path):
+        '''Files sharing their content with a file.
+
+        :param path: File path
+        :type path: str
+        :return: Paths of the other files, relative to the library root
+        :rtype: list[str]
+        '''
+
+        rel = self._rel(path)
+        with self.lock:
+            manifest = self._load()
+            gid = self._find(manifest, rel)
+            return [] if gid is None else [member for member in manifest['groups'][gid]
+                                           if member != rel]
+
+    def materialize(self, path):
+        '''Replace a shared file by its own copy, before it is written.
+
+        :param path: File path
+        :type path: str
+        :return: True if the file was shared
+        :rtype: bool
+        '''
+
+        rel = self._rel(path)
+        with self.lock:
+            manifest = self._load()
+            gid = self._find(manifest, rel)
+            if gid is None:
+                return False
+            fpath = self.root / rel
+            tmp_path = fpath.with_name(f'.{fpath.name}.{uuid.uuid4().hex}.tmp')
+            shutil.copy2(fpath, tmp_path)
+            os.replace(tmp_path, fpath)
+            manifest['groups'][gid].remove(rel)
+            self._save(manifest)
+
+            return True
+
+    def materialize_tree(self, path):
+        '''Materialize all the shared files under a folder, e.g. before a
+        tool writes its results in it.
+
+        :param path: Folder path
+        :type path: str
+        :return: Number of materialized files
+        :rtype: int
+        '''
+
+        rel = self._rel(path)
+        prefix = '' if rel == '.' else f'{rel}/'
+        with self.lock:
+            manifest = self._load()
+            members = [member for members in manifest['groups'].values()
+                       for member in members if member.startswith(prefix)]
+
+            return sum(self.materialize(self.root / member) for member in members)
+
+    def forget(self, path):
+        '''Forget the shared files under a deleted folder.
+
+        :param path: Deleted folder or file
+        :type path: str
+        '''
+
+        rel = self._rel(path)
+        prefix = '' if rel == '.' else f'{rel}/'
+        with self.lock:
+            manifest = self._load()
+            for gid, members in manifest['groups'].items():
+                manifest['groups'][gid] = [member for member in members
+                                           if member != rel and not member.startswith(prefix)]
+            self._save(manifest)
+
+    def rmtree(self, path):
+        '''Delete a folder and forget its shared files.
+
+        :param path: Folder path
+        :type path: str
+        '''
+
+        shutil.rmtree(path)
+        self.forget(path)
+
+
+def materialize(path):
+    '''Give a file its own copy before it is written in place, if it is
+    hardlinked to a file of a cloned project. The manifest is looked up in
+    the folders above the file.
+
+    :param path: File path
+    :type path: str
+    :return: True if the file was shared
+    :rtype: bool
+    '''
+
+    try:
+        # Files with a single link are not shared, which is the common case
+        if os.stat(path).st_nlink < 2:
+            return False
+    except OSError:
+        return False
+    for folder in Path(os.path.abspath(path)).parents:
+        if (folder / CloneManifest.fname).is_file():
+            return CloneManifest(folder).materialize(path)
+
+    return False
+
+
+def clone_tree(src, dst, manifest=None, mode='reflink', min_link_size=1e6):
+    '''Clone a folder without copying the file contents when possible.
+    Files are reflinked if the file system supports it. Otherwise, in
+    'hardlink' mode, files of at least min_link_size bytes are hardlinked
+    and recorded in the manifest. The other files are copied.
+
+    :param src: Source folder
+    :type src: str
+    :param dst: Destination folder, must not exist
+    :type dst: str
+    :param manifest: Manifest recording the hardlinks. If None, files are
+    not hardlinked, defaults to None
+    :type manifest: :class:`CloneManifest()`, optional
+    :param mode: 'reflink' to reflink or copy, 'hardlink' to reflink,
+    hardlink or copy, 'copy' to only copy, defaults to 'reflink'
+    :type mode: str, optional
+    :param min_link_size: Minimum size in bytes of the hardlinked files, defaults to 1e6
+    :type min_link_size: float, optional
+    :return: Number of files and bytes reflinked, hardlinked and copied
+    :rtype: dict
+    '''
+
+    use_reflink = mode in ('reflink', 'hardlink')
+    use_link = mode == 'hardlink' and manifest is not None
+    stats = {method: {'files': 0, 'bytes': 0} for method in ('reflink', 'hardlink', 'copy')}
+    links = []
+
+    def clone_file(src_file, dst_file):
+        nonlocal use_reflink, use_link
+        size = os.path.getsize(src_file)
+        method = 'copy'
+        if use_reflink:
+            try:
+                reflink(src_file, dst_file)
+                method = 'reflink'
+            except OSError:
+                # Not supported by this file system, not tried again
+                use_reflink = False
+        if method == 'copy' and use_link and size >= min_link_size:
+            try:
+                os.link(src_file, dst_file)
+                links.append((src_file, dst_file))
+                method = 'hardlink'
+            except OSError:
+                use_link = False
+        if method == 'copy':
+            shutil.copy2(src_file, dst_file)
+        stats[method]['files'] += 1
+        stats[method]['bytes'] += size
+
+        return dst_file
+
+    try:
+        shutil.copytree(src, dst, copy_function=clone_file)
+    finally:
+        if manifest is not None:
+            manifest.add(links)
+
+    return stats
@@ -0,0 +1,470 @@
+import uuid
+import struct
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from thinkpi import logger
+
+# Binary tile layout, little endian:
+#   header: magic, version, reserved, number of polygons, vertices and circles
+#   float32 x, y of the polygon vertices, NaN separates the holes of a polygon
+#   float32 x, y, radius of the circles
+#   uint32 vertex offset of each polygon, followed by the number of vertices
+#   uint16 palette index of each polygon, then of each circle
+#   uint8 kind index of each polygon, then of each circle
+TILE_MAGIC = b'TPGT'
+TILE_VERSION = 1
+TILE_HEADER = struct.Struct('<4sHHIII')
+
+# Kinds of primitives in drawing order, and whether they are filled or only outlined
+KINDS = (('trace', True), ('shape', True), ('pad', True), ('via_pad', True),
+         ('via_hole', True), ('via_pad_outline', False), ('via', False))
+KIND_INDEX = {name: idx for idx, (name, _) in enumerate(KINDS)}
+
+
+def encode_tile(tile):
+    '''Pack the arrays of a tile in the binary tile format.
+
+    :param tile: Tile arrays, as returned by :meth:`LayerGeometry.tile`
+    :type tile: dict[numpy.ndarray]
+    :return: Encoded tile
+    :rtype: bytes
+    '''
+
+    parts = [TILE_HEADER.pack(TILE_MAGIC, TILE_VERSION, 0, len(tile['poly_color']),
+                              len(tile['xy']), len(tile['circle_color'])),
+             tile['xy'].astype('<f4').tobytes(),
+             tile['circles'].astype('<f4').tobytes(),
+             tile['offsets'].astype('<u4').tobytes(),
+             tile['poly_color'].astype('<u2').tobytes(),
+             tile['circle_color'].astype('<u2').tobytes(),
+             tile['poly_kind'].astype('u1').tobytes(),
+             tile['circle_kind'].astype('u1').tobytes()]
+
+    return b''.join(parts)
+
+
+def decode_tile(data):
+    '''Unpack a binary tile.
+
+    :param data: Encoded tile
+    :type data: bytes
+    :raises ValueError: The data is not a tile of a supported version
+    :return: Tile arrays
+    :rtype: dict[numpy.ndarray]
+    '''
+
+    magic, version, _, n_polys, n_vertices, n_circles = TILE_HEADER.unpack_from(data)
+    if magic != TILE_MAGIC or version != TILE_VERSION:
+        raise ValueError(f'Not a layer geometry tile of version {TILE_VERSION}')
+
+    tile, pos = {}, TILE_HEADER.size
+    for key, dtype, shape in (('xy', '<f4', (n_vertices, 2)),
+                              ('circles', '<f4', (n_circles, 3)),
+                              ('offsets', '<u4', (n_polys + 1,)),
+                              ('poly_color', '<u2', (n_polys,)),
+                              ('circle_color', '<u2', (n_circles,)),
+                              ('poly_kind', 'u1', (n_polys,)),
+                              ('circle_kind', 'u1', (n_circles,))):
+        count = int(np.prod(shape))
+        tile[key] = np.frombuffer(data, dtype, count, pos).reshape(shape)
+        pos += count*np.dtype(dtype).itemsize
+
+    return tile
+
+
+class LayerGeometry:
+    '''Geometry of a layer as flat arrays, split in quadtree tiles.
+
+    The layer is covered by a square of side :attr:`side` starting at
+    :attr:`origin`. Level z has 2**z x 2**z tiles, tile (x, y) starts at
+    origin + (x, y)*side/2**z, y grows upwards as the layout coordinates.
+    Below the deepest level, primitives smaller than a pixel become circles
+    and only one of them is kept per pixel, and the polygon vertices closer
+    than half a pixel are merged, so the size of a tile is bounded by its
+    number of pixels instead of the density of the layer.
+    '''
+
+    def __init__(self, db, layer, unit='mm', background_clr='black',
+                 tile_pixels=256, max_level=12):
+        '''Initialization of the :class:`LayerGeometry()` class
+
+        :param db: Loaded layout
+        :type db: :class:`speed.Database()`
+        :param layer: Layer name
+        :type layer: str
+        :param unit: Unit of the coordinates, defaults to 'mm'
+        :type unit: str, optional
+        :param background_clr: Color of the voids, defaults to 'black'
+        :type background_clr: str, optional
+        :param tile_pixels: Width of a tile in pixels, defaults to 256
+        :type tile_pixels: int, optional
+        :param max_level: Deepest zoom level, defaults to 12
+        :type max_level: int, optional
+        '''
+
+        self.layer = layer
+        self.unit = unit
+        self.background_clr = background_clr
+        self.tile_pixels = tile_pixels
+        self.palette = [background_clr]
+        self._colors = {background_clr: 0}
+        polys, circles = [], []
+
+        flags = db.plot_flags
+        if flags['traces']:
+            geom = db.traces_geom(layer, unit, background_clr)
+            polys.append((geom['x'], geom['y'], geom['clr'], 'trace'))
+            circles.append((geom['xcir'], geom['ycir'], geom['radii'], geom['clr'], 'trace'))
+        if flags['shapes']:
+            geom = db.shapes_geom(layer, unit, background_clr)
+            polys.append((geom['xs'], geom['ys'], geom['clr'], 'shape'))
+            circles.append((geom['xc'], geom['yc'], geom['radii'], geom['clr_cir'], 'shape'))
+        if flags['pads']:
+            geom = db.node_pads_geom(layer, unit, background_clr)
+            polys.append((geom['x'], geom['y'], geom['clr'], 'pad'))
+            circles.append((geom['xcir'], geom['ycir'], geom['radii'], geom['clr_cir'], 'pad'))
+        if flags['vias']:
+            geom = db.vias_geom(layer, unit, background_clr)
+            if flags['pads']:
+                circles.append((geom['xcir'], geom['ycir'], geom['radii'], geom['clr_cir'], 'via_pad'))
+                circles.append((geom['xcir_anti'], geom['ycir_anti'], geom['radii_anti'],
+                                [background_clr]*len(geom['radii_anti']), 'via_hole'))
+            polys.append((geom['xpad'], geom['ypad'], geom['clr_pad'], 'via_pad_outline'))
+            polys.append((geom['x'], geom['y'], geom['clr'], 'via'))
+
+        self._set_polygons(polys)
+        self._set_circles(circles)
+        self._set_extent(max_level)
+
+    def _color(self, clr):
+
+        if clr not in self._colors:
+            self._colors[clr] = len(self.palette)
+            self.palette.append(clr)
+
+        return self._colors[clr]
+
+    def _set_polygons(self, polys):
+
+        xy, counts, colors, kinds = [], [], [], []
+        for xs, ys, clrs, kind in polys:
+            for xvec, yvec, clr in zip(xs, ys, clrs):
+                xvec = np.asarray(xvec, dtype=float).ravel()
+                yvec = np.asarray(yvec, dtype=float).ravel()
+                if not len(xvec) or len(xvec) != len(yvec):
+                    continue
+                xy.append(np.column_stack((xvec, yvec)))
+                counts.append(len(xvec))
+                colors.append(self._color(clr))
+                kinds.append(KIND_INDEX[kind])
+
+        self.xy = np.concatenate(xy) if xy else np.empty((0, 2))
+        self.offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+        self.poly_color = np.array(colors, dtype=np.uint16)
+        self.poly_kind = np.array(kinds, dtype=np.uint8)
+        if counts:
+            starts = self.offsets[:-1]
+            self.poly_bbox = np.column_stack((np.fmin.reduceat(self.xy[:, 0], starts),
+                                              np.fmin.reduceat(self.xy[:, 1], starts),
+                                              np.fmax.reduceat(self.xy[:, 0], starts),
+                                              np.fmax.reduceat(self.xy[:, 1], starts)))
+        else:
+            self.poly_bbox = np.empty((0, 4))
+
+    def _set_circles(self, circles):
+
+        xyr, colors, kinds = [], [], []
+        for xc, yc, radii, clrs, kind in circles:
+            xyr.extend(zip(xc, yc, radii))
+            colors.extend(self._color(clr) for clr in clrs)
+            kinds.extend([KIND_INDEX[kind]]*len(radii))
+
+        self.circles = np.array(xyr, dtype=float).reshape(-1, 3)
+        self.circle_color = np.array(colors, dtype=np.uint16)
+        self.circle_kind = np.array(kinds, dtype=np.uint8)
+        # Circles are drawn kind by kind, as the polygons
+        order = np.argsort(self.circle_kind, kind='stable')
+        self.circles = self.circles[order]
+        self.circle_color = self.circle_color[order]
+        self.circle_kind = self.circle_kind[order]
+
+    def _set_extent(self, max_level):
+
+        xc, yc, radii = self.circles.T
+        bounds = np.vstack((self.poly_bbox,
+                            np.column_stack((xc - radii, yc - radii, xc + radii, yc + radii))))
+        if len(bounds) and np.isfinite(bounds).any():
+            self.bounds = (float(np.nanmin(bounds[:, 0])), float(np.nanmin(bounds[:, 1])),
+                           float(np.nanmax(bounds[:, 2])), float(np.nanmax(bounds[:, 3])))
+        else:
+            self.bounds = (0.0, 0.0, 1.0, 1.0)
+        self.origin = self.bounds[:2]
+        self.side = max(self.bounds[2] - self.bounds[0], self.bounds[3] - self.bounds[1]) or 1.0
+
+        # Deepest level at which the smallest primitive spans a pixel
+        sizes = np.concatenate((np.fmax(self.poly_bbox[:, 2] - self.poly_bbox[:, 0],
+                                        self.poly_bbox[:, 3] - self.poly_bbox[:, 1]),
+                                2*radii))
+        sizes = sizes[sizes > 0]
+        if len(sizes):
+            level = np.ceil(np.log2(self.side/(self.tile_pixels*sizes.min())))
+            self.max_level = int(np.clip(level, 0, max_level))
+        else:
+            self.max_level = 0
+
+    def info(self):
+        '''Description of the layer geometry needed to request and draw its tiles.
+
+        :rtype: dict
+        '''
+
+        return {'layer': self.layer, 'unit': self.unit, 'version': TILE_VERSION,
+                'bounds': list(self.bounds), 'origin': list(self.origin),
+                'side': self.side, 'tile_pixels': self.tile_pixels,
+                'max_level': self.max_level, 'background': self.background_clr,
+                'palette': self.palette,
+                'kinds': [{'name': name, 'fill': fill} for name, fill in KINDS],
+                'polygons': len(self.poly_color), 'vertices': len(self.xy),
+                'circles': len(self.circle_color)}
+
+    def tile(self, level, x, y):
+        '''Primitives of a tile, simplified to the resolution of its level.
+
+        :param level: Zoom level, between 0 and :attr:`max_level`
+        :type level: int
+        :param x: Tile column, from the left
+        :type x: int
+        :param y: Tile row, from the bottom
+        :type y: int
+        :raises ValueError: The tile does not exist
+        :return: Polygon vertices, vertex offsets, colors and kinds, and
+        circle centers and radii, colors and kinds
+        :rtype: dict[numpy.ndarray]
+        '''
+
+        if not 0 <= level <= self.max_level:
+            raise ValueError(f'Tile level must be between 0 and {self.max_level}')
+        if not (0 <= x < 2**level and 0 <= y < 2**level):
+            raise ValueError(f'Tile ({x}, {y}) does not exist at level {level}')
+
+        size = self.side/2**level
+        x0, y0 = self.origin[0] + x*size, self.origin[1] + y*size
+        x1, y1 = x0 + size, y0 + size
+        pixel = size/self.tile_pixels
+        exact = level == self.max_level
+
+        bbox = self.poly_bbox
+        polys = np.flatnonzero((bbox[:, 0] <= x1) & (bbox[:, 2] >= x0)
+                                & (bbox[:, 1] <= y1) & (bbox[:, 3] >= y0))
+        xc, yc, radii = self.circles.T
+        cirs = np.flatnonzero((xc - radii <= x1) & (xc + radii >= x0)
+                                & (yc - radii <= y1) & (yc + radii >= y0))
+        circles = self.circles[cirs]
+        circle_color = self.circle_color[cirs]
+        circle_kind = self.circle_kind[cirs]
+
+        if not exact:
+            # Polygons smaller than a pixel are drawn as circles
+            extent = np.fmax(bbox[polys, 2] - bbox[polys, 0], bbox[polys, 3] - bbox[polys, 1])
+            tiny = polys[extent < pixel]
+            polys = polys[extent >= pixel]
+            tiny_circles = np.column_stack(((bbox[tiny, 0] + bbox[tiny, 2])/2,
+                                            (bbox[tiny, 1] + bbox[tiny, 3])/2,
+                                            extent[extent < pixel]/2))
+            circles = np.vstack((circles, tiny_circles))
+            circle_color = np.concatenate((circle_color, self.poly_color[tiny]))
+            circle_kind = np.concatenate((circle_kind, self.poly_kind[tiny]))
+            order = np.argsort(circle_kind, kind='stable')
+            circles, circle_color, circle_kind = circles[order], circle_color[order], circle_kind[order]
+
+            # Only one circle smaller than a pixel is kept per pixel and kind
+            tiny = np.flatnonzero(2*circles[:, 2] < pixel)
+            width = self.tile_pixels + 2
+            col = np.clip(np.floor((circles[tiny, 0] - x0)/pixel) + 1, 0, width - 1)
+            row = np.clip(np.floor((circles[tiny, 1] - y0)/pixel) + 1, 0, width - 1)
+            cells = (col.astype(np.int64)*width + row.astype(np.int64))*len(KINDS) + circle_kind[tiny]
+            _, first = np.unique(cells, return_index=True)
+            keep = np.ones(len(circles), dtype=bool)
+            keep[tiny] = False
+            keep[tiny[first]] = True
+            circles, circle_color, circle_kind = circles[keep], circle_color[keep], circle_kind[keep]
+
+        starts = self.offsets[polys]
+        counts = self.offsets[polys + 1] - starts
+        poly_ids = np.repeat(np.arange(len(polys)), counts)
+        vertices = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                    + np.repeat(starts, counts))
+        xy = self.xy[vertices]
+
+        if not exact and len(xy):
+            # Consecutive vertices closer than half a pixel are merged
+            cells = np.floor((xy - (x0, y0))/(pixel/2))
+            keep = np.ones(len(xy), dtype=bool)
+            keep[1:] = (cells[1:] != cells[:-1]).any(axis=1) | (poly_ids[1:] != poly_ids[:-1])
+            xy, poly_ids = xy[keep], poly_ids[keep]
+            counts = np.bincount(poly_ids, minlength=len(polys))
+
+        return {'xy': xy, 'offsets': np.concatenate(([0], np.cumsum(counts))),
+                'poly_color': self.poly_color[polys], 'poly_kind': self.poly_kind[polys],
+                'circles': circles, 'circle_color': circle_color, 'circle_kind': circle_kind}
+
+
+class LayerTileCache:
+    '''Cache of the layer geometries of the loaded layouts and of their
+    encoded tiles.
+
+    The geometries are kept as long as their layout is loaded. The tiles
+    are evicted, least recently used first, when their memory exceeds the
+    memory budget. Each layout gets a new version when it is invalidated,
+    so the tiles of a modified layout are built again and the tile tags
+    seen by the clients change.
+    '''
+
+    def __init__(self, max_memory=None, tile_pixels=256, max_level=12):
+        '''Initialization of the :class:`LayerTileCache()` class
+
+        :param max_memory: Memory budget of the encoded tiles in bytes. If
+        None, the tiles are never evicted, defaults to None
+        :type max_memory: float, optional
+        :param tile_pixels: Width of a tile in pixels, defaults to 256
+        :type tile_pixels: int, optional
+        :param max_level: Deepest zoom level, defaults to 12
+        :type max_level: int, optional
+        '''
+
+        self.max_memory = max_memory
+        self.tile_pixels = tile_pixels
+        self.max_level = max_level
+        self.lock = threading.RLock()
+        # By id of the layouts, which are not hashable, dropped with them
+        self.versions = {}
+        self.geometries = {}
+        self.tiles = OrderedDict()
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def version(self, db):
+        '''Current version of a layout in the cache.
+
+        :param db: Loaded layout
+        :type db: :class:`speed.Database()`
+        :rtype: str
+        '''
+
+        with self.lock:
+            if id(db) not in self.versions:
+                self.versions[id(db)] = uuid.uuid4().hex
+                weakref.finalize(db, self._forget, id(db), self.versions[id(db)])
+            return self.versions[id(db)]
+
+    def _forget(self, db_id, version):
+
+        # The layout is garbage collected, its id may be reused
+        with self.lock:
+            if self.versions.get(db_id) == version:
+                self.invalidate(db_id)
+
+    def geometry(self, db, layer, unit='mm', background_clr='black'):
+        '''Geometry of a layer, built on first use.
+
+        :param db: Loaded layout
+        :type db: :class:`speed.Database()`
+        :param layer: Layer name
+        :type layer: str
+        :rtype: :class:`LayerGeometry()`
+        '''
+
+        if layer not in db.layer_names(verbose=False):
+            raise ValueError(f'Layer {layer} does not exist')
+        key = (self.version(db), layer, unit, background_clr)
+        with self.lock:
+            geometry = self.geometries.get(id(db), {}).get(key)
+        if geometry is None:
+            geometry = LayerGeometry(db, layer, unit, background_clr,
+                                     self.tile_pixels, self.max_level)
+            logger.debug(f'Geometry of layer {layer}: {len(geometry.poly_color)} polygons, '
+                         f'{len(geometry.circle_color)} circles')
+            with self.lock:
+                geometry = self.geometries.setdefault(id(db), {}).setdefault(key, geometry)
+
+        return geometry
+
+    def tile(self, db, layer, level, x, y, unit='mm', background_clr='black'):
+        '''Encoded tile of a layer.
+
+        :param db: Loaded layout
+        :type db: :class:`speed.Database()`
+        :param layer: Layer name
+        :type layer: str
+        :param level: Zoom level
+        :type level: int
+        :param x: Tile column, from the left
+        :type x: int
+        :param y: Tile row, from the bottom
+        :type y: int
+        :raises ValueError: The layer or the tile does not exist
+        :return: Encoded tile and its tag, which changes with the tile content
+        :rtype: tuple[bytes, str]
+        '''
+
+        key = (self.version(db), layer, unit, background_clr, level, x, y)
+        tag = hashlib.md5(repr(key).encode()).hexdigest()
+        with self.lock:
+            if key in self.tiles:
+                self.hits += 1
+                self.tiles.move_to_end(key)
+                return self.tiles[key], tag
+
+        data = encode_tile(self.geometry(db, layer, unit, background_clr).tile(level, x, y))
+        with self.lock:
+            self.misses += 1
+            if key not in self.tiles:
+                self.tiles[key] = data
+                self.memory += len(data)
+                self._evict()
+
+        return data, tag
+
+    def _evict(self):
+
+        if self.max_memory is None:
+            return
+        while self.memory > self.max_memory and len(self.tiles) > 1:
+            _, data = self.tiles.popitem(last=False)
+            self.memory -= len(data)
+            self.evictions += 1
+
+    def invalidate(self, db):
+        '''Drop the geometries and tiles of a layout, e.g. after it is modified.
+
+        :param db: Loaded layout, or its id
+        :type db: :class:`speed.Database()` or int
+        '''
+
+        db_id = db if isinstance(db, int) else id(db)
+        with self.lock:
+            version = self.versions.pop(db_id, None)
+            self.geometries.pop(db_id, None)
+            for key in [key for key in self.tiles if key[0] == version]:
+                self.memory -= len(self.tiles.pop(key))
+
+    def stats(self):
+        '''Cache statistics.
+
+        :return: Memory budget, used memory, number of tiles and layer
+        geometries, hits, misses and evictions
+        :rtype: dict
+        '''
+
+        with self.lock:
+            return {'max_memory': self.max_memory, 'memory': self.memory,
+                    'tiles': len(self.tiles),
+                    'geometries': sum(len(layers) for layers in self.geometries.values()),
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,282 @@
+import os
+import sys
+import time
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from collections import OrderedDict, Counter
+from types import ModuleType, FunctionType, MethodType
+
+import numpy as np
+import pandas as pd
+
+from thinkpi import logger
+
+
+def estimate_size(obj):
+    '''Estimate the memory used by an object and all the objects it
+    references. Arrays and data frames are measured by their buffers.
+
+    :param obj: Object to measure
+    :type obj: object
+    :return: Size in bytes
+    :rtype: int
+    '''
+
+    size = 0
+    seen = set()
+    to_visit = [obj]
+    while to_visit:
+        item = to_visit.pop()
+        if id(item) in seen or isinstance(item, (type, ModuleType, FunctionType, MethodType)):
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            size += item.nbytes
+            if item.dtype == object:
+                to_visit.extend(item.ravel())
+            continue
+        if isinstance(item, (pd.DataFrame, pd.Series)):
+            size += int(np.sum(item.memory_usage(index=True, deep=True)))
+            continue
+        size += sys.getsizeof(item)
+        if isinstance(item, (str, bytes, int, float, complex, bool)):
+            continue
+        if isinstance(item, dict):
+            to_visit.extend(item.keys())
+            to_visit.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            to_visit.extend(item)
+        if hasattr(item, '__dict__'):
+            to_visit.append(vars(item))
+        for slot in getattr(type(item), '__slots__', ()):
+            if hasattr(item, slot):
+                to_visit.append(getattr(item, slot))
+
+    return size
+
+
+class LayoutNotLoaded(KeyError):
+    '''Raised when a layout is not in the cache, was evicted, or its
+    file changed on disk since it was loaded.'''
+
+
+class LayoutCache:
+    '''Cache of the loaded layouts, used like a dictionary keyed by the
+    absolute path of the layout files, so layouts with the same file name
+    in different folders do not collide.
+
+    The least recently used layouts are evicted when the estimated
+    memory of the cached layouts exceeds the memory budget. Layouts in
+    use by running jobs are never evicted. A layout whose file changed
+    on disk since it was loaded is dropped when it is accessed, so it is
+    loaded again.
+    '''
+
+    def __init__(self, max_memory=None, sizeof=estimate_size):
+        '''Initialization of the :class:`LayoutCache()` class
+
+        :param max_memory: Memory budget in bytes. If None, the layouts
+        are never evicted, defaults to None
+        :type max_memory: float, optional
+        :param sizeof: Function estimating the memory of a layout in bytes,
+        defaults to :func:`estimate_size`
+        :type sizeof: callable, optional
+        '''
+
+        self.max_memory = max_memory
+        self.sizeof = sizeof
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()
+        self.refs = Counter()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(layout_fname):
+        '''Cache key of a layout file.
+
+        :param layout_fname: Layout file path, absolute or relative
+        :type layout_fname: str or pathlib.Path
+        :return: Absolute and normalized path
+        :rtype: str
+        '''
+
+        return os.path.normcase(str(Path(layout_fname).resolve()))
+
+    @staticmethod
+    def layout_path(layout):
+
+        if getattr(layout, 'path', None) is None or getattr(layout, 'name', None) is None:
+            return None
+        return Path(layout.path) / layout.name
+
+    @staticmethod
+    def _mtime(fpath):
+
+        try:
+            return fpath.stat().st_mtime_ns
+        except (OSError, AttributeError):
+            return None
+
+    def _stale(self, key):
+
+        entry = self.entries[key]
+        return (entry['fpath'] is not None and not self.refs[key]
+                and self._mtime(entry['fpath']) != entry['mtime'])
+
+    def put(self, key, layout, fpath=None, size=None):
+        '''Add a layout to the cache and evict the least recently used
+        layouts if the memory budget is exceeded.
+
+        :param key: Layout file path
+        :type key: str
+        :param layout: Loaded layout
+        :type layout: :class:`speed.Database()`
+        :param fpath: Layout file, used to detect changes on disk. If None,
+        it is taken from the path and name of the layout, defaults to None
+        :type fpath: str, optional
+        :param size: Memory of the layout in bytes. If None, it is
+        estimated, defaults to None
+        :type size: int, optional
+        '''
+
+        key = self.key(key)
+        fpath = self.layout_path(layout) if fpath is None else Path(fpath)
+        size = self.sizeof(layout) if size is None else size
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = {'layout': layout, 'fpath': fpath, 'mtime': self._mtime(fpath),
+                                 'size': size, 'loaded': time.time()}
+            self._evict()
+
+    def _evict(self):
+
+        if self.max_memory is None:
+            return
+        memory = self.memory
+        for key in list(self.entries):
+            if memory <= self.max_memory:
+                return
+            if self.refs[key]:
+                continue
+            memory -= self.entries.pop(key)['size']
+            self.evictions += 1
+            logger.info(f'Layout {key} is evicted from the cache')
+        if memory > self.max_memory:
+            logger.warning(f'Layouts in use need {memory/1e9:.2f} GB, '
+                           f'more than the {self.max_memory/1e9:.2f} GB budget')
+
+    def get(self, key, default=None):
+
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+
+        key = self.key(key)
+        with self.lock:
+            if key in self.entries and self._stale(key):
+                del self.entries[key]
+                self.invalidations += 1
+                logger.info(f'Layout {key} changed on disk and must be loaded again')
+            if key not in self.entries:
+                self.misses += 1
+                raise LayoutNotLoaded(f'Layout {key} is not loaded')
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]['layout']
+
+    def __setitem__(self, key, layout):
+
+        self.put(key, layout)
+
+    def __delitem__(self, key):
+
+        key = self.key(key)
+        with self.lock:
+            del self.entries[key]
+
+    def __contains__(self, key):
+
+        key = self.key(key)
+        with self.lock:
+            if key in self.entries and self._stale(key):
+                del self.entries[key]
+                self.invalidations += 1
+            return key in self.entries
+
+    def __len__(self):
+
+        return len(self.entries)
+
+    def __iter__(self):
+
+        return iter(list(self.entries))
+
+    def keys(self):
+
+        return list(self.entries)
+
+    def pop(self, key, *default):
+
+        key = self.key(key)
+        with self.lock:
+            if key in self.entries:
+                return self.entries.pop(key)['layout']
+        if default:
+            return default[0]
+        raise LayoutNotLoaded(f'Layout {key} is not loaded')
+
+    @contextmanager
+    def use(self, *keys):
+        '''Mark layouts as in use, e.g. by a running job, so they are not
+        evicted nor invalidated. The layouts do not need to be loaded yet.
+        Files written while a layout is in use are considered written from
+        the cached layout, so they do not invalidate it.
+
+        :param keys: Layout file paths
+        :type keys: str
+        '''
+
+        keys = [self.key(key) for key in keys]
+        with self.lock:
+            self.refs.update(keys)
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.refs.subtract(keys)
+                for key in keys:
+                    if self.refs[key] <= 0:
+                        del self.refs[key]
+                        if key in self.entries:
+                            entry = self.entries[key]
+                            entry['mtime'] = self._mtime(entry['fpath'])
+                self._evict()
+
+    @property
+    def memory(self):
+
+        return sum(entry['size'] for entry in self.entries.values())
+
+    def stats(self):
+        '''Cache statistics.
+
+        :return: Memory budget, used memory, hits, misses, evictions,
+        invalidations and the size and state of each cached layout
+        :rtype: dict
+        '''
+
+        with self.lock:
+            return {'max_memory': self.max_memory, 'memory': self.memory,
+                    'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'invalidations': self.invalidations,
+                    'layouts': [{'name': key, 'file': None if entry['fpath'] is None else str(entry['fpath']),
+                                 'size': entry['size'], 'in_use': self.refs[key],
+                                 'loaded': entry['loaded']}
+                                for key, entry in self.entries.items()]}
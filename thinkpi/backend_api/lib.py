@@ -2,6 +2,8 @@ import os
 import shutil
 import psutil
 import socket
+import time
+import threading
 from time import sleep
 import json
 from pathlib import Path
@@ -10,13 +12,18 @@ import math
 from operator import itemgetter
 
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 
 from thinkpi import _thinkpi_path
 from thinkpi.config import thinkpi_conf as cfg
+from thinkpi import logger
+from thinkpi.backend_api.tree_index import TreeIndex
+from thinkpi.backend_api.clone import CloneManifest, clone_tree
 
 
 class ProjectLevels:
@@ -65,11 +72,226 @@ class ProjectLevels:
         self.levels = [self.level0, self.level1, self.level2]
 
 
+class ServerTelemetry:
+    '''Class that polls the resource information of the simulation
+    servers in the background and keeps their latest readings.
+
+    Each server is polled on its own schedule by a small thread pool
+    sharing pooled connections, so a slow or dead server does not delay
+    the others. A server that keeps failing is polled less and less often,
+    up to the maximum backoff.
+    '''
+
+    def __init__(self, servers, port=cfg.BACKEND_PORT, interval=cfg.SERVER_POLL_INTERVAL,
+                 timeout=cfg.SERVER_POLL_TIMEOUT, max_backoff=cfg.SERVER_POLL_MAX_BACKOFF,
+                 max_workers=8, history=60):
+        '''Initializes the generated object.
+
+        :param servers: Host names of the servers by address. An address is
+        an ip address or host name, optionally followed by :port
+        :type servers: dict[str, str]
+        :param port: Port of the servers without a port in their address,
+        defaults to cfg.BACKEND_PORT
+        :type port: int, optional
+        :param interval: Seconds between two polls of a server, defaults to cfg.SERVER_POLL_INTERVAL
+        :type interval: float, optional
+        :param timeout: Seconds to wait for a server to answer, defaults to cfg.SERVER_POLL_TIMEOUT
+        :type timeout: float, optional
+        :param max_backoff: Maximum seconds between two polls of a failing
+        server, defaults to cfg.SERVER_POLL_MAX_BACKOFF
+        :type max_backoff: float, optional
+        :param max_workers: Maximum number of servers polled at the same time, defaults to 8
+        :type max_workers: int, optional
+        :param history: Number of readings kept per server, defaults to 60
+        :type history: int, optional
+        '''
+
+        self.servers = dict(servers)
+        self.port = port
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(len(self.servers), 1), pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='telemetry')
+        self.lock = threading.Lock()
+        self.state = {address: {'host_name': host_name, 'reading': None, 'updated': None,
+                                'error': None, 'failures': 0, 'latency': None,
+                                'next_poll': 0.0, 'polling': None,
+                                'history': deque(maxlen=history)}
+                      for address, host_name in self.servers.items()}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def url(self, address):
+
+        if ':' not in address:
+            address = f'{address}:{self.port}'
+        return f'http://{address}/get-server-info'
+
+    def poll(self, address):
+        """Polls a server and stores its reading.
+
+        :param address: Server address
+        :type address: str
+        :return: Server reading, or None if the server did not answer
+        :rtype: dict or NoneType
+        """
+
+        start = time.monotonic()
+        try:
+            r = self.session.get(self.url(address), timeout=self.timeout)
+            r.raise_for_status()
+            reading = r.json()
+            error = None
+        except (requests.RequestException, ValueError) as e:
+            reading, error = None, f'{type(e).__name__}: {e}'
+        now = time.monotonic()
+
+        with self.lock:
+            state = self.state[address]
+            state['polling'] = None
+            if reading is None:
+                state['failures'] += 1
+                state['error'] = error
+                state['next_poll'] = now + min(self.interval*2**state['failures'], self.max_backoff)
+                if state['failures'] == 1:
+                    logger.debug(f"Server {state['host_name']} ({address}) did not answer: {error}")
+            else:
+                state['failures'] = 0
+                state['error'] = None
+                state['reading'] = reading
+                state['updated'] = time.time()
+                state['latency'] = now - start
+                state['next_poll'] = now + self.interval
+                state['history'].append((state['updated'], reading.get('cpu_per'),
+                                         reading.get('used_memory_per')))
+
+        return reading
+
+    def poll_due(self):
+        """Starts polling the servers whose next poll is due and which
+        are not being polled.
+
+        :return: Polls started
+        :rtype: list[concurrent.futures.Future]
+        """
+
+        now = time.monotonic()
+        futures = []
+        with self.lock:
+            for address, state in self.state.items():
+                if state['polling'] is None and state['next_poll'] <= now:
+                    state['polling'] = self.executor.submit(self.poll, address)
+                    futures.append(state['polling'])
+
+        return futures
+
+    def poll_all(self):
+        """Polls all the servers now, except the ones being polled, and
+        waits for all the polls to finish.
+        """
+
+        with self.lock:
+            for state in self.state.values():
+                state['next_poll'] = 0.0
+            futures = [state['polling'] for state in self.state.values()
+                       if state['polling'] is not None]
+        wait(futures + self.poll_due())
+
+    def _run(self):
+
+        tick = min(1.0, self.interval/4)
+        while True:
+            self.poll_due()
+            if self.stop_event.wait(tick):
+                break
+
+    def start(self):
+        """Starts polling the servers in the background.
+        """
+
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='telemetry', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stops polling the servers.
+        """
+
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def has_readings(self):
+
+        with self.lock:
+            return any(state['reading'] is not None for state in self.state.values())
+
+    def readings(self, max_age=cfg.SERVER_READING_MAX_AGE):
+        """Latest readings of the servers, in the format scored by
+        :meth:`LibManager.score_servers`.
+
+        :param max_age: Seconds after which a reading is too old and its
+        server is reported as not answering. If None, readings never
+        expire, defaults to cfg.SERVER_READING_MAX_AGE
+        :type max_age: float or NoneType, optional
+        :return: Reading of each server with its update time, or its
+        address if there is no recent reading
+        :rtype: list[dict or str]
+        """
+
+        now = time.time()
+        responses = []
+        with self.lock:
+            for address, state in self.state.items():
+                if state['reading'] is None or (max_age is not None
+                                                and now - state['updated'] > max_age):
+                    responses.append(address)
+                else:
+                    responses.append({**state['reading'], 'updated': state['updated']})
+
+        return responses
+
+    def status(self):
+        """Polling status of the servers.
+
+        :return: Host name, address, last update time, last error,
+        consecutive failures, latency, seconds to the next poll and
+        recent (time, cpu %, used memory %) readings of each server
+        :rtype: list[dict]
+        """
+
+        now = time.monotonic()
+        with self.lock:
+            return [{'host_name': state['host_name'], 'address': address,
+                     'updated': state['updated'], 'error': state['error'],
+                     'failures': state['failures'], 'latency': state['latency'],
+                     'polling': state['polling'] is not None,
+                     'next_poll': max(state['next_poll'] - now, 0.0),
+                     'history': list(state['history'])}
+                    for address, state in self.state.items()]
+
+
 class LibManager:
     '''Class that defines the different operations related to 
     library management.
     '''
 
+    # Background poller of the simulation servers, shared by all the instances
+    telemetry = None
+    telemetry_lock = threading.Lock()
+    # Tree indexes of the library roots, shared by all the instances
+    tree_indexes = {}
+    tree_indexes_lock = threading.Lock()
+    # Latest cpu usage sample, so it is measured without waiting
+    cpu_lock = threading.Lock()
+    cpu_sample = None
+
     def __init__(self, root=None):
         '''Initializes the generated object.
 
@@ -81,6 +303,7 @@ class LibManager:
         self.root = Path.cwd() if root is None else Path(root)
         self.levels = None
         self.paths = []
+        self.clones = CloneManifest(self.root)
 
     def update(self):
 
@@ -118,15 +341,12 @@ class LibManager:
     
     def score_servers(self, responses, cpu_weight=0.35,
                      used_mem_weight=0.3, tot_mem_weight=0.2,
-                     num_cpus_weight=0.1, num_users_weight=0.05):
-        
-        servers_list = self.get_server_list()
-        hostname_by_ip = {ip:host_name for ip, host_name in zip(servers_list['ip_address'],
-                                                              servers_list['host_name'])}
-<<<<<<< HEAD
+                     num_cpus_weight=0.1, num_users_weight=0.05, hostname_by_ip=None):
         
-=======
->>>>>>> 1c6304a4c09f18c88dd2e91926471b4e2ffc3c7e
+        if hostname_by_ip is None:
+            servers_list = self.get_server_list()
+            hostname_by_ip = {ip:host_name for ip, host_name in zip(servers_list['ip_address'],
+                                                                  servers_list['host_name'])}
         results = {}
         data = []
         for response in responses:
@@ -176,7 +396,7 @@ class LibManager:
                                            'used_memory_GB': '',
                                            'num_users': '',
                                            'score': 'Connection error'} 
-                                    for host_name in servers_list['host_name']]
+                                    for host_name in hostname_by_ip.values()]
         return sorted_results
         
     def scan_servers(self, cpu_weight=0.35,
@@ -202,69 +422,58 @@ class LibManager:
         :rtype: dict
         """        
 
-        servers_list = self.get_server_list()
-        hostname_by_ip = {ip:host_name for ip, host_name in zip(servers_list['ip_address'],
-                                                              servers_list['host_name'])}
+        telemetry = self.start_telemetry()
+        telemetry.poll_all()
 
-        results = {}
-        data = []
-        with ThreadPoolExecutor(len(servers_list['ip_address'])) as tpe:
-            responses = [response for response in tpe.map(self.get_server_info,
-                                                          servers_list['ip_address'])]
-            for response in responses:
-                if isinstance(response, str): # Error of some sort
-                    results[hostname_by_ip[response]] = 'Connection error'
-                else: # Success
-                    results[response['host_name']] = response
-                    data += [response['cpu_per'], response['used_memory_per'],
-                             1/response['total_memory_GB'], 1/response['num_cpus'],
-                             len(response['users'])]
-        
-        sorted_servers = []
-        if data:
-            data_min = min(data)
-            data_range = max(data) - data_min
-            for host_name, result in results.items():
-                if result == 'Connection error':
-                    sorted_servers.append((host_name, np.inf))
-                else:
-                    score = ((result['cpu_per'] - data_min)/data_range*cpu_weight
-                             + (result['used_memory_per'] - data_min)/data_range*used_mem_weight
-                             + (1/result['total_memory_GB'] - data_min)/data_range*tot_mem_weight
-                             + (1/result['num_cpus'] - data_min)/data_range*num_cpus_weight
-                             + (len(result['users']) - data_min)/data_range*num_users_weight
-                    )
-                    sorted_servers.append((host_name, score))
+        return self.score_servers(telemetry.readings(), cpu_weight, used_mem_weight,
+                                  tot_mem_weight, num_cpus_weight, num_users_weight,
+                                  hostname_by_ip=telemetry.servers)
+
+    def start_telemetry(self, servers=None, **kwargs):
+        """Starts polling the simulation servers in the background, once
+        for all the instances.
+
+        :param servers: Host names of the servers by address. If None,
+        the stored list of servers is used, defaults to None
+        :type servers: dict[str, str] or NoneType, optional
+        :param kwargs: Polling settings, see :class:`ServerTelemetry()`
+        :return: Background poller of the servers
+        :rtype: :class:`ServerTelemetry()`
+        """
+
+        with LibManager.telemetry_lock:
+            if LibManager.telemetry is None:
+                if servers is None:
+                    servers_list = self.get_server_list()
+                    servers = dict(zip(servers_list['ip_address'], servers_list['host_name']))
+                LibManager.telemetry = ServerTelemetry(servers, **kwargs)
+                LibManager.telemetry.start()
+
+        return LibManager.telemetry
+
+    def stop_telemetry(self):
+        """Stops polling the simulation servers.
+        """
+
+        with LibManager.telemetry_lock:
+            if LibManager.telemetry is not None:
+                LibManager.telemetry.stop()
+                LibManager.telemetry = None
+
+    def servers_info(self, **weights):
+        """Scores the servers from their latest readings polled in the
+        background, without waiting for the servers.
+
+        :param weights: Weights of the scores, see :meth:`scan_servers`
+        :return: A sorted list of servers based on their score
+        from smaller (least used) to larger (most used)
+        :rtype: list[dict]
+        """
+
+        telemetry = self.start_telemetry()
+
+        return self.score_servers(telemetry.readings(), hostname_by_ip=telemetry.servers, **weights)
 
-            sorted_servers = sorted(sorted_servers, key=itemgetter(1))
-            sorted_results = []
-            for (host_name, score) in sorted_servers:
-                if score < np.inf:
-                    sorted_results.append({**results[host_name], **{'score': round(score, 3)}})
-                else:
-                    sorted_results.append({'host_name': host_name,
-                                           'cpu_per': '',
-                                           'num_cpus': '',
-                                           'total_memory_GB': '',
-                                           'used_memory_GB': '',
-                                           'num_users': '',
-                                           'score': 'Connection error'
-                                    })
-                # if score < np.inf:
-                #     sorted_results[host_name] = {**results[host_name], **{'score': round(score, 3)}}
-                # else:
-                #     sorted_results[host_name] = 'Connection error'
-        else:
-            sorted_results = [{'host_name': host_name,
-                                           'cpu_per': '',
-                                           'num_cpus': '',
-                                           'total_memory_GB': '',
-                                           'used_memory_GB': '',
-                                           'num_users': '',
-                                           'score': 'Connection error'} 
-                                    for host_name in servers_list['host_name']]
-        return sorted_results
-    
     def get_resource_info(self):
         """Obtains machine resources information.
 
@@ -273,14 +482,7 @@ class LibManager:
         :rtype: dict
         """        
 
-        while True:
-            try:
-                cpu_percent = round(np.mean([cpu for cpu in psutil.cpu_percent(interval=1, percpu=True)
-                                             if cpu > 0])
-                            )
-                break
-            except ValueError:
-                pass
+        cpu_percent = self.cpu_usage()
         users = [user for user in psutil.users() if user.host is not None]
         # Check drives are not a mapped path
         drives = []
@@ -303,6 +505,29 @@ class LibManager:
                 'port': cfg.BACKEND_PORT
             }
     
+    @classmethod
+    def cpu_usage(cls, min_interval=1):
+        """Mean usage of the busy cpus since the previous sample. A new
+        sample is taken when the previous one is older than min_interval,
+        so the usage is obtained without waiting, except the first time.
+
+        :param min_interval: Minimum seconds between two samples, defaults to 1
+        :type min_interval: float, optional
+        :return: Cpu usage in %
+        :rtype: int
+        """
+
+        with cls.cpu_lock:
+            if cls.cpu_sample is None:
+                cpus = psutil.cpu_percent(interval=min_interval, percpu=True)
+                cls.cpu_sample = (time.monotonic(), cpus)
+            elif time.monotonic() - cls.cpu_sample[0] >= min_interval:
+                cpus = psutil.cpu_percent(interval=None, percpu=True)
+                cls.cpu_sample = (time.monotonic(), cpus)
+            cpus = [cpu for cpu in cls.cpu_sample[1] if cpu > 0]
+
+        return round(np.mean(cpus)) if cpus else 0
+
     def get_server_list(self):
         """Reads a stored list of simulation server names and ip addresses.
 
@@ -322,34 +547,89 @@ class LibManager:
         :rtype: dict
         """
 
+        # Sizes and dates are read from the folder itself, the tree index
+        # only tracks entries added or removed and would return stale ones
+        dirs, files = {}, {}
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        stat = None
+                    if entry.is_dir():
+                        dirs[entry.name] = stat.st_mtime_ns if stat else None
+                    else:
+                        files[entry.name] = [stat.st_size, stat.st_mtime_ns] if stat else [None, None]
+        except OSError:
+            pass
+
         path_info = {'dirs': [], 'files': []}
-        for content in Path(path).glob('*'):
-            try:
-                date_time = datetime.fromtimestamp(content.stat().st_mtime).strftime("%m/%d/%Y %r")
-            except OSError:
-                date_time = ''
-            if content.is_file():
-                size = content.stat().st_size
-                if size < 1024:
-                    size = f'{size} B'
-                elif 1024 < size < 1024**2:
-                    size = f'{math.ceil(size/1024)} KB'
-                elif 1024**2 < size < 1024**3:
-                    size = f'{math.ceil(size/1024**2)} MB'   
-                else:
-                    size = f'{math.ceil(size/1024**3)} GB'
-                path_info['files'].append({'name': content.name,
-                                            'date_modified': date_time,
-                                            'size': size,
-                                            'file_type': 'file'})
+        for name, (size, mtime) in files.items():
+            if mtime is None:
+                continue
+            date_time = datetime.fromtimestamp(mtime/1e9).strftime("%m/%d/%Y %r")
+            if size < 1024:
+                size = f'{size} B'
+            elif 1024 < size < 1024**2:
+                size = f'{math.ceil(size/1024)} KB'
+            elif 1024**2 < size < 1024**3:
+                size = f'{math.ceil(size/1024**2)} MB'   
             else:
-                path_info['dirs'].append({'name': content.name,
+                size = f'{math.ceil(size/1024**3)} GB'
+            path_info['files'].append({'name': name,
                                         'date_modified': date_time,
-                                        'size': '',
-                                        'file_type': 'dir'})
+                                        'size': size,
+                                        'file_type': 'file'})
+        for name, mtime in dirs.items():
+            date_time = '' if mtime is None else datetime.fromtimestamp(mtime/1e9).strftime("%m/%d/%Y %r")
+            path_info['dirs'].append({'name': name,
+                                    'date_modified': date_time,
+                                    'size': '',
+                                    'file_type': 'dir'})
 
         return path_info
 
+    def tree_index(self, root=None):
+        """Index of the folders and files under a root folder, built once
+        and shared by all the instances.
+
+        :param root: Root folder. If None, the library root is used, defaults to None
+        :type root: str, optional
+        :rtype: :class:`tree_index.TreeIndex()`
+        """
+
+        root = os.path.abspath(self.root if root is None else root)
+        with LibManager.tree_indexes_lock:
+            if root not in LibManager.tree_indexes:
+                LibManager.tree_indexes[root] = TreeIndex(root)
+
+            return LibManager.tree_indexes[root]
+
+    def subtree(self, path=None, depth=1, offset=0, limit=None, file_types=None, dirs_only=False):
+        """Part of the library tree under a folder, for lazy browsing,
+        see :meth:`tree_index.TreeIndex.subtree`.
+
+        :param path: Folder path, absolute or relative to the library root.
+        If None, the library root is used, defaults to None
+        :type path: str, optional
+        :param depth: Number of levels of children returned, defaults to 1
+        :type depth: int, optional
+        :param offset: Index of the first child of the folder returned, defaults to 0
+        :type offset: int, optional
+        :param limit: Maximum number of children returned at each level.
+        If None, all the children are returned, defaults to None
+        :type limit: int, optional
+        :param file_types: Only return the files with these extensions.
+        If None, all the files are returned, defaults to None
+        :type file_types: list[str], optional
+        :param dirs_only: Only return the folders, defaults to False
+        :type dirs_only: bool, optional
+        :rtype: dict
+        """
+
+        return self.tree_index().subtree(path, depth, offset, limit, file_types, dirs_only)
+
     def tree(self, root=None, verbose=True):
         '''Prints out the entire directory tree starting at the root.
 
@@ -382,20 +662,61 @@ class LibManager:
     def add_folder(self, path):
 
         Path.mkdir(Path(path))
+        self._tree_changed(path)
 
     def delete_folder(self, path):
 
-        shutil.rmtree(path)
+        self.clones.rmtree(path)
+        self._tree_changed(path)
+
+    def _clone(self, src_paths, dst_paths):
+
+        # File contents are shared with the source when possible, see :meth:`materialize`
+        totals = {method: 0 for method in ('reflink', 'hardlink', 'copy')}
+        for src_path, dst_path in zip(src_paths, dst_paths):
+            stats = clone_tree(src_path, dst_path, self.clones, cfg.LIB_CLONE_MODE,
+                               cfg.LIB_CLONE_MIN_LINK_SIZE)
+            for method in totals:
+                totals[method] += stats[method]['files']
+        logger.info(f"Cloned {totals['reflink']} files by reflink, {totals['hardlink']} "
+                    f"by hardlink and copied {totals['copy']} files")
+
+    def materialize(self, path):
+        '''Gives a file or all the files under a folder their own copy, if
+        they are hardlinked to a cloned project, see cfg.LIB_CLONE_MODE. Shared
+        files must be materialized before they are written in place.
+        Layouts saved by :class:`speed.Database()` and HSPICE outputs are
+        materialized automatically.
+
+        :param path: File or folder path
+        :type path: str
+        :return: Number of materialized files
+        :rtype: int
+        '''
+
+        if os.path.isdir(path):
+            return self.clones.materialize_tree(path)
+        return int(self.clones.materialize(path))
+
+    def _tree_changed(self, path=None):
+
+        # Folders modified by the library operations are checked again,
+        # instead of waiting for max_age of the tree indexes
+        path = Path(os.path.abspath(self.root if path is None else path))
+        with LibManager.tree_indexes_lock:
+            indexes = list(LibManager.tree_indexes.values())
+        for index in indexes:
+            if index.root == path or index.root in path.parents:
+                index.invalidate(path)
+            elif path in index.root.parents:
+                index.invalidate()
 
     def path_to_dict(self, root=None):
         root = Path(self.root) if root is None else Path(root)
 
-        d = {'name': os.path.basename(root)}
-        if os.path.isdir(root):
-            d['children'] = [self.path_to_dict(os.path.join(root,x)) for x in os.listdir(root)]
-        else:
-            d['type'] = "file"
-        return d
+        if not os.path.isdir(root):
+            return {'name': os.path.basename(root), 'type': "file"}
+        return self.tree_index(root).to_dict()
 
     def delete_rail(self, project_name, rail_name):
         '''Deletes a power supply rail and its subsequent folders and files from the project.
@@ -406,7 +727,8 @@ class LibManager:
         :type rail_name: str
         '''
 
-        shutil.rmtree(Path(self.root, project_name, rail_name))
+        self.clones.rmtree(Path(self.root, project_name, rail_name))
+        self._tree_changed(Path(self.root, project_name))
 
     def new_rail(self, project_name, study_name, rail_name, copy_rail=None):
         '''Creates a new power supply rail and its subsequent folders in a specific project.
@@ -438,8 +760,8 @@ class LibManager:
             dst_paths = self.paths
             self.paths = []
 
-            for src_path, dst_path in zip(src_paths, dst_paths):
-                shutil.copytree(src_path, dst_path)
+            self._clone(src_paths, dst_paths)
+        self._tree_changed(Path(self.root, project_name))
 
     def delete_study(self, project_name, study_name, rail_name):
         '''Deletes a study and its subsequent folders and files from the project.
@@ -455,7 +777,8 @@ class LibManager:
         folders = ProjectLevels(project_name, study_name, rail_name)
 
         for stem_path in folders.level1[rail_name]:
-            shutil.rmtree(Path(self.root, project_name, rail_name, stem_path))
+            self.clones.rmtree(Path(self.root, project_name, rail_name, stem_path))
+        self._tree_changed(Path(self.root, project_name))
 
     def new_study(self, project_name, study_name, rail_name, copy_study=None):
         '''Creates a new study and its subsequent folders in a specific project.
@@ -487,8 +810,8 @@ class LibManager:
             dst_paths = self.paths
             self.paths = []
 
-            for src_path, dst_path in zip(src_paths, dst_paths):
-                _ = shutil.copytree(src_path, dst_path)
+            self._clone(src_paths, dst_paths)
+        self._tree_changed(Path(self.root, project_name))
 
     def delete_project(self, project_name):
         '''Deletes a project and all its subsequent folders and files.
@@ -497,7 +820,8 @@ class LibManager:
         :type project_name: str
         '''
 
-        shutil.rmtree(Path(self.root, project_name))
+        self.clones.rmtree(Path(self.root, project_name))
+        self._tree_changed(Path(self.root, project_name))
 
     def new_project(self, project_name, study_name, rail_name, copy_project=None):
         '''Creates a new project and its subsequent folders.
@@ -535,9 +859,9 @@ class LibManager:
             dst_paths = self.paths
             self.paths = []
 
-            for src_path, dst_path in zip(src_paths, dst_paths):
-                _ = shutil.copytree(src_path, dst_path)
-    
+            self._clone(src_paths, dst_paths)
+        self._tree_changed(Path(self.root, project_name))
+
     def _create_folder_struct(self, idx_level, path):
         '''Recursively scan dictionaries to produce paths of the project.
 
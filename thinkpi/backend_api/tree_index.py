@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+
+from thinkpi import logger
+
+
+class TreeIndex:
+    '''Index of the folders and files under a root folder, kept on disk.
+
+    The index is built once, then each folder is checked with a single
+    stat of its modification time and listed again only when it changed,
+    i.e. when entries were added, removed or renamed in it. Folders checked
+    less than max_age seconds ago are not checked again. Folders modified
+    within the file system time resolution of their listing are listed
+    again on their next check, so no change is missed.
+
+    Folders are identified by their path relative to the root, with '/'
+    separators, the root being ''.
+    '''
+
+    version = 1
+
+    def __init__(self, root, index_dir=None, max_age=2):
+        '''Initialization of the :class:`TreeIndex()` class
+
+        :param root: Root folder
+        :type root: str
+        :param index_dir: Folder of the index files. If None,
+        .thinkpi/tree_index in the user home folder is used, defaults to None
+        :type index_dir: str, optional
+        :param max_age: Seconds during which a checked folder is not
+        checked again, defaults to 2
+        :type max_age: float, optional
+        '''
+
+        self.root = Path(os.path.abspath(root))
+        if index_dir is None:
+            index_dir = Path.home() / '.thinkpi' / 'tree_index'
+        self.index_path = (Path(index_dir)
+                           / f"{hashlib.md5(str(self.root).encode()).hexdigest()}.json")
+        self.max_age = max_age
+        self.lock = threading.RLock()
+        self.dirs = {}
+        self.checked = {}
+        self.modified = False
+        self.load()
+
+    def load(self):
+
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get('version') == self.version and index.get('root') == str(self.root):
+            self.dirs = index['dirs']
+
+    def save(self):
+        '''Write the index to disk if it changed.
+        '''
+
+        with self.lock:
+            if not self.modified:
+                return
+            index = {'version': self.version, 'root': str(self.root), 'dirs': self.dirs}
+            self.modified = False
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_name(f'{self.index_path.name}.{uuid.uuid4().hex}.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f'Tree index of {self.root} is not saved: {e}')
+
+    def full_path(self, rel):
+
+        return self.root / rel if rel else self.root
+
+    def rel_path(self, path):
+        '''Path relative to the root, as used by the index.
+
+        :param path: Absolute path or path relative to the root
+        :type path: str
+        :raises ValueError: The path is not under the root
+        :rtype: str
+        '''
+
+        if path is None or str(path) in ('', '.'):
+            return ''
+        path = Path(path)
+        if path.is_absolute():
+            path = Path(os.path.abspath(path)).relative_to(self.root)
+        rel = path.as_posix()
+        if rel == '.' or '..' in path.parts:
+            raise ValueError(f'{path} is not under {self.root}')
+        return rel
+
+    @staticmethod
+    def _join(rel, name):
+
+        return f'{rel}/{name}' if rel else name
+
+    def _scan(self, rel, mtime):
+
+        dirs, files = {}, {}
+        with os.scandir(self.full_path(rel)) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                    stat = entry.stat()
+                except OSError:
+                    is_dir, stat = False, None
+                if is_dir:
+                    dirs[entry.name] = stat.st_mtime_ns if stat else None
+                else:
+                    files[entry.name] = [stat.st_size, stat.st_mtime_ns] if stat else [None, None]
+
+        old = self.dirs.get(rel)
+        if old is not None:
+            for name in set(old['dirs']) - set(dirs):
+                self._drop(self._join(rel, name))
+        # A folder modified during its listing may have changed after it
+        self.dirs[rel] = {'mtime': mtime, 'stable': time.time_ns() - mtime > 2e9,
+                          'dirs': dirs, 'files': files}
+        self.modified = True
+
+        return self.dirs[rel]
+
+    def _drop(self, rel):
+
+        prefix = f'{rel}/'
+        for key in [key for key in self.dirs if key == rel or key.startswith(prefix)]:
+            del self.dirs[key]
+            self.checked.pop(key, None)
+        self.modified = True
+
+    def node(self, rel):
+        '''Listing of a folder, listed again if it changed on disk.
+
+        :param rel: Folder path relative to the root
+        :type rel: str
+        :return: Folder modification time, sub-folder modification times
+        and file sizes and modification times by name, or None if the
+        folder does not exist
+        :rtype: dict or NoneType
+        '''
+
+        with self.lock:
+            node = self.dirs.get(rel)
+            now = time.monotonic()
+            if node is not None and now - self.checked.get(rel, -self.max_age - 1) < self.max_age:
+                return node
+            try:
+                mtime = os.stat(self.full_path(rel)).st_mtime_ns
+            except OSError:
+                if rel in self.dirs:
+                    self._drop(rel)
+                return None
+            if node is None or node['mtime'] != mtime or not node['stable']:
+                try:
+                    node = self._scan(rel, mtime)
+                except OSError:
+                    return None
+            self.checked[rel] = now
+
+            return node
+
+    def invalidate(self, path=None):
+        '''Check the folders again on their next use, e.g. after they
+        are modified. The listings are kept and listed again only if the
+        folders changed.
+
+        :param path: Only check again this folder and the folders under
+        it, defaults to None
+        :type path: str, optional
+        '''
+
+        with self.lock:
+            if path is None:
+                self.checked.clear()
+                return
+            rel = self.rel_path(path)
+            prefix = f'{rel}/'
+            for key in [key for key in self.checked
+                        if not rel or key == rel or key.startswith(prefix)]:
+                del self.checked[key]
+            # The parent folder lists the folder
+            parent = rel.rpartition('/')[0]
+            self.checked.pop(parent, None)
+
+    def walk(self, rel=''):
+        '''Update the index of all the folders under a folder.
+
+        :param rel: Folder path relative to the root, defaults to ''
+        :type rel: str, optional
+        '''
+
+        to_visit = [rel]
+        while to_visit:
+            rel = to_visit.pop()
+            node = self.node(rel)
+            if node is not None:
+                to_visit.extend(self._join(rel, name) for name in node['dirs'])
+        self.save()
+
+    def to_dict(self, rel=''):
+        '''Nested dictionary of the folders and files under a folder, as
+        returned by :meth:`LibManager.path_to_dict`.
+
+        :param rel: Folder path relative to the root, defaults to ''
+        :type rel: str, optional
+        :rtype: dict
+        '''
+
+        self.walk(rel)
+
+        def build(rel, name):
+            node = self.dirs.get(rel)
+            if node is None:
+                return {'name': name, 'children': []}
+            children = [build(self._join(rel, child), child) for child in sorted(node['dirs'])]
+            children += [{'name': child, 'type': 'file'} for child in sorted(node['files'])]
+            return {'name': name, 'children': children}
+
+        with self.lock:
+            return build(rel, self.full_path(rel).name)
+
+    def subtree(self, path=None, depth=1, offset=0, limit=None, file_types=None, dirs_only=False):
+        '''Part of the tree under a folder, for lazy browsing. Folders
+        deeper than depth are returned without their children.
+
+        :param path: Folder path, absolute or relative to the root. If None,
+        the root is used, defaults to None
+        :type path: str, optional
+        :param depth: Number of levels of children returned, defaults to 1
+        :type depth: int, optional
+        :param offset: Index of the first child of the folder returned, defaults to 0
+        :type offset: int, optional
+        :param limit: Maximum number of children returned at each level.
+        If None, all the children are returned, defaults to None
+        :type limit: int, optional
+        :param file_types: Only return the files with these extensions,
+        e.g. ['.spd', '.sp']. If None, all the files are returned, defaults to None
+        :type file_types: list[str], optional
+        :param dirs_only: Only return the folders, defaults to False
+        :type dirs_only: bool, optional
+        :raises ValueError: The path is not under the root
+        :raises FileNotFoundError: The folder does not exist
+        :return: Name, path relative to the root, modification time and
+        children of the folder. Each child has a name, path, type ('dir'
+        or 'file'), modification time, size for files, and for folders
+        whether it has children. total and has_more tell the number of
+        children and if more can be requested with a larger offset
+        :rtype: dict
+        '''
+
+        rel = self.rel_path(path)
+        if file_types is not None:
+            file_types = {ext.lower() if ext.startswith('.') else f'.{ext.lower()}'
+                          for ext in file_types}
+
+        def build(rel, level, offset=0):
+            node = self.node(rel)
+            if node is None:
+                return None
+            children = [{'name': name, 'path': self._join(rel, name), 'type': 'dir',
+                         'mtime': mtime} for name, mtime in sorted(node['dirs'].items(),
+                                                                   key=lambda item: item[0].lower())]
+            if not dirs_only:
+                children += [{'name': name, 'path': self._join(rel, name), 'type': 'file',
+                              'mtime': mtime, 'size': size}
+                             for name, (size, mtime) in sorted(node['files'].items(),
+                                                               key=lambda item: item[0].lower())
+                             if file_types is None or Path(name).suffix.lower() in file_types]
+            total = len(children)
+            children = children[offset:None if limit is None else offset + limit]
+            for child in children:
+                if child['type'] != 'dir':
+                    continue
+                if level < depth:
+                    sub = build(child['path'], level + 1)
+                    child.update(sub if sub is not None else {'children': [], 'total': 0,
+                                                              'has_more': False})
+                else:
+                    sub = self.dirs.get(child['path'])
+                    # Unknown until the folder is listed
+                    child['has_children'] = (None if sub is None
+                                             else bool(sub['dirs'] or sub['files']))
+            return {'children': children, 'total': total,
+                    'has_more': offset + len(children) < total}
+
+        result = build(rel, 1, offset)
+        if result is None:
+            raise FileNotFoundError(f'{self.full_path(rel)} does not exist')
+        self.save()
+
+        return {'name': self.full_path(rel).name, 'path': rel, 'type': 'dir',
+                'mtime': self.dirs[rel]['mtime'], **result}
@@ -86,3 +86,26 @@ HS_ADHESIVE_MATERIAL = 'TIM_2'
 IC_MATERIAL = 'MoldingCompound' # Name depends on the ET_LGA_MATERIAL_FILE
 IC_THICKNESS = 0.5e-3 # In meters
 IC_TEMPERATURE = 105 # in ⁰C
+
+# Parallel processing
+# -------------------
+PORT_PLACEMENT_WORKERS = 2 # Worker processes for multi-net port placement, per job. Kept low since the backend runs several jobs at once. None uses the number of CPUs, 1 runs serially
+IDEM_OPT_WORKERS = 4 # IdemOptimizer bandwidth candidates evaluated at the same time
+
+# IDEM optimizer
+# --------------
+IDEM_OPT_STRATEGY = 'random' # Candidate search strategy: 'grid', 'random' or 'surrogate'
+
+# Backend
+# -------
+LAYOUT_CACHE_MAX_MEMORY = 16e9 # Memory budget in bytes of the layouts loaded by the backend. None never evicts them
+LAYER_TILE_PIXELS = 256 # Width in pixels of the layer geometry tiles served to the layout viewer
+LAYER_TILE_CACHE_MAX_MEMORY = 512e6 # Memory budget in bytes of the encoded layer geometry tiles
+LAYER_TILE_MAX_LEVEL = 12 # Deepest zoom level of the layer geometry tiles
+SERVER_TELEMETRY = False # Poll the simulation servers in the background from startup, only enabled on the front-end server
+SERVER_POLL_INTERVAL = 30 # Seconds between two polls of the resource information of a simulation server
+SERVER_POLL_TIMEOUT = 5 # Seconds to wait for a simulation server to answer a poll
+SERVER_POLL_MAX_BACKOFF = 600 # Maximum seconds between two polls of a simulation server that keeps failing
+SERVER_READING_MAX_AGE = 300 # Seconds after which a server reading is too old to score the server
+LIB_CLONE_MODE = 'reflink' # Copied projects, studies and rails: 'reflink' reflinks or copies the files, 'hardlink' also hardlinks them where reflinks are not supported, 'copy' copies them
+LIB_CLONE_MIN_LINK_SIZE = 1e6 # Minimum size in bytes of the files hardlinked when copying a project
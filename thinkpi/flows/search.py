@@ -0,0 +1,341 @@
+import os
+import json
+import warnings
+from pathlib import Path
+from threading import Event, Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+from scipy.stats import norm
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import Matern, WhiteKernel, ConstantKernel
+
+from thinkpi import logger
+
+
+def _point_key(params):
+
+    return tuple(sorted((name, float(value)) for name, value in params.items()))
+
+
+class EvalHistory:
+    '''Evaluated points of a search, persisted to a JSON file after
+    every evaluation so an interrupted search can be resumed.
+
+    The file also stores the settings of the search, i.e. everything
+    changing the score of a point besides its parameters. The stored
+    points are only resumed by a search with the same settings.
+    '''
+
+    def __init__(self, fname=None, resume=True, settings=None):
+        '''Initialization of the :class:`EvalHistory()` class
+
+        :param fname: JSON file storing the evaluated points. If None,
+        the points are only kept in memory, defaults to None
+        :type fname: str, optional
+        :param resume: Load the points already stored in the file, defaults to True
+        :type resume: bool, optional
+        :param settings: Settings of the search, must be serializable
+        to JSON, defaults to None
+        :type settings: dict, optional
+        '''
+
+        self.fname = None if fname is None else Path(fname)
+        self.settings = json.loads(json.dumps(settings, default=str))
+        self.lock = Lock()
+        self.points = []
+        if resume and self.fname is not None and self.fname.exists():
+            try:
+                stored = json.loads(self.fname.read_text())
+            except json.JSONDecodeError:
+                logger.warning(f'Could not read {self.fname}, starting a new search')
+            else:
+                # Files without settings were written before they were stored
+                if isinstance(stored, list):
+                    stored = {'settings': None, 'points': stored}
+                if stored.get('settings') == self.settings:
+                    self.points = stored['points']
+                else:
+                    logger.warning(f'Points in {self.fname} were evaluated with other '
+                                   f'settings, starting a new search')
+        self.keys = {_point_key(point['params']) for point in self.points}
+
+    def __len__(self):
+
+        return len(self.points)
+
+    def __contains__(self, params):
+
+        return _point_key(params) in self.keys
+
+    def add(self, params, score):
+        '''Record an evaluated point.
+
+        :param params: Parameters of the point
+        :type params: dict
+        :param score: Score of the point, lower is better. Failed
+        evaluations are stored with an infinite score.
+        :type score: float
+        '''
+
+        with self.lock:
+            self.points.append({'params': {name: float(value) for name, value in params.items()},
+                                'score': None if not np.isfinite(score) else float(score)})
+            self.keys.add(_point_key(params))
+            if self.fname is not None:
+                tmp_fname = self.fname.with_suffix(f'.{os.getpid()}.tmp')
+                tmp_fname.write_text(json.dumps({'settings': self.settings,
+                                                 'points': self.points}, indent=1))
+                os.replace(tmp_fname, self.fname)
+
+    @property
+    def observed(self):
+        '''Evaluated points and their scores. Failed evaluations
+        have an infinite score.
+
+        :rtype: list[tuple[dict, float]]
+        '''
+
+        return [(point['params'], np.inf if point['score'] is None else point['score'])
+                for point in self.points]
+
+    @property
+    def best(self):
+        '''Parameters and score of the best evaluated point.
+
+        :rtype: tuple[dict, float]
+        '''
+
+        return min(self.observed, key=lambda point: point[1], default=(None, np.inf))
+
+
+class SearchStrategy:
+    '''Base class of the search strategies. A strategy picks the next
+    point to evaluate among the candidate points not evaluated yet.
+    '''
+
+    def __init__(self, seed=None):
+
+        self.rng = np.random.default_rng(seed)
+        self.candidates = []
+
+    def setup(self, candidates):
+        '''Called once before the search starts.
+
+        :param candidates: All the points of the search space
+        :type candidates: list[dict]
+        '''
+
+        self.candidates = candidates
+
+    def suggest(self, remaining, observed, pending):
+        '''Pick the next point to evaluate.
+
+        :param remaining: Candidate points not evaluated nor being evaluated
+        :type remaining: list[dict]
+        :param observed: Evaluated points and their scores
+        :type observed: list[tuple[dict, float]]
+        :param pending: Points being evaluated
+        :type pending: list[dict]
+        :return: Next point
+        :rtype: dict
+        '''
+
+        raise NotImplementedError
+
+
+class GridSearch(SearchStrategy):
+    '''Evaluates the candidate points in order.
+    '''
+
+    def suggest(self, remaining, observed, pending):
+
+        return remaining[0]
+
+
+class RandomSearch(SearchStrategy):
+    '''Evaluates the candidate points in random order.
+    '''
+
+    def suggest(self, remaining, observed, pending):
+
+        return remaining[self.rng.integers(len(remaining))]
+
+
+class SurrogateSearch(SearchStrategy):
+    '''Bayesian optimization of the candidate points. A Gaussian process
+    is fitted to the logarithm of the scores evaluated so far and the point
+    with the largest expected improvement is evaluated next. Points being
+    evaluated are included with the mean observed score, so concurrent
+    evaluations explore different regions.
+    '''
+
+    def __init__(self, n_init=5, xi=0.01, seed=None):
+        '''Initialization of the :class:`SurrogateSearch()` class
+
+        :param n_init: Number of random points evaluated before
+        the surrogate model is used, defaults to 5
+        :type n_init: int, optional
+        :param xi: Exploration margin of the expected improvement, defaults to 0.01
+        :type xi: float, optional
+        :param seed: Seed of the random generator, defaults to None
+        :type seed: int, optional
+        '''
+
+        super().__init__(seed)
+        self.n_init = n_init
+        self.xi = xi
+        self.scales = {}
+
+    def setup(self, candidates):
+
+        super().setup(candidates)
+        # Parameters spanning more than a decade are scaled logarithmically
+        self.scales = {}
+        for name in candidates[0]:
+            values = np.array([cand[name] for cand in candidates], dtype=float)
+            log = values.min() > 0 and values.max() >= 10*values.min()
+            if log:
+                values = np.log10(values)
+            self.scales[name] = (log, values.min(), max(np.ptp(values), 1e-12))
+
+    def encode(self, points):
+        '''Scale points to the unit hypercube.
+
+        :param points: Points of the search space
+        :type points: list[dict]
+        :return: Scaled points, one row per point
+        :rtype: numpy.ndarray
+        '''
+
+        x = np.empty((len(points), len(self.scales)))
+        for col, (name, (log, low, span)) in enumerate(self.scales.items()):
+            values = np.array([point[name] for point in points], dtype=float)
+            x[:, col] = ((np.log10(values) if log else values) - low)/span
+
+        return x
+
+    def suggest(self, remaining, observed, pending):
+
+        scores = np.array([score for _, score in observed], dtype=float)
+        finite = np.isfinite(scores) & (scores > 0)
+        if finite.sum() < self.n_init:
+            return remaining[self.rng.integers(len(remaining))]
+
+        y = np.log10(np.where(finite, scores, 1))
+        # Failed evaluations are penalized instead of being ignored
+        y[~finite] = y[finite].max() + 1
+        best = y[finite].min()
+        x = self.encode([params for params, _ in observed] + list(pending))
+        y = np.concatenate([y, np.full(len(pending), y[finite].mean())])
+        kernel = (ConstantKernel(1.0, (1e-3, 1e3))*Matern(0.2, (1e-2, 1e1), nu=2.5)
+                  + WhiteKernel(1e-4, (1e-8, 1e-1)))
+        gp = GaussianProcessRegressor(kernel, normalize_y=True,
+                                      random_state=int(self.rng.integers(2**31)))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', ConvergenceWarning)
+            gp.fit(x, y)
+
+        mean, std = gp.predict(self.encode(remaining), return_std=True)
+        std = np.maximum(std, 1e-12)
+        improvement = best - mean - self.xi
+        z = improvement/std
+        expected_imp = improvement*norm.cdf(z) + std*norm.pdf(z)
+
+        return remaining[int(np.argmax(expected_imp))]
+
+
+STRATEGIES = {'grid': GridSearch, 'random': RandomSearch, 'surrogate': SurrogateSearch}
+
+
+def get_strategy(strategy):
+    '''Create a search strategy from its name.
+
+    :param strategy: 'grid', 'random', 'surrogate' or a strategy object
+    :type strategy: str or SearchStrategy
+    :return: Search strategy
+    :rtype: SearchStrategy
+    '''
+
+    if isinstance(strategy, SearchStrategy):
+        return strategy
+    try:
+        return STRATEGIES[strategy.lower()]()
+    except KeyError:
+        raise ValueError(f'Unknown search strategy {strategy}, '
+                         f'use one of {list(STRATEGIES)}') from None
+
+
+def run_search(strategy, candidates, evaluate, workers=1, max_evals=None,
+               target=None, history=None, skip=None, stop=None):
+    '''Search the candidate point with the lowest score.
+
+    :param strategy: Search strategy
+    :type strategy: SearchStrategy
+    :param candidates: All the points of the search space
+    :type candidates: list[dict]
+    :param evaluate: Function scoring a point, lower is better. When it
+    returns None the point is considered not evaluated and is not recorded.
+    :type evaluate: callable
+    :param workers: Number of points evaluated at the same time, defaults to 1
+    :type workers: int, optional
+    :param max_evals: Maximum number of evaluated points, including the
+    ones loaded from the history. If None, all the candidates can be
+    evaluated, defaults to None
+    :type max_evals: int, optional
+    :param target: Stop once a point reaches this score, defaults to None
+    :type target: float, optional
+    :param history: Evaluated points. Points already in the history are
+    not evaluated again, defaults to None
+    :type history: EvalHistory, optional
+    :param skip: Function returning True for points that must not be
+    evaluated anymore, defaults to None
+    :type skip: callable, optional
+    :param stop: Event set when the search stops, defaults to None
+    :type stop: threading.Event, optional
+    :return: History of the evaluated points
+    :rtype: EvalHistory
+    '''
+
+    history = EvalHistory() if history is None else history
+    stop = Event() if stop is None else stop
+    max_evals = len(candidates) if max_evals is None else max_evals
+    strategy.setup(candidates)
+    remaining = [cand for cand in candidates if cand not in history]
+    if len(history):
+        logger.info(f'Resuming search, {len(history)} points already evaluated, '
+                    f'best score = {history.best[1]:.3e}')
+
+    def reached():
+        return target is not None and history.best[1] <= target
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            if reached() and not stop.is_set():
+                logger.info(f'Target score {target:.3e} is reached')
+                stop.set()
+            if skip is not None:
+                remaining = [cand for cand in remaining if not skip(cand)]
+            while (not stop.is_set() and remaining
+                    and len(history) + len(running) < max_evals
+                    and len(running) < workers):
+                params = strategy.suggest(remaining, history.observed,
+                                          list(running.values()))
+                remaining.remove(params)
+                running[pool.submit(evaluate, params)] = params
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                params = running.pop(future)
+                score = future.result()
+                if score is None:
+                    continue
+                history.add(params, score)
+                logger.info(f'{len(history)}/{min(max_evals, len(candidates))} points evaluated, '
+                            f'best score = {history.best[1]:.3e}')
+    stop.set()
+
+    return history
@@ -1,17 +1,20 @@
 import os
+import hashlib
 import shutil
 from typing import List
 from copy import copy
 from operator import itemgetter, attrgetter
 from collections import defaultdict
+from itertools import count
 import re
 import subprocess
 from pathlib import Path
-from random import shuffle
 import time
 import glob
 from threading import Thread
 from threading import Event
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import xml.etree.ElementTree as ET
 import pandas as pd
@@ -22,14 +25,15 @@ from scipy import interpolate
 from dataclasses import dataclass
 from sklearn.metrics import mean_squared_error
 import skrf as rf
-from scipy.interpolate import interp1d
 
 from thinkpi.tools import hspice_deck
 from thinkpi.tools import hspice
 from thinkpi.tools import idem
+from thinkpi.tools import sysutils
 from thinkpi.operations import loader as ld
 from thinkpi.operations import speed as spd
 from thinkpi.flows.tcl import Tcl
+from thinkpi.flows import search
 from thinkpi.flows.simplis_cmds import SimplisCommands
 from thinkpi.operations import pman as pm
 from thinkpi.config import thinkpi_conf as cfg
@@ -39,6 +43,9 @@ from thinkpi import _thinkpi_path, logger
 class TasksBase:
 
     cmds = []
+    # Log lines of a failed Sigrity tcl command. Warnings and counts of
+    # zero failures, e.g. '0 failed', are not failures
+    tcl_error_pattern = r'^(?!.*WARNING).*(?:\bERROR\b|(?<!\b0 )\bfailed\b)'
 
     def __init__(self, db_fname=None):
         
@@ -400,67 +407,42 @@ class TasksBase:
         logger.info(f'TCL file is created and saved {tcl_fname}')
         return tcl_fname
     
-    def _print_tcl_lines(lines):
-
-        for line in lines:
-            if '--' in line:
-                line = line.split('--')[1]
-            line = line.strip(' ')
-            if 'WARNING' in line:
-                logger.warning(line)
-            elif 'ERROR' in line or 'failed' in line:
-                logger.error(line)
-            else:
-                logger.info(line)
+    @staticmethod
+    def _log_tcl_line(line):
+
+        if '--' in line:
+            line = line.split('--')[1]
+        line = line.strip(' ')
+        if 'WARNING' in line:
+            logger.warning(line)
+        elif re.search(TasksBase.tcl_error_pattern, line):
+            logger.error(line)
+        else:
+            logger.info(line)
     
     def stream_log(self, event, tcl_fname):
+        '''Print the log file of a running tcl file until the event is set.
+        Only the newly appended lines of the log file are read.
 
-        # Detect the newly log file name
-        start_time = time.time()
-        path = Path(tcl_fname).parent
-        
-        def find_log_file():
-            while True:
-                try:
-                    log_fname = max(path.glob(f'{Path(self.db.name).stem}*.log'),
-                                    key=os.path.getctime)
-                    if log_fname.stat().st_mtime > start_time:
-                        return log_fname
-                except ValueError:
-                    time.sleep(1)
-
-        # Monitor for modifications and print log file content
-        last_line = 0
-        stop_thread = False
-        log_fname = find_log_file()
-        while not stop_thread:
-            if event.is_set():
-                stop_thread = True
-            try:
-                mod_time = Path(log_fname).stat().st_mtime
-            except FileNotFoundError:
-                log_fname = find_log_file()
-
-            if  mod_time > start_time:
-                start_time = time.time() #mod_time
-                lines = Path(log_fname).read_text().split('\n')
-                #logger.info(lines[last_line:-1])
-                #_print_tcl_lines(lines[last_line:-1])
-                for line in lines[last_line:-1]:
-                    if '--' in line:
-                        line = line.split('--')[1]
-                    line = line.strip(' ')
-                    if 'WARNING' in line:
-                        logger.warning(line)
-                    elif 'ERROR' in line or 'failed' in line:
-                        logger.error(line)
-                    else:
-                        logger.info(line)
-                last_line = len(lines)
-            time.sleep(1)
+        :param event: Event that is set when the run is finished
+        :type event: threading.Event
+        :param tcl_fname: Name of the running tcl file
+        :type tcl_fname: str
+        :return: True if the tcl file was executed successfully, otherwise False
+        :rtype: bool
+        '''
+
+        # Follow the log file created by this run
+        tailer = sysutils.LogTailer(str(Path(tcl_fname).parent),
+                                    f'{Path(self.db.name).stem}*.log',
+                                    newer_than=time.time(),
+                                    on_line=self._log_tcl_line,
+                                    success='sigrity::close document',
+                                    failure=self.tcl_error_pattern)
+        tailer.follow(event)
 
         # Finally, check if tcl file was successfully executed
-        if 'sigrity::close document' in lines[-2]:
+        if tailer.status:
             logger.info('TCL file was executed successfully\n')
             return True
         else:
@@ -3477,7 +3459,8 @@ class IdemEvalResults:
 
 class IdemWaveCompare:
     
-    def __init__(self, ref_path, macromodel_path, pts_per_decade=None):
+    def __init__(self, ref_path, macromodel_path, pts_per_decade=None,
+                 keep_artifacts=False):
         
         self.ref_waves = ld.Waveforms()
         self.ref_waves.load_waves(os.path.abspath(ref_path))
@@ -3485,39 +3468,114 @@ class IdemWaveCompare:
         self.macromodel_path = os.path.abspath(macromodel_path)
         self.best_matches = []
         self.pts_per_decade = pts_per_decade
+        self.keep_artifacts = keep_artifacts
+        self.lock = Lock()
+        # Resampled reference of each bandwidth, the reference does not
+        # change during the optimization
+        self.ref_cache = {}
         
-    def build_matrix(self, waves, bw):
-        
-        if self.pts_per_decade is None:
-            mat = [wave.clip(tend=bw).data.y for wave in waves]
+    def reference(self, bw):
+        '''Frequency points and matrix of the reference waveforms clipped
+        at the given bandwidth. They are computed once per bandwidth.
+
+        :param bw: Maximum frequency of the comparison
+        :type bw: float
+        :return: Frequency points, reference matrix and the row of each
+        waveform name
+        :rtype: tuple[numpy.ndarray, numpy.ndarray, dict]
+        '''
+
+        with self.lock:
+            if bw not in self.ref_cache:
+                waves = list(self.ref_waves.waves.values())
+                freq = waves[0].clip(tend=bw).data.x
+                if self.pts_per_decade is not None:
+                    freq = np.logspace(np.log10(freq[0]) if freq[0] > 0 else 0,
+                                       np.log10(bw),
+                                       self.pts_per_decade*int(np.log10(bw)))
+                ref_mat = np.vstack([np.interp(freq, wave.data.x, wave.data.y)
+                                     for wave in waves])
+                rows = {name: row for row, name in enumerate(self.ref_waves.waves)}
+                self.ref_cache[bw] = (freq, ref_mat, rows)
+
+        return self.ref_cache[bw]
+
+    def resample(self, waves, bw):
+        '''Resample waveforms at the frequency points of the reference.
+        Waveforms are matched to the reference by name, or by order
+        if the names differ.
+
+        :param waves: Waveforms of a macromodel
+        :type waves: :class:`Waveforms()`
+        :param bw: Maximum frequency of the comparison
+        :type bw: float
+        :return: Macromodel matrix, with the rows ordered as the reference
+        :rtype: numpy.ndarray
+        '''
+
+        freq, _, rows = self.reference(bw)
+        if set(waves.waves) == set(rows):
+            waves = sorted(waves.waves.items(), key=lambda item: rows[item[0]])
         else:
-            total_points = self.pts_per_decade*int(np.log10(bw))
-            mat = []
-            for wave in waves:
-                w = wave.clip(tend=bw)
-                f = interp1d(w.data.x, w.data.y)
-                mat.append(f(np.logspace(
-                        np.log10(w.data.x[0]) if w.data.x[0] > 0 else 0,
-                        np.log10(bw), total_points
-                    ))
-                )
+            waves = waves.waves.items()
 
-        return np.array(mat)
+        return np.vstack([np.interp(freq, wave.data.x, wave.data.y)
+                          for _, wave in waves])
+
+    def metrics(self, macro_mat, bw):
+        '''Compare a macromodel matrix to the reference.
+
+        :param macro_mat: Macromodel matrix, as returned by :meth:`resample()`
+        :type macro_mat: numpy.ndarray
+        :param bw: Maximum frequency of the comparison
+        :type bw: float
+        :return: Mean squared error, maximum absolute error, mean squared
+        error of each frequency decade, and the largest difference of the
+        impedance peak (overshoot) and valley (droop) of all the waveforms
+        :rtype: dict
+        '''
+
+        freq, ref_mat, _ = self.reference(bw)
+        err = np.abs(macro_mat - ref_mat)**2
+        freq_err = err.mean(axis=0)
+        decades = np.floor(np.log10(np.maximum(freq, freq[freq > 0].min()))).astype(int)
+        band_err = np.bincount(decades - decades.min(), weights=freq_err)
+        band_pts = np.bincount(decades - decades.min())
+
+        return {'mse': freq_err.mean(),
+                'max_abs': np.sqrt(err.max()),
+                'band_mse': {f'1e{decades.min() + idx}': err_sum/pts
+                             for idx, (err_sum, pts) in enumerate(zip(band_err, band_pts))
+                             if pts},
+                'overshoot_delta': np.abs(np.abs(macro_mat).max(axis=1)
+                                          - np.abs(ref_mat).max(axis=1)).max(),
+                'droop_delta': np.abs(np.abs(macro_mat).min(axis=1)
+                                      - np.abs(ref_mat).min(axis=1)).max()}
     
     def mse(self, macro_path, params, max_bw):
         
         macromodel = ld.Waveforms()
         macromodel.load_waves(macro_path)
         
-        ref_mat = self.build_matrix(self.ref_waves.waves.values(), max_bw)
-        macro_mat = self.build_matrix(macromodel.waves.values(), max_bw)
-        score = mean_squared_error(ref_mat, macro_mat)
-        self.last_mse = score
-        
+        metrics = self.metrics(self.resample(macromodel, max_bw), max_bw)
+        score = metrics['mse']
+
+        # Macromodels of several candidates can be compared concurrently
+        with self.lock:
+            self.last_mse = score
+            self.last_metrics = metrics
+            self._keep_best(macro_path, {**params, **metrics}, macromodel, score)
+
+        return score
+
+    def _keep_best(self, macro_path, params, macromodel, score):
+
         self.best_matches.append((macro_path, params,
                                   macromodel, score))
         sorted_matches = sorted(self.best_matches, key=itemgetter(3))
         self.best_matches = sorted_matches[:5]
+        if self.keep_artifacts:
+            return
         fname_best_matches = [match[0].split('_')[-1].split('.')[0] for match in sorted_matches[:5]]
 
         # Delete all related files with a low mse scores while leaving the best first five
@@ -3532,21 +3590,31 @@ class IdemWaveCompare:
         for match in sorted_matches[5:]:
             for ext in ['.ac0', '.ic0', '.lis', '.pa0',
                         '.st0', '.sp', '.bat']:
-                Path(match[0].replace('.ac0', ext)).unlink()
+                Path(match[0].replace('.ac0', ext)).unlink(missing_ok=True)
             fname = match[0].split('_')[-1].split('.')[0]
-            Path(idem_path / f'{fname}.cir').unlink()
-            Path(idem_path / f'{fname}.mod.h5').unlink()
-            Path(idem_path / f'{fname}.cir.export.bat').unlink()
-            Path(idem_path / f'{fname}.mod.h5.fitting.bat').unlink()
-            Path(idem_path / f'{fname}.mod.h5.passivity.bat').unlink()
-            Path(idem_path / f'{fname}.mod.h5.passivity_check.bat').unlink()
+            match_idem_path = Path(match[0]).parent.parent / 'idem'
+            for ext in ['.cir', '.mod.h5', '.cir.export.bat', '.mod.h5.fitting.bat',
+                        '.mod.h5.passivity.bat', '.mod.h5.passivity_check.bat']:
+                Path(match_idem_path / f'{fname}{ext}').unlink(missing_ok=True)
+
+
+@dataclass
+class IdemCandidate:
+    '''Working folders of one bandwidth candidate of :class:`IdemOptimizer()`.
+    '''
+
+    idem_path: Path
+    hspice_path: Path
+    hspice_deck: object
+    last_macro: str = None
+    best_mse: float = np.inf
 
 
 class IdemOptimizer(TasksBase):
     
     def __init__(self, term_fname, sparam_fname, cap_models=None,
                 max_data_freq=None, output_format='HSPICE-LAPLACE',
-                acc=1e-5, pts_per_decade=None):
+                acc=1e-5, pts_per_decade=None, keep_artifacts=False):
         
         super().__init__()
         self.term = pd.read_csv(term_fname)
@@ -3571,6 +3639,8 @@ class IdemOptimizer(TasksBase):
             
         self.report_lines = []
         self.output_format = output_format
+        self.lock = Lock()
+        self.cand = None
     
         self.comments_ref = self._get_comments_ref()
         self.sparam_ref = rf.Network(os.path.abspath(self.sparam_fname))
@@ -3586,11 +3656,12 @@ class IdemOptimizer(TasksBase):
         self.my_idem = idem.idem()
         self.my_idem.set_idemmp_path(self.exec_paths['idem'][0])
         self.acc = acc
-        self.ref_waves = ld.Waveforms()
-        self.ref_waves.load_waves(self.sparam_zf_spice_file_path.replace('.sp', '.ac0'))
         
+        # Keeping the macromodel and Hspice files of all the candidates
+        # allows inspecting them after the optimization
         self.wc = IdemWaveCompare(self.sparam_zf_spice_file_path.replace('.sp', '.ac0'),
-                              str(self.hspice_path), pts_per_decade)
+                              str(self.hspice_path), pts_per_decade, keep_artifacts)
+        self.ref_waves = self.wc.ref_waves
     
     def _get_comments_ref(self):
         
@@ -3611,40 +3682,163 @@ class IdemOptimizer(TasksBase):
                         self.sparam_fname
                     )
     
+    def _new_candidate(self, num):
+
+        cand_path = Path(self.sparam_fname).parent / 'candidates' / f'cand{num}'
+        shutil.rmtree(cand_path, ignore_errors=True)
+        (cand_path / 'idem').mkdir(parents=True)
+        (cand_path / 'hspice').mkdir()
+
+        return IdemCandidate(cand_path / 'idem', cand_path / 'hspice',
+                             hspice_deck.HspiceDeck(deck_path=str(cand_path / 'hspice')))
+
+    def _optimize_bw(self, num, bw, order_min, order_step, order_max,
+                     refz, max_iter_per_freq, stop, refz_stop):
+        '''Fit and iteratively improve the macromodel of one bandwidth
+        candidate, in its own working folders.
+        '''
+
+        if stop.is_set() or refz_stop.is_set():
+            return None
+        cand = self._new_candidate(num)
+        self.idem_func(bw, order_min, order_step, order_max,
+                       refz, False, 0.1, cand)
+        if cand.last_macro is None:
+            return cand
+
+        num_iter = 1
+        dc_nonpassive_cnt = 0
+        dc_passive = True
+        while not stop.is_set():
+            success, dc_passive = self.idem_func(bw, order_min,
+                                                 order_step, order_max,
+                                                 refz, True, 0.1, cand)
+            if not dc_passive and dc_nonpassive_cnt < 9:
+                dc_nonpassive_cnt += 1
+                dc_passive = True
+            else:
+                dc_nonpassive_cnt = 0
+            if not success:
+                break
+            if num_iter > max_iter_per_freq:
+                break
+            num_iter += 1
+        if not dc_passive:
+            refz_stop.set()
+
+        return cand
+
+    @staticmethod
+    def _files_hash(path):
+
+        # Hash of a file, or of all the files of a folder
+        h = hashlib.sha256()
+        path = Path(path)
+        fpaths = sorted(path.rglob('*')) if path.is_dir() else [path]
+        for fpath in fpaths:
+            if fpath.is_file():
+                h.update(str(fpath.relative_to(path)).encode() if path.is_dir() else b'')
+                h.update(fpath.read_bytes())
+
+        return h.hexdigest()
+
+    def _opt_settings(self, order_min, order_step, max_iter_per_freq):
+        '''Everything changing the score of an optimization point
+        besides its bandwidth, reference impedance and maximum order.
+        '''
+
+        return {'order_min': order_min, 'order_step': order_step,
+                'max_iter_per_freq': max_iter_per_freq, 'acc': self.acc,
+                'max_data_freq': float(self.max_data_freq),
+                'output_format': self.output_format,
+                'pts_per_decade': self.wc.pts_per_decade,
+                'sparam': self._files_hash(self.sparam_fname),
+                'term': hashlib.sha256(self.term.to_csv(index=False).encode()).hexdigest(),
+                'cap_models': None if self.cap_models is None else self._files_hash(self.cap_models)}
+
     def optimize(self, min_bw, max_bw, bw_steps,
                  refzs, order_min, order_step, order_max,
-                 max_iter_per_freq=10):
+                 max_iter_per_freq=10, workers=None, target_mse=None,
+                 strategy=None, max_evals=None, resume=True):
+        '''Search for the macromodel that best matches the reference
+        impedance profile. Candidates are points of the grid of bandwidths,
+        reference impedances and maximum orders. They are picked by the
+        search strategy and evaluated concurrently, each in its own working
+        folder. Evaluated points are stored in idem_opt_points.json so an
+        interrupted optimization resumes where it stopped. They are only
+        resumed by an optimization with the same settings, s-parameter,
+        termination and capacitor model files.
+
+        :param min_bw: Minimum fitting bandwidth
+        :type min_bw: float
+        :param max_bw: Maximum fitting bandwidth
+        :type max_bw: float
+        :param bw_steps: Number of bandwidth candidates
+        :type bw_steps: int
+        :param refzs: Reference impedances to try
+        :type refzs: list[float]
+        :param order_min: IDEM minimum order
+        :type order_min: int
+        :param order_step: IDEM order step
+        :type order_step: int
+        :param order_max: IDEM maximum order, or maximum orders to try
+        :type order_max: int or list[int]
+        :param max_iter_per_freq: Maximum number of improvement iterations
+        of each bandwidth candidate, defaults to 10
+        :type max_iter_per_freq: int, optional
+        :param workers: Number of candidates evaluated at the same time.
+        If None, IDEM_OPT_WORKERS from the configuration is used, defaults to None
+        :type workers: int, optional
+        :param target_mse: Stop once a macromodel reaches this mean squared
+        error, defaults to None
+        :type target_mse: float, optional
+        :param strategy: 'grid', 'random', 'surrogate' or a
+        :class:`search.SearchStrategy()` object. If None, IDEM_OPT_STRATEGY
+        from the configuration is used, defaults to None
+        :type strategy: str or search.SearchStrategy, optional
+        :param max_evals: Maximum number of evaluated candidates. If None,
+        all the candidates can be evaluated, defaults to None
+        :type max_evals: int, optional
+        :param resume: Skip the candidates evaluated by a previous
+        optimization, defaults to True
+        :type resume: bool, optional
+        :return: Lowest mean squared error found
+        :rtype: float
+        '''
         
-        bw_shuffled = np.linspace(min_bw, max_bw, bw_steps)
-        shuffle(bw_shuffled)
-        dc_nonpassive_cnt = 0
-        #for bw in np.arange(bw_min, bw_max, bw_steps):
-        for refz in refzs:
-            for bw in bw_shuffled:
-                self.idem_func(bw, order_min, order_step, order_max,
-                               refz, False, 0.1)
-                num_iter = 1
-                while True:
-                    success, dc_passive = self.idem_func(bw, order_min,
-                                                         order_step, order_max,
-                                                         refz, True, 0.1)
-                    if not dc_passive and dc_nonpassive_cnt < 9:
-                        dc_nonpassive_cnt += 1
-                        dc_passive = True
-                    else:
-                        dc_nonpassive_cnt = 0
-                    if not success:
-                        break
-                    if num_iter > max_iter_per_freq:
-                        break
-                    num_iter += 1
-                if not dc_passive:
-                    break
+        workers = cfg.IDEM_OPT_WORKERS if workers is None else workers
+        strategy = search.get_strategy(cfg.IDEM_OPT_STRATEGY if strategy is None else strategy)
+        order_maxs = order_max if isinstance(order_max, (list, tuple)) else [order_max]
+        candidates = [{'bw': float(bw), 'refz': float(refz), 'order_max': int(order)}
+                      for refz in refzs for order in order_maxs
+                      for bw in np.linspace(min_bw, max_bw, bw_steps)]
+        history = search.EvalHistory(Path(self.sparam_fname).parent / 'idem_opt_points.json',
+                                     resume, self._opt_settings(order_min, order_step,
+                                                                max_iter_per_freq))
+        cand_nums = count(len(list((Path(self.sparam_fname).parent
+                                    / 'candidates').glob('cand*'))))
+        stop = Event()
+        # Stops the remaining candidates of a reference impedance
+        # once a candidate is not passive at DC
+        refz_stops = defaultdict(Event)
+
+        def evaluate(params):
+            cand = self._optimize_bw(next(cand_nums), params['bw'], order_min,
+                                     order_step, params['order_max'], params['refz'],
+                                     max_iter_per_freq, stop, refz_stops[params['refz']])
+            return None if cand is None else cand.best_mse
+
+        history = search.run_search(strategy, candidates, evaluate, workers,
+                                    max_evals, target_mse, history,
+                                    lambda params: refz_stops[params['refz']].is_set(),
+                                    stop)
                         
         with open('idem_opt.log', 'at') as log_file:
             log_file.write(f'{time.perf_counter()} seconds\n')
+
+        return history.best[1]
                         
-    def update_sparams(self, last_sparam_fname, ref_z, scale=0.1):
+    def update_sparams(self, last_sparam_fname, ref_z, scale=0.1, path=None):
         
         last_net = rf.Network(last_sparam_fname)
         freq = rf.Frequency.from_f(last_net.f, unit='Hz')
@@ -3656,32 +3850,38 @@ class IdemOptimizer(TasksBase):
 
         new_net[0, :, :] = last_net.z[0, :, :]
         new_net = rf.Network(frequency=freq, z=new_net, comments=self.comments_ref)
-        new_net.write_touchstone(os.path.join(self.idem_path,
+        new_net.write_touchstone(os.path.join(self.idem_path if path is None else path,
                                               'new_sparam'),
                                  skrf_comment=False,
                                  r_ref=ref_z
                             )
     
     def idem_func(self, bw, order_min, order_step, order_max,
-                  ref_z, new_sparam=False, scale=0.1):
+                  ref_z, new_sparam=False, scale=0.1, cand=None):
         
+        if cand is None:
+            if self.cand is None:
+                self.cand = IdemCandidate(self.idem_path, self.hspice_path,
+                                          self.my_hspice_deck)
+            cand = self.cand
+        sparam_ext = self.sparam_fname.split('.')[1]
         if new_sparam:
-            idem_sparam_file = os.path.join(str(self.idem_path),
-                                            f'new_sparam.'
-                                            f"{self.sparam_fname.split('.')[1]}")
-            self.update_sparams(os.path.join(str(self.idem_path),
-                                             f'macro{self.cnt-1}.cir.'
-                                             f"{self.sparam_fname.split('.')[1]}"),
-                                ref_z, scale
+            idem_sparam_file = os.path.join(str(cand.idem_path),
+                                            f'new_sparam.{sparam_ext}')
+            self.update_sparams(os.path.join(str(cand.idem_path),
+                                             f'{cand.last_macro}.cir.{sparam_ext}'),
+                                ref_z, scale, cand.idem_path
                             )
         else:
             idem_sparam_file = self.sparam_fname
         
-        macromodel_it = os.path.join(self.idem_path,
-                                         f'macro{self.cnt}.cir')
-        deck_it = os.path.join(str(self.hspice_path),
-                                f'main_zf_macro{self.cnt}.sp')
-        self.cnt += 1
+        with self.lock:
+            macro_num = self.cnt
+            self.cnt += 1
+        macromodel_it = os.path.join(cand.idem_path,
+                                         f'macro{macro_num}.cir')
+        deck_it = os.path.join(str(cand.hspice_path),
+                                f'main_zf_macro{macro_num}.sp')
         
         success = self.my_idem.create_idem_model(
                     idem_sparam_file, macromodel_it,
@@ -3691,24 +3891,21 @@ class IdemOptimizer(TasksBase):
                     str(self.idem_path / 'advance_settings_passivity.popt.xml')
                 )
         if not success:
-            self.cnt -= 1
             return False, True
         try:
-            self.my_hspice_deck.write_test_zf_deck(
+            cand.hspice_deck.write_test_zf_deck(
                                 deck_it, macromodel_it,
                                 self.term, self.cap_models,
                                 #self.max_bw
                                 self.max_data_freq
                             )
-            self.my_hspice_deck.include_lines = []
+            cand.hspice_deck.include_lines = []
             
             # Run Hspice
             self.my_hspice.hspice_run(deck_it)
         except FileNotFoundError: # Catches when passivity at DC fails
-            self.my_hspice_deck.include_lines = []
-            self.cnt -= 1
+            cand.hspice_deck.include_lines = []
             return False, False
-            pass
 
         params = {'order_min': order_min,
                   'order_step': order_step,
@@ -3716,18 +3913,21 @@ class IdemOptimizer(TasksBase):
                   'bw': bw,
                   'acc': self.acc,
                   'impedance': ref_z}
-        self.wc.mse(deck_it.replace('.sp', '.ac0'), params, self.max_data_freq) #self.max_bw)
-        param_line = (f'macro{self.cnt-1} -> '
+        mse = self.wc.mse(deck_it.replace('.sp', '.ac0'), params, self.max_data_freq) #self.max_bw)
+        cand.last_macro = f'macro{macro_num}'
+        cand.best_mse = min(cand.best_mse, mse)
+        param_line = (f'macro{macro_num} -> '
                             f'order_min = {order_min}, '
                             f'order_step = {order_step}, '
                             f'order_max = {order_max}, '
                             f'ref_z = {ref_z}, '
                             f'bw = {bw*1e-6} MHz, '
-                            f"mse = {self.wc.last_mse}, "
+                            f"mse = {mse}, "
                             f'scale = {scale}')
-        self.report_lines.append((param_line, self.wc.last_mse))
-        self.report_lines = sorted(self.report_lines, key=itemgetter(1))
-        self.logfile_path.write_text('\n'.join([line[0] for line in self.report_lines]) + '\n')
+        with self.lock:
+            self.report_lines.append((param_line, mse))
+            self.report_lines = sorted(self.report_lines, key=itemgetter(1))
+            self.logfile_path.write_text('\n'.join([line[0] for line in self.report_lines]) + '\n')
         logger.info(param_line)
         
         return True, True
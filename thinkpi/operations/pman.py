@@ -1,7 +1,9 @@
+import os
 from pathlib import Path
 from operator import itemgetter
 import re
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import numpy as np
 from sklearn.cluster import KMeans
@@ -326,8 +328,9 @@ class PortGroup():
         elif num_ports == 0:
             logger.warning(f'Port reduction will not be performed on layer {layer}')
             return self
-        df = pd.DataFrame({'x': np.array([port.x_center for port in ports]),
-                            'y': np.array([port.y_center for port in ports])})
+        boxes = spd.Port.find_boxes(ports)
+        df = pd.DataFrame({'x': boxes['x_center'].to_numpy(),
+                            'y': boxes['y_center'].to_numpy()})
         kmeans = KMeans(n_clusters=num_ports, init='k-means++', n_init=1, random_state=0).fit(df)
         labels = kmeans.predict(df)
 
@@ -943,25 +946,26 @@ class PortGroup():
         if not ports:
             return ports
         
-        x_center, y_center = [], []
-        for port in ports:
-            x_center.append(port.x_center)
-            y_center.append(port.y_center)
+        boxes = spd.Port.find_boxes(ports)
+        x_center = boxes['x_center'].to_numpy()
+        y_center = boxes['y_center'].to_numpy()
 
         # Find top left anchor point which is minimum x and maximum y
-        x_anchor, y_anchor = min(x_center), max(y_center)
+        x_anchor, y_anchor = np.nanmin(x_center), np.nanmax(y_center)
 
         # Reorder ports by distance to the anchor point
-        ordered_ports = []
-        for port in ports:
-            ordered_ports.append((np.sqrt((x_anchor - port.x_center)**2
-                                         + (y_anchor - port.y_center)**2),
-                                    port)
-                            )
-        
-        ordered_ports = sorted(ordered_ports, key=itemgetter(0))
+        dist = np.hypot(x_anchor - x_center, y_anchor - y_center)
         
-        return [port[1] for port in ordered_ports]
+        return [ports[idx] for idx in np.argsort(dist, kind='stable')]
+
+    def port_boxes(self):
+        '''Find the boxes and centers of all the ports in the group at once.
+
+        :return: Port boxes and centers, one row per port
+        :rtype: pandas.DataFrame
+        '''
+
+        return spd.Port.find_boxes(self.ports)
                
     def add_ports(self, fname=None, save=True):
 
@@ -1118,3 +1122,312 @@ class PortGroup():
     
         self.db.ports = updated_ports
         self.update_ports(fname, save)
+
+
+class NodeArrays:
+    '''Compact, read-only copy of the layout nodes as NumPy arrays.
+    It is sent once to each placement worker process instead of
+    pickling the whole layout for every job.
+    '''
+
+    def __init__(self, db):
+
+        nodes = list(db.nodes.values())
+        self.names = [node.name for node in nodes]
+        self.index = {name: idx for idx, name in enumerate(self.names)}
+        self.x = np.fromiter((node.x for node in nodes), dtype=float, count=len(nodes))
+        self.y = np.fromiter((node.y for node in nodes), dtype=float, count=len(nodes))
+
+        self.layer_names, self.layers = np.unique([node.layer for node in nodes],
+                                                    return_inverse=True)
+        self.rail_names, self.rails = np.unique(['' if node.rail is None else node.rail
+                                                    for node in nodes],
+                                                    return_inverse=True)
+        self.layer_codes = {name: code for code, name in enumerate(self.layer_names)}
+        self.rail_codes = {name: code for code, name in enumerate(self.rail_names)}
+
+        rail_enabled = np.array([bool(db.net_names.get(rail, (0, None))[0])
+                                    for rail in self.rail_names], dtype=bool)
+        rail_gnd = np.array([rail.lower().startswith('vss') or rail.lower().startswith('gnd')
+                                for rail in self.rail_names], dtype=bool)
+        self.enabled = rail_enabled[self.rails]
+        self.gnd = rail_gnd[self.rails]
+
+    def codes(self, rails):
+
+        return np.array([self.rail_codes[rail] for rail in rails
+                            if rail in self.rail_codes], dtype=int)
+
+
+# Node arrays of the current placement worker process
+_worker_nodes = None
+
+
+def _init_placement_worker(node_arrays):
+
+    global _worker_nodes
+    _worker_nodes = node_arrays
+
+
+def _cluster_labels(x, y, num_ports):
+
+    df = pd.DataFrame({'x': x, 'y': y})
+    kmeans = KMeans(n_clusters=num_ports, init='k-means++', n_init=1, random_state=0).fit(df)
+    return kmeans.cluster_centers_, kmeans.predict(df)
+
+
+def _comp_ports_job(job):
+    '''Find component ports of one (net, layer) pair and reduce them.
+    Mirrors :meth:`PortGroup.auto_port_comp` followed by :meth:`PortGroup.reduce_ports`.
+    '''
+
+    nodes = _worker_nodes
+    net_codes, comps, num_ports = job
+    comp_ports = []
+    for comp_name, node_idxs in comps:
+        node_idxs = np.asarray(node_idxs, dtype=int)
+        pos_idxs = node_idxs[np.isin(nodes.rails[node_idxs], net_codes)]
+        neg_idxs = node_idxs[nodes.gnd[node_idxs]]
+        if len(pos_idxs) and len(neg_idxs):
+            comp_ports.append((comp_name, pos_idxs, neg_idxs))
+
+    if not comp_ports:
+        return comp_ports, None
+
+    # Same ordering as PortGroup.auto_reorder, since clustering depends on it
+    x_center, y_center = np.empty(len(comp_ports)), np.empty(len(comp_ports))
+    for idx, (_, pos_idxs, neg_idxs) in enumerate(comp_ports):
+        port_idxs = np.concatenate((pos_idxs, neg_idxs))
+        x_center[idx] = (nodes.x[port_idxs].min() + nodes.x[port_idxs].max())/2
+        y_center[idx] = (nodes.y[port_idxs].min() + nodes.y[port_idxs].max())/2
+    order = np.argsort(np.hypot(x_center.min() - x_center, y_center.max() - y_center),
+                        kind='stable')
+    comp_ports = [comp_ports[idx] for idx in order]
+    if num_ports == 0 or num_ports >= len(comp_ports):
+        return comp_ports, None
+
+    _, labels = _cluster_labels(x_center[order], y_center[order], num_ports)
+    groups = [list(np.flatnonzero(labels == port_num)) for port_num in range(num_ports)]
+
+    return comp_ports, groups
+
+
+def _auto_port_job(job):
+    '''Place ports of one net on one layer.
+    Mirrors a single net iteration of :meth:`PortGroup.auto_port`.
+    '''
+
+    nodes = _worker_nodes
+    net_code, layer_code, (x1, y1, x2, y2), num_ports = job
+    in_box = ((nodes.layers == layer_code)
+                & (nodes.x >= x1) & (nodes.x <= x2)
+                & (nodes.y >= y1) & (nodes.y <= y2))
+    pwr_idxs = np.flatnonzero(in_box & (nodes.rails == net_code))
+    gnd_idxs = np.flatnonzero(in_box & nodes.gnd)
+    if not len(pwr_idxs):
+        return [], num_ports
+    num_ports = min(num_ports, len(pwr_idxs))
+    gnd_x, gnd_y = nodes.x[gnd_idxs], nodes.y[gnd_idxs]
+
+    _, labels = _cluster_labels(nodes.x[pwr_idxs], nodes.y[pwr_idxs], num_ports)
+    ports = []
+    for port_num in range(num_ports):
+        pos_idxs = pwr_idxs[labels == port_num]
+        # Find negative nodes nearby each positive node
+        neg_idxs = []
+        for pos_idx in pos_idxs:
+            gnd_radius = 0.15e-3
+            found = np.array([], dtype=int)
+            while not len(found) and gnd_radius < 5e-3:
+                found = gnd_idxs[np.hypot(gnd_x - nodes.x[pos_idx],
+                                            gnd_y - nodes.y[pos_idx]) < gnd_radius]
+                gnd_radius *= 2
+            neg_idxs.append(found)
+        neg_idxs = np.unique(np.concatenate(neg_idxs)) if neg_idxs else np.array([], dtype=int)
+        ports.append((pos_idxs, neg_idxs[nodes.enabled[neg_idxs]]))
+
+    return ports, num_ports
+
+
+class PlacementPool:
+    '''Places ports of many (net, layer) pairs in parallel.
+    The layout nodes are converted once into :class:`NodeArrays`
+    that are shared with a pool of worker processes. Results are
+    merged in job order, so port names and ordering do not depend
+    on which worker finishes first.
+    '''
+
+    def __init__(self, db, workers=None):
+        '''Initialization method of the class.
+
+        :param db: Layout to place ports on
+        :type db: :class:`speed.Database()`
+        :param workers: Number of worker processes. If None, the number
+        of CPUs is used, and 1 places ports in the current process, defaults to None
+        :type workers: int, optional
+        '''
+
+        self.db = db
+        self.workers = os.cpu_count() if workers is None else workers
+        self.nodes = NodeArrays(db)
+
+    def _run(self, func, jobs, labels):
+
+        if self.workers <= 1 or len(jobs) <= 1:
+            _init_placement_worker(self.nodes)
+            results = []
+            for idx, job in enumerate(jobs):
+                results.append(func(job))
+                logger.info(f'Placed ports for {labels[idx]} ({idx + 1}/{len(jobs)})')
+            return results
+
+        results = [None]*len(jobs)
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)),
+                                    initializer=_init_placement_worker,
+                                    initargs=(self.nodes,)) as pool:
+            futures = {pool.submit(func, job): idx for idx, job in enumerate(jobs)}
+            for done, future in enumerate(as_completed(futures), 1):
+                idx = futures[future]
+                results[idx] = future.result()
+                logger.info(f'Placed ports for {labels[idx]} ({done}/{len(jobs)})')
+
+        return results
+
+    def _node_objs(self, idxs):
+
+        return [self.db.nodes[self.nodes.names[idx]] for idx in idxs]
+
+    def comp_ports(self, net_names, layers, comp_find, ref_z=50):
+        '''Place ports on components and reduce them, for every
+        combination of net name and layer.
+
+        :param net_names: Power net name(s) to place ports, wildcards can be used
+        :type net_names: list[str]
+        :param layers: Pairs of layer name and number of ports to reduce to
+        :type layers: list[tuple[str, int]]
+        :param comp_find: Keyword to find components, wildcards can be used
+        :type comp_find: str
+        :param ref_z: Port reference impedance, defaults to 50
+        :type ref_z: float, optional
+        :return: Placed and reduced ports for each (net name, layer) pair
+        :rtype: list[tuple[:class:`pman.PortGroup()`, :class:`pman.PortGroup()`]]
+        '''
+
+        comps_by_layer = defaultdict(list)
+        for comp in self.db.find_comps(comp_names=comp_find, verbose=False):
+            if comp.name not in self.db.components or not self.db.connects[comp.name].nodes:
+                logger.warning(f'Component {comp.name} does not have nodes defined')
+                continue
+            layer = self.db.nodes[self.db.connects[comp.name].nodes[0]].layer
+            comps_by_layer[layer].append((comp.name,
+                                          [self.nodes.index[node_name]
+                                                for node_name in comp.nodes]))
+
+        jobs, labels, job_info = [], [], []
+        for net_name in net_names:
+            nets = self.db.rail_names(find_nets=net_name, enabled=True, verbose=False)
+            for layer, num_ports in layers:
+                jobs.append((self.nodes.codes(nets), comps_by_layer[layer], num_ports))
+                labels.append(f'{net_name} on layer {layer}')
+                job_info.append((layer, num_ports))
+
+        results = []
+        for (layer, num_ports), (comp_ports, groups) in zip(job_info,
+                                                self._run(_comp_ports_job, jobs, labels)):
+            ports = []
+            for comp_name, pos_idxs, neg_idxs in comp_ports:
+                ports.append(spd.Port({'port_name': comp_name, 'port_width': None,
+                                        'ref_z': ref_z,
+                                        'pos_nodes': self._node_objs(pos_idxs),
+                                        'neg_nodes': self._node_objs(neg_idxs)}))
+                logger.info(f'Port placed on component {comp_name} on layer {layer}')
+            placed = PortGroup(self.db, ports)
+            placed.ports = placed.auto_reorder(ports)
+
+            if groups is None:
+                if num_ports >= len(ports):
+                    logger.warning(f'Number of ports on layer {layer} '
+                        f'to reduce ({num_ports}), is greater than '
+                        f'or equal to the existing number of ports ({len(ports)}). '
+                        f'Reduction cannot be performed.')
+                elif num_ports == 0:
+                    logger.warning(f'Port reduction will not be performed on layer {layer}')
+                results.append((placed, placed))
+                continue
+
+            group_info = {}
+            reduced_ports = []
+            for group in groups:
+                grouped_ports = [ports[idx] for idx in group]
+                if len(grouped_ports) == 1:
+                    port_name = grouped_ports[0].name
+                else:
+                    port_name = f'group{spd.Port.idx}_x{len(grouped_ports)}'
+                    spd.Port.idx += 1
+                group_info[port_name] = [port.name for port in grouped_ports]
+                reduced_ports.append(spd.Port({
+                        'port_name': port_name,
+                        'port_width': grouped_ports[0].width,
+                        'ref_z': grouped_ports[0].ref_z,
+                        'pos_nodes': [node for port in grouped_ports for node in port.pos_nodes],
+                        'neg_nodes': [node for port in grouped_ports for node in port.neg_nodes]
+                    }))
+            reduced = PortGroup(self.db, placed.auto_reorder(reduced_ports))
+            reduced.group_info = group_info
+            results.append((placed, reduced))
+
+        return results
+
+    def auto_ports(self, layer, net_name, num_ports, area=None,
+                    ref_z=50, prefix=None):
+        '''Automatically place ports on every net, in parallel.
+        Equivalent to :meth:`PortGroup.auto_port` without 3D ports.
+
+        :param layer: Layer name to place ports on
+        :type layer: str
+        :param net_name: Power net name(s) to place ports, wildcards can be used
+        :type net_name: str or list[str]
+        :param num_ports: Number of ports per net
+        :type num_ports: int
+        :param area: Area where the ports must be placed in the form of
+        (x_bot_left, y_bot_left, x_top_right, y_top_right).
+        If None the entire layout area is considered, defaults to None
+        :type area: tuple[float, float, float, float], optional
+        :param ref_z: Port reference impedance, defaults to 50
+        :type ref_z: float, optional
+        :param prefix: Prefix of the port names, defaults to None
+        :type prefix: str, optional
+        :return: New group with the placed ports
+        :rtype: :class:`pman.PortGroup()`
+        '''
+
+        if area is None:
+            area = (self.db.db_x_bot_left, self.db.db_y_bot_left,
+                    self.db.db_x_top_right, self.db.db_y_top_right)
+        prefix = '' if prefix is None else f'{prefix}_'
+
+        nets = [net for net in self.db.rail_names(find_nets=net_name, enabled=True, verbose=False)
+                    if net in self.nodes.rail_codes]
+        layer_code = self.nodes.layer_codes.get(layer, -1)
+        jobs = [(self.nodes.rail_codes[net], layer_code, area, num_ports) for net in nets]
+
+        new_ports = []
+        for net, (ports, used_num_ports) in zip(nets, self._run(_auto_port_job, jobs, nets)):
+            if not ports:
+                logger.warning(f'Cannot find net {net} to place ports. '
+                            f'Check if {net} is enabled and classified as power or ground.')
+                continue
+            if used_num_ports < num_ports:
+                logger.warning(f'Number of ports {num_ports} '
+                    f'exceed the number of nodes {used_num_ports}.\n'
+                    f'Setting number of ports to {used_num_ports}.')
+            for pos_idxs, neg_idxs in ports:
+                new_ports.append(spd.Port({'port_name': f'{prefix}{net}_{spd.Port.idx}',
+                                            'port_width': None, 'ref_z': ref_z,
+                                            'pos_nodes': self._node_objs(pos_idxs),
+                                            'neg_nodes': self._node_objs(neg_idxs)}))
+                spd.Port.idx += 1
+
+        group = PortGroup(self.db, new_ports)
+        group.ports = group.auto_reorder(new_ports)
+        return group
@@ -1,19 +1,18 @@
 import os
 import re
+import sys
 import json
-from typing import List
 from datetime import datetime
 from operator import attrgetter, itemgetter
-from copy import deepcopy
 from itertools import cycle
 from collections import defaultdict
 from difflib import get_close_matches
 from pathlib import Path
-from dataclasses import dataclass, field
 import matplotlib.path as mpltPath
 
 import numpy as np
 import pandas as pd
+from scipy.spatial import cKDTree
 
 from bokeh.io import show, curdoc
 from bokeh.models import ColumnDataSource, CrosshairTool, BoxZoomTool, HoverTool, Patches, Circle, Rect
@@ -24,9 +23,53 @@ from bokeh.layouts import column
 from bokeh.palettes import Category20, RdYlBu
 
 from thinkpi import logger
+from thinkpi.backend_api.clone import materialize
 
 
-class Sink:
+class Primitive:
+    '''Base class of the layout primitives.
+    Attributes are kept in __slots__ instead of a per-instance __dict__,
+    and repeated names (layers, rails, padstacks) are interned so that
+    all instances share a single copy of each string.
+    '''
+
+    __slots__ = ()
+    # Attributes compared by __eq__ (all slots if None) and hashed by __hash__
+    _eq_attrs = None
+    _hash_attrs = ('name',)
+
+    @staticmethod
+    def _intern(value):
+
+        return sys.intern(value) if isinstance(value, str) else value
+
+    def _attrs(self):
+
+        return self.__slots__ if self._eq_attrs is None else self._eq_attrs
+
+    def __eq__(self, other):
+
+        if self.__class__ is not other.__class__:
+            return False
+        for attr in self._attrs():
+            self_attr, other_attr = getattr(self, attr), getattr(other, attr)
+            if isinstance(self_attr, np.ndarray) or isinstance(other_attr, np.ndarray):
+                if not np.array_equal(self_attr, other_attr):
+                    return False
+            elif self_attr != other_attr:
+                return False
+        return True
+
+    def __hash__(self):
+
+        return hash((self.__class__.__name__,
+                     *(getattr(self, attr) for attr in self._hash_attrs)))
+
+
+class Sink(Primitive):
+
+    __slots__ = ('name', 'nom_voltage', 'current', 'model',
+                 'pos_nodes', 'neg_nodes', 'x_center', 'y_center')
 
     def __init__(self, properties):
 
@@ -44,15 +87,6 @@ class Sink:
         return (f'Sink name: {self.name}, Nominal voltage: {self.nom_voltage} V, '
                 f'Current: {self.current} A')
     
-    def __eq__(self, other):
-
-        try:
-            return all([self_attr == other_attr
-                        for self_attr, other_attr in zip(self.__dict__.values(),
-                                                        other.__dict__.values())])
-        except AttributeError:
-            return False
-        
     def to_port(self, ref_z=1, suffix=None):
 
         suffix = '' if suffix is None else f'_{suffix}'
@@ -62,7 +96,10 @@ class Sink:
         return Port(port_props)
 
 
-class Vrm:
+class Vrm(Primitive):
+
+    __slots__ = ('name', 'nom_voltage', 'sense_voltage', 'out_current',
+                 'pos_nodes', 'neg_nodes', 'pos_sense_nodes', 'neg_sense_nodes')
 
     def __init__(self, properties):
 
@@ -80,15 +117,6 @@ class Vrm:
         return (f'VRM name: {self.name}, Nominal voltage: {self.nom_voltage} V, '
                 f'Output current: {self.out_current} A')
     
-    def __eq__(self, other):
-
-        try:
-            return all([self_attr == other_attr
-                        for self_attr, other_attr in zip(self.__dict__.values(),
-                                                    other.__dict__.values())])
-        except AttributeError:
-            return False
-        
     def to_port(self, ref_z=1, suffix=None):
 
         suffix = '' if suffix is None else f'_{suffix}'
@@ -109,20 +137,22 @@ class Vrm:
             return None
 
 
-class Node:
+class Node(Primitive):
+
+    __slots__ = ('name', 'type', 'rail', 'x', 'y', 'layer', 'rotation', 'padstack')
 
     idx = 0
 
     def __init__(self, properties):
 
         self.name = properties['name']
-        self.type = properties['type']
-        self.rail = properties['rail']
+        self.type = self._intern(properties['type'])
+        self.rail = self._intern(properties['rail'])
         self.x = properties['x']
         self.y = properties['y']
-        self.layer = properties['layer']
+        self.layer = self._intern(properties['layer'])
         self.rotation = properties['rotation']
-        self.padstack = properties['padstack']
+        self.padstack = self._intern(properties['padstack'])
 
     def __repr__(self):
         
@@ -130,17 +160,14 @@ class Node:
                 f'Rail: {self.rail}, Layer: {self.layer}, '
                 f'Rotation: {self.rotation}')
 
-    def __eq__(self, other):
-
-        try:
-            return all([self_attr == other_attr
-                    for self_attr, other_attr in zip(self.__dict__.values(),
-                                                    other.__dict__.values())])
-        except AttributeError:
-            return False
 
+class Port(Primitive):
 
-class Port:
+    __slots__ = ('name', 'width', 'ref_z', '_pos_nodes', '_neg_nodes',
+                 '_geom_valid', '_pos_xy', '_neg_xy', '_pnode_box', '_nnode_box',
+                 'pos_rails', 'neg_rails', 'layers')
+    _eq_attrs = ('name', 'width', 'ref_z', 'pos_nodes', 'neg_nodes',
+                 'pos_rails', 'neg_rails', 'layers')
 
     idx = 0
 
@@ -149,16 +176,14 @@ class Port:
         self.name = properties['port_name']
         self.width = properties['port_width']
         self.ref_z = properties['ref_z']
+        # Node coordinates, boxes and center are computed lazily and cached
+        # until a node list is replaced or invalidate_geometry() is called
+        self._geom_valid = False
+        self._pos_xy, self._neg_xy = None, None
+        self._pnode_box = (None, None, None, None)
+        self._nnode_box = (None, None, None, None)
         self.pos_nodes = properties['pos_nodes']
         self.neg_nodes = properties['neg_nodes']
-        # The rest of the attributes are initialized by internal methods
-        self.x_center = None
-        self.y_center = None
-        self.box_x1, self.box_y1 = None, None # Bottom left
-        self.box_x2, self.box_y2 = None, None # Top right
-        self.pnode_box = (None, None, None, None)
-        self.nnode_box = (None, None, None, None)
-        self._find_port_boxes()
         self.pos_rails, self.neg_rails = self._find_port_rails()
         self.layers = self._find_port_layers()
 
@@ -167,14 +192,83 @@ class Port:
         return (f'Port name: {self.name}, Center (x, y): ({self.x_center}, '
                 f'{self.y_center})')
 
-    def __eq__(self, other):
+    @property
+    def pos_nodes(self):
 
-        try:
-            return all([self_attr == other_attr
-                    for self_attr, other_attr in zip(self.__dict__.values(),
-                                                    other.__dict__.values())])
-        except AttributeError:
-            return False
+        return self._pos_nodes
+
+    @pos_nodes.setter
+    def pos_nodes(self, nodes):
+
+        self._pos_nodes = nodes
+        self._geom_valid = False
+
+    @property
+    def neg_nodes(self):
+
+        return self._neg_nodes
+
+    @neg_nodes.setter
+    def neg_nodes(self, nodes):
+
+        self._neg_nodes = nodes
+        self._geom_valid = False
+
+    @property
+    def pos_xy(self):
+
+        self._find_port_boxes()
+        return self._pos_xy
+
+    @property
+    def neg_xy(self):
+
+        self._find_port_boxes()
+        return self._neg_xy
+
+    @property
+    def pnode_box(self):
+
+        self._find_port_boxes()
+        return self._pnode_box
+
+    @property
+    def nnode_box(self):
+
+        self._find_port_boxes()
+        return self._nnode_box
+
+    @property
+    def box_x1(self):
+
+        return self._port_box()[0]
+
+    @property
+    def box_y1(self):
+
+        return self._port_box()[1]
+
+    @property
+    def box_x2(self):
+
+        return self._port_box()[2]
+
+    @property
+    def box_y2(self):
+
+        return self._port_box()[3]
+
+    @property
+    def x_center(self):
+
+        x1, _, x2, _ = self._port_box()
+        return None if x1 is None else (x1 + x2)/2
+
+    @property
+    def y_center(self):
+
+        _, y1, _, y2 = self._port_box()
+        return None if y1 is None else (y1 + y2)/2
 
     def _find_port_rails(self):
 
@@ -192,34 +286,105 @@ class Port:
             layers = [node_name.layer for node_name in self.neg_nodes]
         return list(set(layers))
 
+    @staticmethod
+    def _node_coords(nodes):
+
+        return np.fromiter((coord for node in nodes for coord in (node.x, node.y)),
+                            dtype=float, count=2*len(nodes)).reshape(-1, 2)
+
+    @staticmethod
+    def _node_box(xy):
+
+        if not len(xy):
+            return (None, None, None, None)
+        x1, y1 = xy.min(axis=0)
+        x2, y2 = xy.max(axis=0)
+        return (x1, y1, x2, y2)
+
+    def invalidate_geometry(self):
+        '''Compute the node coordinates, boxes and center again on their
+        next use. Needed after the node lists are modified in place or
+        their nodes are moved, replacing a node list does it.
+        '''
+
+        self._geom_valid = False
+
+    def _set_geometry(self, pos_xy, neg_xy, pnode_box, nnode_box):
+
+        self._pos_xy, self._neg_xy = pos_xy, neg_xy
+        self._pnode_box, self._nnode_box = pnode_box, nnode_box
+        self._geom_valid = True
+
     def _find_port_boxes(self):
+        '''Find the positive and negative node boxes in a single pass
+        over the node coordinates. The result is cached until the
+        node lists of the port are replaced or :meth:`invalidate_geometry`
+        is called.
+        '''
 
-        all_nodes = self.pos_nodes + self.neg_nodes
-        if not all_nodes:
+        if self._geom_valid:
             return
 
-        self.x_center = (min(all_nodes, key=attrgetter('x')).x
-                        + max(all_nodes, key=attrgetter('x')).x)/2
-        self.y_center = (min(all_nodes, key=attrgetter('y')).y
-                        + max(all_nodes, key=attrgetter('y')).y)/2
+        pos_xy = self._node_coords(self._pos_nodes)
+        neg_xy = self._node_coords(self._neg_nodes)
+        self._set_geometry(pos_xy, neg_xy,
+                            self._node_box(pos_xy), self._node_box(neg_xy))
 
-        # Find coordinates of the most top right and bottom left port area
-        self.box_x1, self.box_y1 = (min(all_nodes, key=attrgetter('x')).x,
-                                        min(all_nodes, key=attrgetter('y')).y)
-        self.box_x2, self.box_y2 = (max(all_nodes, key=attrgetter('x')).x,
-                                        max(all_nodes, key=attrgetter('y')).y)
+    def _port_box(self):
 
-         # Find coordinates of the most top right and bottom left positive and negative areas
-        if self.pos_nodes:
-            self.pnode_box = (min(self.pos_nodes, key=attrgetter('x')).x,
-                                min(self.pos_nodes, key=attrgetter('y')).y,
-                                max(self.pos_nodes, key=attrgetter('x')).x,
-                                max(self.pos_nodes, key=attrgetter('y')).y)
-        if self.neg_nodes:
-            self.nnode_box = (min(self.neg_nodes, key=attrgetter('x')).x,
-                                min(self.neg_nodes, key=attrgetter('y')).y,
-                                max(self.neg_nodes, key=attrgetter('x')).x,
-                                max(self.neg_nodes, key=attrgetter('y')).y)
+        self._find_port_boxes()
+        if None in self._pnode_box:
+            return self._nnode_box
+        if None in self._nnode_box:
+            return self._pnode_box
+        # Coordinates of the most bottom left and top right port area
+        return (min(self._pnode_box[0], self._nnode_box[0]),
+                min(self._pnode_box[1], self._nnode_box[1]),
+                max(self._pnode_box[2], self._nnode_box[2]),
+                max(self._pnode_box[3], self._nnode_box[3]))
+
+    @staticmethod
+    def find_boxes(ports):
+        '''Find the boxes and centers of many ports at once.
+        All node coordinates are gathered into flat arrays and reduced
+        per port, and the cached geometry of every port is refreshed.
+
+        :param ports: Ports to process
+        :type ports: list[:class:`speed.Port()`]
+        :return: Port boxes and centers, one row per port
+        :rtype: pandas.DataFrame
+        '''
+
+        ports = list(ports)
+        boxes = {}
+        for polarity in ('pos', 'neg'):
+            node_lists = [getattr(port, f'{polarity}_nodes') for port in ports]
+            counts = np.array([len(nodes) for nodes in node_lists], dtype=int)
+            xy = Port._node_coords([node for nodes in node_lists for node in nodes])
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(int) \
+                        if len(counts) else counts
+            box = np.full((len(ports), 4), np.nan)
+            filled = counts > 0
+            if filled.any():
+                box[filled, :2] = np.minimum.reduceat(xy, starts[filled], axis=0)
+                box[filled, 2:] = np.maximum.reduceat(xy, starts[filled], axis=0)
+            boxes[polarity] = (np.split(xy, np.cumsum(counts)[:-1]) if len(counts) else [],
+                                box, filled)
+
+        pos_xy, pos_box, pos_filled = boxes['pos']
+        neg_xy, neg_box, neg_filled = boxes['neg']
+        for idx, port in enumerate(ports):
+            port._set_geometry(pos_xy[idx], neg_xy[idx],
+                                tuple(pos_box[idx]) if pos_filled[idx] else (None, None, None, None),
+                                tuple(neg_box[idx]) if neg_filled[idx] else (None, None, None, None))
+
+        port_box = np.hstack((np.fmin(pos_box[:, :2], neg_box[:, :2]),
+                                np.fmax(pos_box[:, 2:], neg_box[:, 2:])))
+        return pd.DataFrame({'Name': [port.name for port in ports],
+                                'x_center': (port_box[:, 0] + port_box[:, 2])/2,
+                                'y_center': (port_box[:, 1] + port_box[:, 3])/2,
+                                'box_x1': port_box[:, 0], 'box_y1': port_box[:, 1],
+                                'box_x2': port_box[:, 2], 'box_y2': port_box[:, 3]})
         
     def _nodes_in_box(self, x1, y1, x2, y2, nodes: tuple):
 
@@ -381,21 +546,13 @@ class Port:
         dy = y_dst - y_src_rot
         
         # Rotate nodes by angle degrees around point (0, 0)
-        pos_x, pos_y = [], []
-        neg_x, neg_y = [], []
-        for node in self.pos_nodes:
-            pos_x.append(node.x)
-            pos_y.append(node.y)
-        for node in self.neg_nodes:
-            neg_x.append(node.x)
-            neg_y.append(node.y)
         rot_pos_x, rot_pos_y = self._rotate(rot_angle, 0, 0,
-                                            np.array(pos_x),
-                                            np.array(pos_y) 
+                                            self.pos_xy[:, 0],
+                                            self.pos_xy[:, 1]
                                         )
         rot_neg_x, rot_neg_y = self._rotate(rot_angle, 0, 0,
-                                            np.array(neg_x),
-                                            np.array(neg_y) 
+                                            self.neg_xy[:, 0],
+                                            self.neg_xy[:, 1]
                                         )
         # Create artificial nodes based on the rotated coordinates
         # Then create ports which can be copied using the existing cart_copy method
@@ -441,13 +598,16 @@ class Port:
         return pd.DataFrame([data], columns=columns)
 
 
-class Layer:
+class Layer(Primitive):
+
+    __slots__ = ('name', 'thickness', 'material', 'freq', 'conduct',
+                 'fillin_dielec', 'perm', 'loss_tangent', 'shape')
     
     def __init__(self, properties: dict):
 
-        self.name = properties['name']
+        self.name = self._intern(properties['name'])
         self.thickness = properties['thickness']
-        self.material = properties['material']
+        self.material = self._intern(properties['material'])
         self.freq = properties['freq']
         self.conduct = properties['conduct']
         self.fillin_dielec = properties['fillin_dielec']
@@ -460,15 +620,6 @@ class Layer:
         return (f'Layer name: {self.name}, Thickness: {self.thickness*1e6:.2f} um, '
                 f'Material: {self.material}')
 
-    def __eq__(self, other):
-
-        try:
-            return all([self_attr == other_attr
-                    for self_attr, other_attr in zip(self.__dict__.values(),
-                                                    other.__dict__.values())])
-        except AttributeError:
-            return False
-
     @property
     def is_signal(self):
 
@@ -478,14 +629,17 @@ class Layer:
             return True
 
 
-class Shape:
+class Shape(Primitive):
+
+    __slots__ = ('name', 'net_name', 'layer', 'polarity', 'xcoords', 'ycoords',
+                 'radius', 'xc', 'yc')
 
     def __init__(self, properties: dict):
 
         self.name = properties['name']
-        self.net_name = properties['net_name']
-        self.layer = properties['layer']
-        self.polarity = properties['polarity']
+        self.net_name = self._intern(properties['net_name'])
+        self.layer = self._intern(properties['layer'])
+        self.polarity = self._intern(properties['polarity'])
         self.xcoords = properties['xcoords']
         self.ycoords = properties['ycoords']
         self.radius = properties['radius']
@@ -506,15 +660,6 @@ class Shape:
                 f'Layer: {self.layer}, Polarity: {self.polarity}'
             )
 
-    def __eq__(self, other):
-
-        try:
-            return all([self_attr == other_attr
-                    for self_attr, other_attr in zip(self.__dict__.values(),
-                                                    other.__dict__.values())])
-        except AttributeError:
-            return False
-
     @property
     def is_poly(self):
 
@@ -552,19 +697,22 @@ class Shape:
         return poly_area
     
 
-class Via:
+class Via(Primitive):
+
+    __slots__ = ('name', 'net_name', 'x', 'y', 'upper_node', 'upper_layer',
+                 'lower_node', 'lower_layer', 'padstack')
 
     def __init__(self, properties: dict):
 
         self.name = properties['name']
-        self.net_name = properties['net_name']
+        self.net_name = self._intern(properties['net_name'])
         self.x = properties['x']
         self.y = properties['y']
         self.upper_node = properties['upper_node']
-        self.upper_layer = properties['upper_layer']
+        self.upper_layer = self._intern(properties['upper_layer'])
         self.lower_node = properties['lower_node']
-        self.lower_layer = properties['lower_layer']
-        self.padstack = properties['padstack']
+        self.lower_layer = self._intern(properties['lower_layer'])
+        self.padstack = self._intern(properties['padstack'])
 
     def __repr__(self):
 
@@ -573,30 +721,29 @@ class Via:
                 f'(x, y): ({self.x*1e3:.2f} mm, {self.y*1e3:.2f} mm), '
                 f'Padstack: {self.padstack}')
 
-    def __hash__(self):
-
-        return hash((self.name, self.net_name,
-                     self.x, self.y, self.upper_node,
-                     self.upper_layer, self.lower_node,
-                     self.lower_layer, self.padstack))
 
-    def __eq__(self, other):
+class Padstack(Primitive):
 
-        try:
-            return all([self_attr == other_attr
-                    for self_attr, other_attr in zip(self.__dict__.values(),
-                                                    other.__dict__.values())])
-        except AttributeError:
-            return False
-
-class Padstack:
+    __slots__ = ('name', 'layer', 'regular_geom', 'anti_geom',
+                 'regular_dim', 'anti_dim', 'material', 'inner_material',
+                 'tsv_material', 'tsv_thickness', 'tsv_radius', 'plating_thickness',
+                 'regular_shift_x', 'regular_shift_y', 'anti_shift_x', 'anti_shift_y',
+                 'rounded_corners', 'oblong_via')
+    _hash_attrs = ('name', 'layer')
+    geom_methods = {'circle': 'circle_geom',
+                    'box': 'box_geom',
+                    'square': 'square_geom',
+                    'polygon': 'polygon_geom',
+                    'roundedrect_x': 'roundedrectx_geom',
+                    'roundedrect_y': 'roundedrecty_geom',
+                    'n-poly': 'npoly_geom'}
 
     def __init__(self, properties: dict):
 
-        self.name = properties['name']
-        self.layer = properties['layer']
-        self.regular_geom = properties['regular_geom']
-        self.anti_geom = properties['anti_geom']
+        self.name = self._intern(properties['name'])
+        self.layer = self._intern(properties['layer'])
+        self.regular_geom = self._intern(properties['regular_geom'])
+        self.anti_geom = self._intern(properties['anti_geom'])
         self.regular_dim = properties['regular_dim']
         self.anti_dim = properties['anti_dim']
         self.material = properties['material']
@@ -611,13 +758,6 @@ class Padstack:
         self.anti_shift_y = properties['anti_shift_y']
         self.rounded_corners = properties['rounded_corners']
         self.oblong_via = properties['oblong_via']
-        self.geom_select = {'circle': self.circle_geom,
-                            'box': self.box_geom,
-                            'square': self.square_geom,
-                            'polygon': self.polygon_geom,
-                            'roundedrect_x': self.roundedrectx_geom,
-                            'roundedrect_y': self.roundedrecty_geom,
-                            'n-poly': self.npoly_geom}
 
     def __repr__(self):
 
@@ -625,18 +765,11 @@ class Padstack:
                 f'Regular geomtry: {self.regular_geom}, '
                 f'Anti geometry: {self.anti_geom}')
 
-    def __eq__(self, other):
+    @property
+    def geom_select(self):
 
-        try:
-            self_pads = [prop_pad for prop_name, prop_pad in self.__dict__.items()
-                                if prop_name != 'geom_select']
-            other_pads = [prop_pad for prop_name, prop_pad in other.__dict__.items()
-                                if prop_name != 'geom_select']
-            return all([self_attr == other_attr
-                    for self_attr, other_attr in zip(self_pads,
-                                                    other_pads)])
-        except AttributeError:
-            return False
+        return {geom: getattr(self, method_name)
+                    for geom, method_name in Padstack.geom_methods.items()}
 
     def _regular_anti_overlap(self):
 
@@ -1019,12 +1152,14 @@ class PadstackParser:
             self.padstack_props[f'{polarity}_dim'][1].append(float(next(it)[:-2])*1e-3)
 
 
-class ComponetConnection:
+class ComponetConnection(Primitive):
+
+    __slots__ = ('name', 'part', 'usage', 'checked', 'nodes')
 
     def __init__(self, properties):
 
         self.name = properties['name']
-        self.part = properties['part']
+        self.part = self._intern(properties['part'])
         self.usage = properties['usage']
         self.checked = properties['checked']
         self.nodes = properties['nodes']
@@ -1033,16 +1168,10 @@ class ComponetConnection:
 
         return f'Name: {self.name}, Part name: {self.part}'
 
-    def __eq__(self, other):
-
-        try:
-            return all([self_attr == other_attr
-                    for self_attr, other_attr in zip(self.__dict__.values(),
-                                                    other.__dict__.values())])
-        except AttributeError:
-            return False
+class Component(Primitive):
 
-class Component:
+    __slots__ = ('name', 'xc', 'yc', 'rot_angle', 'start_layer',
+                 'attach_layer', 'property_type')
 
     def __init__(self, properties):
 
@@ -1059,17 +1188,10 @@ class Component:
         return (f'Name: {self.name}, (x, y): ({self.xc}, {self.yc})\n'
                 f'Rotation: {self.rot_angle}')
 
-    def __eq__(self, other):
 
-        try:
-            return all([self_attr == other_attr
-                    for self_attr, other_attr in zip(self.__dict__.values(),
-                                                    other.__dict__.values())])
-        except AttributeError:
-            return False
+class Part(Primitive):
 
-
-class Part:
+    __slots__ = ('name', 'height', 'width', 'x_outline', 'y_outline', 'tags')
 
     def __init__(self, properties):
 
@@ -1084,15 +1206,6 @@ class Part:
 
        return f'Part: {self.name}, Height: {self.height},\nTags: {self.tags}'
 
-    def __eq__(self, other):
-
-        try:
-            return all([self_attr == other_attr
-                    for self_attr, other_attr in zip(self.__dict__.values(),
-                                                    other.__dict__.values())])
-        except AttributeError:
-            return False
-
     def _rotate(self, angle: float, xr: float, yr: float,
                     xp: np.ndarray, yp: np.ndarray):
 
@@ -1250,31 +1363,24 @@ class ComponentParser:
         self.parts[properties['name']] = Part(properties)
 
 
-class Trace:
+class Trace(Primitive):
+
+    __slots__ = ('name', 'rail', 'start_node', 'end_node', 'width', 'layer')
 
     def __init__(self, properties):
 
         self.name = properties['name']
-        self.rail = properties['rail']
+        self.rail = self._intern(properties['rail'])
         self.start_node = properties['start_node']
         self.end_node = properties['end_node']
         self.width = properties['width']
-        self.layer = properties['layer']
+        self.layer = self._intern(properties['layer'])
     
     def __repr__(self):
 
         return (f'Name: {self.name}, Rail: {self.rail}\n'
                 f'Width: {self.width}, Layer: {self.layer}')
 
-    def __eq__(self, other):
-
-        try:
-            return all([self_attr == other_attr
-                    for self_attr, other_attr in zip(self.__dict__.values(),
-                                                    other.__dict__.values())])
-        except AttributeError:
-            return False
-
     def trace_geom(self, x_start, y_start, x_end, y_end):
 
         if self.width is None:
@@ -1311,7 +1417,14 @@ class Plotter:
         self.comps_to_plot = []
         self.ports_to_plot = []
 
-    def plot_shapes(self, p, layer, unit, background_clr, fill_alpha=1):
+    def shapes_geom(self, layer, unit, background_clr):
+        '''Geometry of the shapes of a layer.
+
+        :return: Polygon coordinates, colors, names and net names (xs, ys, clr,
+        shape_names, shape_net_names) and circle centers, radii and colors
+        (xc, yc, radii, clr_cir)
+        :rtype: dict[list]
+        '''
 
         xs, ys, xc, yc = [], [], [], []
         clr, clr_cir, radii = [], [], []
@@ -1339,10 +1452,16 @@ class Plotter:
                     clr_cir.append(self.shape_clr[shape.net_name][0])
                 else:
                     clr_cir.append(background_clr)
-        
-        source = ColumnDataSource(dict(xs=xs, ys=ys, clr=clr,
-                                        shape_names=shape_names,
-                                        shape_net_names=shape_net_names))
+
+        return dict(xs=xs, ys=ys, clr=clr, shape_names=shape_names,
+                    shape_net_names=shape_net_names,
+                    xc=xc, yc=yc, radii=radii, clr_cir=clr_cir)
+
+    def plot_shapes(self, p, layer, unit, background_clr, fill_alpha=1):
+
+        geom = self.shapes_geom(layer, unit, background_clr)
+        source = ColumnDataSource({key: geom[key] for key in
+                                   ('xs', 'ys', 'clr', 'shape_names', 'shape_net_names')})
 
         patch_glyph = Patches(xs='xs', ys='ys', fill_color='clr',
                                 fill_alpha=fill_alpha, line_color='gray')
@@ -1356,8 +1475,7 @@ class Plotter:
         #hover_tool.renderers.append(shapes_r)
         #ipythonp.add_tools(hover_tool)
 
-        source = ColumnDataSource(dict(xc=xc, yc=yc, radii=radii,
-                                        clr_cir=clr_cir))
+        source = ColumnDataSource({key: geom[key] for key in ('xc', 'yc', 'radii', 'clr_cir')})
         p.circle(x='xc', y='yc', radius='radii', color='clr_cir',
                     line_color='gray', alpha=fill_alpha, source=source)
 
@@ -1602,7 +1720,13 @@ class Plotter:
             if prev_doc:
                 prev_doc.remove_root(model)
         
-    def plot_node_pads(self, p, layer, unit, background_clr):
+    def node_pads_geom(self, layer, unit, background_clr):
+        '''Geometry of the node pads of a layer.
+
+        :return: Polygon coordinates and colors (x, y, clr) and circle
+        centers, radii and colors (xcir, ycir, radii, clr_cir)
+        :rtype: dict[list]
+        '''
 
         x, y = [], []
         clr = []
@@ -1641,17 +1765,29 @@ class Plotter:
                     radii.append(padstack.plating_thickness*self.units[unit])
                     clr_cir.append(background_clr)
 
-        source = ColumnDataSource(dict(x=x, y=y, clr=clr))
+        return dict(x=x, y=y, clr=clr, xcir=xcir, ycir=ycir, radii=radii, clr_cir=clr_cir)
+
+    def plot_node_pads(self, p, layer, unit, background_clr):
+
+        geom = self.node_pads_geom(layer, unit, background_clr)
+        source = ColumnDataSource({key: geom[key] for key in ('x', 'y', 'clr')})
         p.patches(xs='x', ys='y', color='clr',
                     line_color='gray', source=source)
-        source = ColumnDataSource(dict(xcir=xcir, ycir=ycir, radii=radii,
-                                        clr_cir=clr_cir))
+        source = ColumnDataSource({key: geom[key] for key in ('xcir', 'ycir', 'radii', 'clr_cir')})
         p.circle(x='xcir', y='ycir', radius='radii', color='clr_cir',
                     line_color='gray', source=source)
 
         return p
 
-    def plot_vias(self, p, layer, unit, background_clr):
+    def vias_geom(self, layer, unit, background_clr):
+        '''Geometry of the vias of a layer.
+
+        :return: Via outline coordinates and colors (x, y, clr), non circular
+        pad coordinates and colors (xpad, ypad, clr_pad), circular pad
+        centers, radii and colors (xcir, ycir, radii, clr_cir) and plating
+        centers and radii (xcir_anti, ycir_anti, radii_anti)
+        :rtype: dict[list]
+        '''
 
         x, y = [], []
         clr = []
@@ -1695,17 +1831,24 @@ class Plotter:
                 ypad.append(yvec*self.units[unit])
                 clr_pad.append(self.shape_clr[via.net_name][0])
 
+        return dict(x=x, y=y, clr=clr, xpad=xpad, ypad=ypad, clr_pad=clr_pad,
+                    xcir=xcir, ycir=ycir, radii=radii, clr_cir=clr_cir,
+                    xcir_anti=xcir_anti, ycir_anti=ycir_anti, radii_anti=radii_anti)
+
+    def plot_vias(self, p, layer, unit, background_clr):
+
+        geom = self.vias_geom(layer, unit, background_clr)
+        xcir, ycir, radii, clr_cir = geom['xcir'], geom['ycir'], geom['radii'], geom['clr_cir']
         if self.plot_flags['pads']:
             source = ColumnDataSource(dict(xcir=xcir, ycir=ycir, radii=radii,
                                             clr_cir=clr_cir))
             p.circle(x='xcir', y='ycir', radius='radii', color='clr_cir',
                         line_color='gray', source=source)
-            source = ColumnDataSource(dict(xcir_anti=xcir_anti, ycir_anti=ycir_anti,
-                                            radii_anti=radii_anti))
+            source = ColumnDataSource({key: geom[key] for key in
+                                       ('xcir_anti', 'ycir_anti', 'radii_anti')})
             p.circle(x='xcir_anti', y='ycir_anti', radius='radii_anti',
                         color=background_clr, line_color='gray', source=source)
-        source = ColumnDataSource(dict(xpad=xpad, ypad=ypad,
-                                        clr_pad=clr_pad))
+        source = ColumnDataSource({key: geom[key] for key in ('xpad', 'ypad', 'clr_pad')})
         p.patches(xs='xpad', ys='ypad', color='clr_pad', fill_alpha=0,
                     line_color='gray', source=source)
         if self.plot_flags['pads']:
@@ -1713,7 +1856,7 @@ class Plotter:
                                             clr_cir=clr_cir))
             p.circle(x='xcir', y='ycir', radius='radii', color='clr_cir',
                         fill_alpha=0, line_color='gray', source=source)
-        source = ColumnDataSource(dict(x=x, y=y, clr=clr))
+        source = ColumnDataSource({key: geom[key] for key in ('x', 'y', 'clr')})
         p.patches(xs='x', ys='y', color='clr', fill_alpha=0,
                     line_color='gray', source=source)
         
@@ -1863,7 +2006,13 @@ class Plotter:
         
         return p
 
-    def plot_traces(self, p, layer, unit, background_clr):
+    def traces_geom(self, layer, unit, background_clr):
+        '''Geometry of the traces of a layer.
+
+        :return: Trace coordinates and colors (x, y, clr) and end cap
+        centers, radii and colors (xcir, ycir, radii, cir_clr)
+        :rtype: dict[list]
+        '''
 
         x, y = [], []
         clr = []
@@ -1884,10 +2033,15 @@ class Plotter:
             radii.append((trace.width/2)*self.units[unit])
             cir_clr.append(self.shape_clr[trace.rail][0])
 
-        source = ColumnDataSource(dict(x=x, y=y, clr=clr))
+        return dict(x=x, y=y, clr=clr, xcir=xcir, ycir=ycir, radii=radii, cir_clr=cir_clr)
+
+    def plot_traces(self, p, layer, unit, background_clr):
+
+        geom = self.traces_geom(layer, unit, background_clr)
+        source = ColumnDataSource({key: geom[key] for key in ('x', 'y', 'clr')})
         p.patches(xs='x', ys='y', color='clr', source=source)
-        source = ColumnDataSource(dict(xcir=xcir, ycir=ycir,
-                                        radii=radii, cir_clr=clr))
+        source = ColumnDataSource(dict(xcir=geom['xcir'], ycir=geom['ycir'],
+                                        radii=geom['radii'], cir_clr=geom['clr']))
         p.circle(x='xcir', y='ycir', radius='radii',
                     color='cir_clr', source=source)
         
@@ -2052,26 +2206,19 @@ class Database(Plotter):
 
     def __eq__(self, other):
 
-        attrs = []
+        # Dictionary comparison checks the sizes and keys first
+        # and stops at the first primitive that differs
         try:
-            self_attrs = [self.stackup, self.nodes, self.ports,
-                            self.vias, self.parts, self.components,
-                            self.connects, self.traces]
-            other_attrs = [other.stackup, other.nodes, other.ports,
-                            other.vias, other.parts, other.components,
-                            other.connects, other.traces]
-
-            for self_attr, other_attr in zip(self_attrs, other_attrs):
-                for self_prop, other_prop in zip(self_attr.values(),
-                                                other_attr.values()):
-                    attrs.append(self_prop == other_prop)
-            attrs.append(self.lines == other.lines)
-            for self_pad_bylayer, other_pad_bylayer in zip(self.padstacks.values(),
-                                                            other.padstacks.values()):
-                for self_pad, other_pad in zip(self_pad_bylayer.values(),
-                                                other_pad_bylayer.values()):
-                    attrs.append(self_pad == other_pad)
-            return all(attrs)
+            return (self.lines == other.lines
+                    and self.stackup == other.stackup
+                    and self.nodes == other.nodes
+                    and self.ports == other.ports
+                    and self.vias == other.vias
+                    and self.parts == other.parts
+                    and self.components == other.components
+                    and self.connects == other.connects
+                    and self.traces == other.traces
+                    and dict(self.padstacks) == dict(other.padstacks))
         except AttributeError:
             return False
         
@@ -2100,79 +2247,82 @@ class Database(Plotter):
                                 
         return sections[section][self.db_ver]
 
-    def find_overlap_vias(self, layer):
-        '''Find overlapping vias on a specified layer.
-        When two vias are detected to be overlapping,
-        the one that transvers less layers is selected to be removed.
+    def _pad_radius(self, padstack, layer):
+        '''Find the TSV radius of a padstack on a given layer.
+        If the padstack is not defined on the layer, the layer independent
+        definition is used, otherwise the first found layer definition.
 
-        :param layer: Layer name to detect overlapping vias
+        :param padstack: Padstack name
+        :type padstack: str
+        :param layer: Layer name
         :type layer: str
-        :return: Names of the overlapping vias
-        :rtype: list[str]
+        :return: TSV radius, NaN if it is not defined
+        :rtype: float
         '''
 
-        @dataclass
-        class Vias:
-
-            vias: List[Via] = field(default_factory=list)
-            x: List[float] = field(default_factory=list)
-            y: List[float] = field(default_factory=list)
-            r: List[float] = field(default_factory=list)
+        pads = self.padstacks[padstack]
+        if layer in pads:
+            pad = pads[layer]
+        elif None in pads:
+            pad = pads[None]
+        else:
+            pad = next(iter(pads.values()))
 
-            def __iter__(self):
+        return np.nan if pad.tsv_radius is None else pad.tsv_radius
 
-                return iter((self.vias, self.x, self.y, self.r))
+    def find_overlap_vias(self, layer=None):
+        '''Find overlapping vias on the specified layers.
+        Vias starting on a layer and vias ending on a layer are checked
+        separately. Two vias overlap when the distance between their centers
+        is greater than zero and smaller than the sum of their TSV radii.
+        All layers are checked in a single pass using a k-d tree, so
+        only neighbouring vias are compared.
 
-        upper_vias = Vias()
-        lower_vias = Vias()
+        :param layer: Layer name(s) to detect overlapping vias.
+        If None, all layers are checked, defaults to None
+        :type layer: str or list[str], optional
+        :return: Names of the overlapping vias
+        :rtype: list[str]
+        '''
 
-        for via in self.vias.values():
-            if via.padstack is None:
+        layers = None if layer is None else {layer} if isinstance(layer, str) else set(layer)
+        vias = [via for via in self.vias.values() if via.padstack is not None]
+
+        # Each via is checked on its upper layer, and on its lower layer
+        # if it is different than the upper one
+        groups = defaultdict(list)
+        for idx, via in enumerate(vias):
+            if layers is None or via.upper_layer in layers:
+                groups[(via.upper_layer, 'upper', via.padstack)].append(idx)
+            if (via.lower_layer != via.upper_layer
+                    and (layers is None or via.lower_layer in layers)):
+                groups[(via.lower_layer, 'lower', via.padstack)].append(idx)
+
+        # Resolve the radius once per padstack and layer
+        side_idxs = defaultdict(list)
+        side_r = defaultdict(list)
+        for (via_layer, side, padstack), idxs in groups.items():
+            side_idxs[(via_layer, side)] += idxs
+            side_r[(via_layer, side)].append(np.full(len(idxs),
+                                                self._pad_radius(padstack, via_layer)))
+
+        xy = np.array([(via.x, via.y) for via in vias], dtype=float).reshape(-1, 2)
+        overlap_vias = set()
+        for (via_layer, side), idxs in side_idxs.items():
+            idxs = np.array(idxs)
+            rvias = np.concatenate(side_r[(via_layer, side)])
+            if len(idxs) < 2 or np.isnan(rvias).all():
                 continue
-            if via.upper_layer == layer:
-                try:
-                    pad = self.padstacks[via.padstack][via.upper_layer]
-                except KeyError:
-                    if None in self.padstacks[via.padstack]:
-                        pad = self.padstacks[via.padstack][None]
-                    else:
-                        first_found_layer = list(self.padstacks[via.padstack].keys())[0]
-                        pad = self.padstacks[via.padstack][first_found_layer]
-                upper_vias.r.append(pad.tsv_radius)
-                upper_vias.vias.append(via)
-                upper_vias.x.append(via.x)
-                upper_vias.y.append(via.y)
-            elif via.lower_layer == layer:
-                try:
-                    pad = self.padstacks[via.padstack][via.lower_layer]
-                except KeyError:
-                    if None in self.padstacks[via.padstack]:
-                        pad = self.padstacks[via.padstack][None]
-                    else:
-                        first_found_layer = list(self.padstacks[via.padstack].keys())[0]
-                        pad = self.padstacks[via.padstack][first_found_layer]
-                lower_vias.r.append(pad.tsv_radius)
-                lower_vias.vias.append(via)
-                lower_vias.x.append(via.x)
-                lower_vias.y.append(via.y)
-
-        overlap_vias = []
-        for via_data in [upper_vias, lower_vias]:
-            vias = np.array(via_data.vias)
-            xvias = np.array(via_data.x)
-            yvias = np.array(via_data.y)
-            rvias = np.array(via_data.r)
-            zeros = np.zeros(len(vias))
-
-            for rvia, via in zip(rvias, vias):
-                dist = np.sqrt((xvias - via.x)**2 + (yvias - via.y)**2)
-                overlap_via = vias[(dist < (rvias + rvia)) & (dist > zeros)]
-                if overlap_via.any():
-                    overlap_vias.append(via.name)
-
-        if overlap_vias:
-            logger.info(f'Overlapping vias are found on layer {layer}')
-        return list(set(overlap_vias))
+            # Only pairs closer than the largest possible overlap distance are compared
+            pairs = cKDTree(xy[idxs]).query_pairs(2*np.nanmax(rvias), output_type='ndarray')
+            dist = np.hypot(*(xy[idxs[pairs[:, 0]]] - xy[idxs[pairs[:, 1]]]).T)
+            overlap = (dist > 0) & (dist < rvias[pairs[:, 0]] + rvias[pairs[:, 1]])
+            found = {vias[idx].name for idx in idxs[pairs[overlap].ravel()]}
+            if found:
+                logger.info(f'Overlapping vias are found on layer {via_layer}')
+                overlap_vias |= found
+
+        return list(overlap_vias)
     
     def delete_overlap_vias(self, ignore_layers=None, save=True):
         '''Delete overlapping vias from all layers except
@@ -2183,24 +2333,20 @@ class Database(Plotter):
         :type ignore_layers: list[str], optional
         '''
 
-        layers = self.layer_names(verbose=False)
         ignore_layers = [] if ignore_layers is None else ignore_layers
+        layers = [layer for layer in self.layer_names(verbose=False)
+                    if layer not in ignore_layers]
 
         logger.info('Checking for overlapping vias...')
-        vias_to_delete = []
-        for layer in layers:
-            if layer not in ignore_layers:
-                vias_to_delete += self.find_overlap_vias(layer)
+        vias_to_delete = set(self.find_overlap_vias(layers))
 
         if vias_to_delete:
             logger.info('Deleting overlapping vias... ')
             line_gen = self.extract_block('* Via description lines',
                                         '* WirebondDefination description lines')
             for idx, line in line_gen:
-                if 'Via' in line:
-                    via_name = line.split('::')[0]
-                    if via_name in vias_to_delete:
-                        self.lines[idx] = f'* {line}'
+                if 'Via' in line and line.split('::')[0] in vias_to_delete:
+                    self.lines[idx] = f'* {line}'
 
             if save:
                 self.save()
@@ -2312,15 +2458,66 @@ class Database(Plotter):
 
         return merge_map
     
-    def merge_nets(self, fname_db=None, nets_to_merge='VXBR*', save=True):
+    def _merge_lines(self, net_map):
+        '''Rewrite the database lines with the merged net names.
+        All the nets are matched with a single compiled regular expression,
+        longest names first, so when two merged net names start the same,
+        the longer one is not partially replaced.
+
+        :param net_map: Mapping of the net names to merge and the nets they are merged to
+        :type net_map: dict
+        :return: Generator of the rewritten lines
+        :rtype: generator
+        '''
 
-        def net_in_line(nets, line):
+        match = re.compile('|'.join(re.escape(net)
+                                    for net in sorted(net_map, key=len, reverse=True)))
+        for line in self.lines:
+            if match.search(line) is None:
+                yield line
+            elif 'Color' in line and '-> PowerNets' not in line:
+                yield ''
+            else:
+                yield match.sub(lambda found: net_map[found.group()], line)
+
+    def _merge_primitives(self, net_map):
+        '''Update the net names of the loaded primitives
+        after merging nets, instead of reloading the database.
+
+        :param net_map: Mapping of the net names to merge and the nets they are merged to
+        :type net_map: dict
+        '''
+
+        for node in self.nodes.values():
+            node.rail = net_map.get(node.rail, node.rail)
+        for prims in (self.shapes, self.vias):
+            for prim in prims.values():
+                prim.net_name = net_map.get(prim.net_name, prim.net_name)
+        for trace in self.traces.values():
+            trace.rail = net_map.get(trace.rail, trace.rail)
+        for port in self.ports.values():
+            port.pos_rails, port.neg_rails = port._find_port_rails()
+        for net in net_map:
+            self.net_names.pop(net, None)
+            self.shape_clr.pop(net, None)
+
+    def merge_nets(self, fname_db=None, nets_to_merge='VXBR*', save=True):
+        '''Merge nets, typically switching nodes, with the nets they are
+        connected to. If fname_db is provided and save is True, the merged
+        database is written to fname_db and this database is not modified.
+        Otherwise, the lines and the loaded primitives of this database are
+        updated in place.
+
+        :param fname_db: File name of the merged database, defaults to None
+        :type fname_db: str, optional
+        :param nets_to_merge: Net names to merge, wildcards can be used, defaults to 'VXBR*'
+        :type nets_to_merge: str or list[str], optional
+        :param save: If True, the merged database is saved, defaults to True
+        :type save: bool, optional
+        :return: The merged database
+        :rtype: :class:`speed.Database()`
+        '''
 
-            for net in nets:
-                if net in line:
-                    return True
-            return False
-        
         nets_to_merge = self.rail_names(nets_to_merge, enabled=True, verbose=False)
         logger.info('Merging nets... ')
         net_map = self.match_nets(nets_to_merge)
@@ -2330,27 +2527,23 @@ class Database(Plotter):
             return
         
         logger.info('Net merging map is created... ', end='')
-        backup_lines = deepcopy(self.lines)
-
-        for idx, line in enumerate(self.lines.copy()):
-            if net_in_line(nets_to_merge, line):
-                for from_net, to_net in net_map.items():
-                    if from_net in line:
-                        if 'Color' in line and '-> PowerNets' not in line:
-                            self.lines[idx] = ''
-                        else:
-                            self.lines[idx] = line.replace(from_net, to_net)
-                        break
 
         if save and fname_db is not None:
-            self.save(fname_db)
-            self.lines = backup_lines
-        elif save:
-            self.save(fname_db)
+            # Stream the merged lines to the new database file
+            fname = fname_db if os.path.dirname(fname_db) else os.path.join(self.path, fname_db)
+            materialize(fname)
+            with open(fname, 'wt') as f:
+                f.writelines(self._merge_lines(net_map))
+            logger.info('Merging is done')
+            return Database(fname)
+
+        self.lines = list(self._merge_lines(net_map))
+        self._merge_primitives(net_map)
+        if save:
+            self.save()
         logger.info('Merging is done')
 
-        return Database(os.path.join(self.path, self.name
-                                    if fname_db is None else fname_db))
+        return self
 
     '''
     def match_nets(self, nets_to_merge='VXBR*',
@@ -2476,7 +2669,8 @@ class Database(Plotter):
                     'fillin_dielec': 'Fill-in Dielectric', 'perm': 'Er',
                     'loss_tangent': 'Loss Tangent'}
         for layer in self.stackup.values():
-            for data_type, data in layer.__dict__.items():
+            for data_type in layer.__slots__:
+                data = getattr(layer, data_type)
                 try:
                     if data_type == 'thickness':
                         data = data*self.units[unit]
@@ -3046,22 +3240,15 @@ class Database(Plotter):
 
     def _find_ports_center(self):
 
-        all_nodes = []
-        for port in self.ports.values():
-            pos_nodes = [self.nodes[node] for node in port.pos_nodes]
-            neg_nodes = [self.nodes[node] for node in port.neg_nodes]
-            port_nodes = pos_nodes + neg_nodes
-            all_nodes += port_nodes
-            port.x_center = (min(port_nodes, key=attrgetter('x')).x
-                            + max(port_nodes, key=attrgetter('x')).x)/2
-            port.y_center = (min(port_nodes, key=attrgetter('y')).y
-                            + max(port_nodes, key=attrgetter('y')).y)/2
+        boxes = Port.find_boxes(self.ports.values())
 
         # Find coordinates of the most top left and bottom right db area
-        self.box_x1 = min(all_nodes, key=attrgetter('x')).x
-        self.box_y1 = max(all_nodes, key=attrgetter('y')).y
-        self.box_x2 = max(all_nodes, key=attrgetter('x')).x
-        self.box_y2 = min(all_nodes, key=attrgetter('y')).y
+        self.box_x1 = boxes['box_x1'].min()
+        self.box_y1 = boxes['box_y2'].max()
+        self.box_x2 = boxes['box_x2'].max()
+        self.box_y2 = boxes['box_y1'].min()
+
+        return boxes
 
     def find_comps(self, comp_names=None, verbose=True, obj=None):
         '''Find components based on wildcard search.
@@ -3402,6 +3589,8 @@ class Database(Plotter):
         if not os.path.dirname(fname):
             fname = os.path.join(self.path, fname)
 
+        # A layout of a cloned project gets its own copy before it is written
+        materialize(fname)
         with open(fname, 'wt') as f:
             f.writelines(self.lines)
 
@@ -1,6 +1,9 @@
 import os
+import glob
 import subprocess
 
+from thinkpi.backend_api.clone import materialize
+
 
 class hspice:
     def __init__(self):
@@ -10,12 +13,21 @@ class hspice:
 		
         self.hspice_path	=	idemmp_path + r'/hspice.com'
 		
-    def hspice_run(self,inFile):
+    def hspice_run(self,inFile,cache=None):
         inFile=os.path.abspath(inFile)
         inFile_no_ext=os.path.splitext(inFile)[0]
         bat_filename=f'{inFile_no_ext}.bat'
+        # Outputs of a cloned study are overwritten in place
+        for fname in glob.glob(f'{glob.escape(inFile_no_ext)}.*'):
+            materialize(fname)
         with open(bat_filename, 'w') as f:
             bat_file_line= f'{self.hspice_path}  -i  "{inFile}"  -o   "{inFile_no_ext}.lis"'
             f.write(bat_file_line)     
             
-        subprocess.call(bat_filename)
\ No newline at end of file
+        if cache is None:
+            subprocess.call(bat_filename)
+        else:
+            # Restore the outputs of an identical previous run if possible
+            cache.run([inFile],lambda: subprocess.call(bat_filename)==0,
+                      [f'{os.path.basename(inFile_no_ext)}.*'],
+                      {'tool':self.hspice_path})
\ No newline at end of file
@@ -1,8 +1,17 @@
 import os
 import csv
+import copy
+import atexit
 import pathlib
 import shutil
 import re
+import time
+import json
+import hashlib
+import difflib
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor,as_completed
 from math import log10
 import numpy as np
 from enum import Enum
@@ -11,6 +20,7 @@ import pandas as pd
 
 from thinkpi.operations import speed as spd
 from thinkpi.tools.sysutils import TextProcessor,EventLogger,Io,Cmds,ProcessManager
+from thinkpi.tools.runjournal import RunJournal
 
 
 class SubcktParsingState(Enum):
@@ -84,6 +94,10 @@ class Subckt:
     :param parsing_state: subckt parsing state.
     :type name:SubcktParsingState
     """
+    #SubcktIndex used to load the subckt definitions, parsed files are then
+    #not parsed again while they do not change
+    index=None
+
     def __init__(self,fpath=None):       
         """Initialize the Subckt object.
 
@@ -108,6 +122,14 @@ class Subckt:
         """
         fname=os.path.abspath(fname)        
         self.fpath=fname             
+        if self.index is not None:
+            info=self.index.first_subckt(fname)
+            if info is not None:
+                self.name=info['name']
+                self.ports=list(info['ports'])
+                self.params=[list(param) for param in info['params']]
+                self.parsing_state=SubcktParsingState.COMPLETED
+                return
         lines=[]        
         with open(fname) as f:
             lines = f.readlines()
@@ -169,6 +191,10 @@ class Subckt:
                 if(words[i]=='+'):
                     i+=1                                                  
                 
+                if(i<len(words) and words[i]=='params:'):
+                    #keyword before the parameters, not a port
+                    i+=1
+                    continue
                 if(i+1<len(words)):                    
                     if(words[i+1]=='='):
                         self.parsing_state=SubcktParsingState.PARAMS
@@ -194,6 +220,293 @@ class Subckt:
                     break
 
 
+class SubcktIndex:
+    """On-disk index of the subckt definitions of Spice files.
+
+    For every parsed file the index stores the name, ports and parameters of
+    its subckts and the files and .lib sections it includes. A file is parsed 
+    again only when its modification time and size change and its content 
+    hash changes too. Finding the file that defines a subckt is a dictionary
+    lookup.
+    """
+    #Entries parsed by another version of parse() are parsed again
+    version=2
+    include_pattern=re.compile(r"""^\.(inc|include|lib)\s+['"]?([^'"\s]+)['"]?(?:\s+(\S+))?""",
+                             re.IGNORECASE)
+    #Control line with its continuation and comment lines
+    control_pattern=re.compile(r'^[ \t]*\.[^\n]*(?:\n[ \t]*[+*][^\n]*)*',re.MULTILINE)
+
+    def __init__(self,index_dir=None):
+        """Initialize the index
+
+        :param index_dir: Folder of the index file, defaults to None. If None,
+        .thinkpi in the user home folder is used.
+        :type index_dir: str, optional
+        """
+        if index_dir is None:
+            index_dir=os.path.join(os.path.expanduser('~'),'.thinkpi')
+        os.makedirs(index_dir,exist_ok=True)
+        self.index_path=os.path.join(index_dir,'subckt_index.json')
+        self.lock=threading.Lock()
+        self.parsed=0
+        self.reused=0
+        self.dirty=False
+        self.files=self._load()
+        self._build_names()
+        atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError,json.JSONDecodeError):
+            return {}
+
+    def _build_names(self):
+        self.names={}
+        for fpath,entry in self.files.items():
+            for info in entry['subckts']:
+                self._add_name(info['name'],fpath)
+
+    def _add_name(self,name,fpath):
+        fpaths=self.names.setdefault(name,[])
+        if fpath not in fpaths:
+            fpaths.append(fpath)
+
+    def save(self):
+        """Write the index to disk, if it changed. Entries written by other
+        processes meanwhile are kept.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            files=self._load()
+            files.update(self.files)
+            tmp_path=f'{self.index_path}.{os.getpid()}.tmp'
+            with open(tmp_path,'w') as f:
+                json.dump(files,f,separators=(',',':'))
+            os.replace(tmp_path,self.index_path)
+            self.dirty=False
+
+    @classmethod
+    def logical_lines(cls,text):
+        """Find the control lines of Spice text: comments are removed and the 
+        continuation lines starting with '+' are joined to the control line.
+        Element lines are skipped.
+
+        :param text: Spice text
+        :type text: str
+        :return: Line number and text of each control line
+        :rtype: list[tuple[int, str]]
+        """
+        lines=[]
+        num=0
+        pos=0
+        for match in cls.control_pattern.finditer(text):
+            num+=text.count('\n',pos,match.start())
+            pos=match.start()
+            parts=[]
+            for line in match.group().splitlines():
+                line=line.split('$')[0].strip()
+                if line and line[0]!='*':
+                    parts.append(line.lstrip('+'))
+            lines.append((num,' '.join(parts)))
+        return lines
+
+    @classmethod
+    def parse(cls,fpath):
+        """Parse the subckts and includes of a Spice file
+
+        :param fpath: Spice file path
+        :type fpath: str
+        :return: subckts and includes of the file
+        :rtype: dict
+        """
+        with open(fpath,errors='ignore') as f:
+            text=f.read()
+        folder=os.path.dirname(fpath)
+        subckts=[]
+        includes=[]
+        section=None
+        for num,text_line in cls.logical_lines(text):
+            #Names are case insensitive, file paths may not be
+            line=text_line.lower()
+            if line.startswith('.subckt'):
+                words=line.replace('=',' = ').split()
+                if len(words)<2:
+                    continue
+                ports=[]
+                params=[]
+                i=2
+                while i<len(words):
+                    if i+2<len(words) and words[i+1]=='=':
+                        params.append([words[i],words[i+2]])
+                        i+=3
+                    elif params or words[i]=='params:' or words[i]=='=':
+                        i+=1
+                    else:
+                        ports.append(words[i])
+                        i+=1
+                subckts.append({'name':words[1],'ports':ports,'params':params,
+                                'line':num+1,'lib':section})
+            elif line.startswith('.endl'):
+                section=None
+            else:
+                match=cls.include_pattern.match(text_line)
+                if match is None:
+                    continue
+                kind,name,lib_section=match.groups()
+                kind=kind.lower()
+                if lib_section is not None:
+                    lib_section=lib_section.lower()
+                if kind=='lib' and lib_section is None:
+                    #start of a library section
+                    section=name.lower()
+                    continue
+                path=os.path.normpath(os.path.join(folder,name))
+                includes.append({'kind':'lib' if kind=='lib' else 'inc',
+                                 'path':path,'section':lib_section,'lib':section})
+        return {'subckts':subckts,'includes':includes}
+
+    def _update(self,fpath):
+        stat=os.stat(fpath)
+        entry=self.files.get(fpath)
+        if entry and entry.get('version')!=self.version:
+            entry=None
+        if entry and entry['size']==stat.st_size and entry['mtime']==stat.st_mtime:
+            self.reused+=1
+            return entry,False
+        h=hashlib.sha256()
+        with open(fpath,'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20),b''):
+                h.update(chunk)
+        digest=h.hexdigest()
+        if entry and entry['hash']==digest:
+            self.reused+=1
+            entry.update(size=stat.st_size,mtime=stat.st_mtime)
+            self.dirty=True
+            return entry,True
+        self.parsed+=1
+        entry={'size':stat.st_size,'mtime':stat.st_mtime,'hash':digest,
+               'version':self.version,**self.parse(fpath)}
+        with self.lock:
+            for names in self.names.values():
+                if fpath in names:
+                    names.remove(fpath)
+            self.files[fpath]=entry
+            for info in entry['subckts']:
+                self._add_name(info['name'],fpath)
+            self.dirty=True
+        return entry,True
+
+    def index_file(self,fpath,recursive=True,save=True):
+        """Index a Spice file and, optionally, the files it includes
+
+        :param fpath: Spice file path
+        :type fpath: str
+        :param recursive: Index the included files too, defaults to True
+        :type recursive: bool, optional
+        :param save: Write the index to disk when it changed, defaults to True
+        :type save: bool, optional
+        :return: Index entry of the file, None if the file does not exist
+        :rtype: dict
+        """
+        fpath=os.path.abspath(fpath)
+        to_index=[fpath]
+        seen=set()
+        while to_index:
+            path=to_index.pop()
+            if path in seen or not os.path.isfile(path):
+                continue
+            seen.add(path)
+            entry,_=self._update(path)
+            if recursive:
+                to_index+=[inc['path'] for inc in entry['includes']]
+        if save:
+            self.save()
+        return self.files.get(fpath)
+
+    def index_folder(self,folder,patterns=('*.inc','*.cir','*.sp','*.lib'),recursive=True):
+        """Index all the Spice files of a folder
+
+        :param folder: Folder path
+        :type folder: str
+        :param patterns: File name wildcards, defaults to ('*.inc','*.cir','*.sp','*.lib')
+        :type patterns: tuple[str], optional
+        :param recursive: Search the sub folders, defaults to True
+        :type recursive: bool, optional
+        """
+        for fpath in Io.find_in_folder(folder,list(patterns),recursive):
+            self.index_file(fpath,save=False)
+        self.save()
+
+    def first_subckt(self,fpath):
+        """Get the first subckt defined in a file
+
+        :param fpath: Spice file path
+        :type fpath: str
+        :return: Name, ports and parameters of the subckt, None if the file
+        defines no subckt
+        :rtype: dict
+        """
+        entry=self.index_file(fpath,recursive=False,save=False)
+        if not entry or not entry['subckts']:
+            return None
+        return entry['subckts'][0]
+
+    def included_files(self,fpath):
+        """Find the files included by a file, transitively. Only the subckts
+        of the referenced .lib sections are visible from the including file.
+
+        :param fpath: Spice file path
+        :type fpath: str
+        :return: Included file paths and the .lib sections used from each of
+        them. A None section means the whole file is included.
+        :rtype: dict
+        """
+        fpath=os.path.abspath(fpath)
+        self.index_file(fpath)
+        visible={fpath:{None}}
+        to_visit=[fpath]
+        while to_visit:
+            path=to_visit.pop()
+            entry=self.files.get(path)
+            if entry is None:
+                continue
+            for inc in entry['includes']:
+                if inc['lib'] not in visible[path]:
+                    continue
+                sections=visible.setdefault(inc['path'],set())
+                if inc['section'] not in sections:
+                    sections.add(inc['section'])
+                    to_visit.append(inc['path'])
+        return visible
+
+    def find(self,name,fpath=None):
+        """Find the definitions of a subckt
+
+        :param name: subckt name
+        :type name: str
+        :param fpath: Only search the definitions visible from this file and
+        its includes, defaults to None
+        :type fpath: str, optional
+        :return: Path of the defining file and the name, ports, parameters,
+        line and .lib section of the subckt, for each definition
+        :rtype: list[tuple[str, dict]]
+        """
+        name=name.lower()
+        visible=None if fpath is None else self.included_files(fpath)
+        found=[]
+        for path in self.names.get(name,[]):
+            for info in self.files[path]['subckts']:
+                if info['name']!=name:
+                    continue
+                if visible is not None and info['lib'] not in visible.get(path,()):
+                    continue
+                found.append((path,info))
+        return found
+
+
 class SubcktInstance:
     """
     Represents an instance of a circuit in a Spice deck.
@@ -1215,9 +1528,199 @@ class PSITerminationFile:
         return sub
 
 
+class ModelCache:
+    """Cache of the PSI models and subcircuits parsed in the current process.
+
+    Decks built one after the other often use the same layouts and die or
+    capacitor models. Each file is parsed once and the decks receive copies
+    of the parsed model. An entry is reloaded when the size or modification
+    time of one of its files changes, and the reloaded model replaces it.
+    Folders are stamped with the files they contain, since editing a file 
+    does not change the folder modification time. Models no longer needed
+    are dropped with retain.
+    """
+    def __init__(self):
+        self.models={}
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self.lock=threading.Lock()
+
+    @staticmethod
+    def _file_stamp(path):
+        stat=os.stat(path)
+        return (stat.st_size,stat.st_mtime_ns)
+
+    @classmethod
+    def _stamp(cls,path):
+        if path and os.path.isfile(path):
+            return (os.path.abspath(path),cls._file_stamp(path))
+        if path and os.path.isdir(path):
+            files=[]
+            for folder,_,fnames in os.walk(path):
+                for fname in fnames:
+                    fpath=os.path.join(folder,fname)
+                    try:
+                        files.append((os.path.relpath(fpath,path),cls._file_stamp(fpath)))
+                    except OSError:
+                        continue
+            return (os.path.abspath(path),tuple(sorted(files)))
+        return (path,None)
+
+    def get(self,kind,paths,load,*args):
+        """Get a parsed model, parsing it on the first request or when
+        one of its files changed
+
+        :param kind: Model type, e.g. 'psi' or 'subckt'
+        :type kind: str
+        :param paths: Files and folders the model is loaded from
+        :type paths: list[str]
+        :param load: Function returning the parsed model
+        :type load: callable
+        :param args: Other arguments changing the parsed model
+        :return: Copy of the parsed model
+        :rtype: object
+        """
+        stamps=tuple(self._stamp(path) for path in paths)
+        key=(kind,)+tuple(stamp[0] for stamp in stamps)+args
+        with self.lock:
+            if key in self.models and self.models[key][0]==stamps:
+                self.hits+=1
+            else:
+                self.misses+=1
+                #replaces the entry of the previous version of the files
+                self.models[key]=(stamps,load())
+            return copy.deepcopy(self.models[key][1])
+
+    def retain(self,paths):
+        """Drop the models not loaded from the given files and folders.
+
+        :param paths: Files and folders of the models to keep
+        :type paths: list[str]
+        """
+        folders=[os.path.abspath(path) for path in paths]
+        def needed(stamps):
+            return any(stamp[0] and (stamp[0]==folder or 
+                       stamp[0].startswith(folder.rstrip(os.sep)+os.sep))
+                       for stamp in stamps for folder in folders)
+        with self.lock:
+            for key in [key for key,(stamps,_) in self.models.items() 
+                        if not needed(stamps)]:
+                del self.models[key]
+                self.evictions+=1
+
+    def clear(self):
+        with self.lock:
+            self.models={}
+
+
+class DeckWriter:
+    """Write a Spice file as a sequence of named sections.
+
+    Each section is written to disk as soon as it is produced, so the text of
+    the whole file is never held in memory. The sections go to a temporary
+    file which replaces the file once all of them are written, so a failed
+    build does not leave a partial file. The SHA-256 and the line range of
+    every section are recorded, which allows finding the sections that changed
+    since a previous build and comparing a file to a golden file section by 
+    section.
+    """
+    def __init__(self,file_path):
+        """Initialize the writer
+
+        :param file_path: Path of the file to write
+        :type file_path: str
+        """
+        self.file_path=os.path.abspath(file_path)
+        self.sections=[]
+        self.name_counts={}
+        self.line_count=0
+        self.file=None
+        self.tmp_path=None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.file_path),exist_ok=True)
+        self.tmp_path=f'{self.file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self.file=open(self.tmp_path,'w')
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path,self.file_path)
+        else:
+            os.remove(self.tmp_path)
+
+    def section(self,name,lines):
+        """Write a section
+
+        :param name: Section name. Repeated names get a counter suffix.
+        :type name: str
+        :param lines: Text of the section
+        :type lines: iterable[str]
+        """
+        self.name_counts[name]=self.name_counts.get(name,0)+1
+        if self.name_counts[name]>1:
+            name=f'{name} ({self.name_counts[name]})'
+        h=hashlib.sha256()
+        count=0
+        for line in lines:
+            self.file.write(line)
+            h.update(line.encode())
+            count+=line.count('\n')
+        self.sections.append({'name':name,'hash':h.hexdigest(),
+                              'start':self.line_count,'lines':count})
+        self.line_count+=count
+
+    @staticmethod
+    def diff(file_path,golden_path,sections=None,golden_sections=None):
+        """Compare a file to a golden file.
+
+        :param file_path: Generated file path
+        :type file_path: str
+        :param golden_path: Golden file path
+        :type golden_path: str
+        :param sections: Sections of the generated file, defaults to None
+        :type sections: list[dict], optional
+        :param golden_sections: Sections of the golden file, defaults to None.
+        If the sections of either file are unknown, the whole files are compared.
+        :type golden_sections: list[dict], optional
+        :return: Unified diff of each section that differs
+        :rtype: dict
+        """
+        with open(file_path) as f:
+            lines=f.read().splitlines(keepends=True)
+        if not os.path.isfile(golden_path):
+            return {'file':[f'Golden file not found: {golden_path}\n']}
+        with open(golden_path) as f:
+            golden_lines=f.read().splitlines(keepends=True)
+        if not sections or not golden_sections:
+            sections=[{'name':'file','hash':None,'start':0,'lines':len(lines)}]
+            golden_sections=[{'name':'file','hash':'','start':0,'lines':len(golden_lines)}]
+
+        new_secs={section['name']:section for section in sections}
+        golden={section['name']:section for section in golden_sections}
+        diffs={}
+        for name in list(new_secs)+[name for name in golden if name not in new_secs]:
+            new_sec=new_secs.get(name)
+            old_sec=golden.get(name)
+            if new_sec and old_sec and new_sec['hash']==old_sec['hash']:
+                continue
+            new=([] if new_sec is None else
+                 lines[new_sec['start']:new_sec['start']+new_sec['lines']])
+            old=([] if old_sec is None else
+                 golden_lines[old_sec['start']:old_sec['start']+old_sec['lines']])
+            diff=list(difflib.unified_diff(old,new,f'golden: {name}',f'new: {name}'))
+            if diff:
+                diffs[name]=diff
+        return diffs
+
+
 class HspiceDeck:
     """Class to build Hspice decks
     """
+    model_cache=None
+
     def __init__(self,case='',deck_path=os.curdir,traceback_limit=0):
         self.deck_path=os.path.abspath(deck_path)
         self.case=case                
@@ -1324,6 +1827,16 @@ class HspiceDeck:
 
         self.main_files=[]
 
+        #sections of the written files, to detect changes between builds.
+        #Only recorded if record_deck_sections is True or golden_folder is set
+        self.record_deck_sections=False
+        self.deck_sections={}
+        self.prev_deck_sections=None
+        self.changed_sections={}
+        #deck folder to compare the written files to, for regression testing
+        self.golden_folder=None
+        self.golden_diffs={}
+
 
 
     
@@ -2220,12 +2733,72 @@ class HspiceDeck:
         :param lines: text to be added in the file
         :type lines: list
         """
-        folder_file = os.path.split(file_path)
-        self.create_folder(folder_file[0])
+        with DeckWriter(file_path) as f:
+            f.section('body',lines)
+        self.record_sections(f)
 
-        with open(file_path, 'w') as f:
-            for line in lines:        
-                f.write(line)
+    @property
+    def sections_file(self):
+        base_file_path=os.path.abspath(self.deck_path+'/deck_sections.json')
+        if not self.case:
+            return base_file_path
+        return Io.custom_file_path(base_file_path,f'_{self.case}')
+
+    def record_sections(self,writer):
+        """Record the sections of a written file. The sections that changed
+        since the previous build are stored in changed_sections. If a 
+        golden_folder is set, the file is compared to the golden file with the
+        same relative path, and the differences are stored in golden_diffs and
+        written next to the file with the .golden.diff extension.
+
+        Nothing is recorded unless record_deck_sections is True or a 
+        golden_folder is set.
+
+        :param writer: Writer of the file
+        :type writer: DeckWriter
+        """
+        if not (self.record_deck_sections or self.golden_folder):
+            return
+        rel_path=os.path.relpath(writer.file_path,os.path.abspath(self.deck_path))
+        if self.prev_deck_sections is None:
+            try:
+                with open(self.sections_file) as f:
+                    self.prev_deck_sections=json.load(f)
+            except (FileNotFoundError,json.JSONDecodeError):
+                self.prev_deck_sections={}
+        prev={section['name']:section['hash']
+              for section in self.prev_deck_sections.get(rel_path,[])}
+        names=[section['name'] for section in writer.sections]
+        self.changed_sections[rel_path]=([section['name'] for section in writer.sections
+                                          if prev.get(section['name'])!=section['hash']]
+                                         +[name for name in prev if name not in names])
+        self.deck_sections[rel_path]=writer.sections
+        self.create_folder(os.path.dirname(self.sections_file))
+        tmp_path=f'{self.sections_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path,'w') as f:
+            json.dump(self.deck_sections,f,indent=1)
+        os.replace(tmp_path,self.sections_file)
+
+        if self.golden_folder:
+            golden_path=os.path.join(self.golden_folder,rel_path)
+            golden_sections=None
+            try:
+                with open(os.path.join(self.golden_folder,
+                                       os.path.basename(self.sections_file))) as f:
+                    golden_sections=json.load(f).get(rel_path)
+            except (FileNotFoundError,json.JSONDecodeError):
+                pass
+            diffs=DeckWriter.diff(writer.file_path,golden_path,
+                                  writer.sections,golden_sections)
+            self.golden_diffs[rel_path]=diffs
+            diff_path=writer.file_path+'.golden.diff'
+            if diffs:
+                with open(diff_path,'w') as f:
+                    for diff in diffs.values():
+                        f.writelines(diff)
+                EventLogger.msg(f'{rel_path} differs from the golden file in: {", ".join(diffs)}')
+            elif os.path.exists(diff_path):
+                os.remove(diff_path)
 
     def Read(self,filename):
         """Read a file
@@ -2772,9 +3345,16 @@ class HspiceDeck:
 
         
 
-        mod=ModPsi()            
+        def load():
+            mod=ModPsi()
+            mod.load_data(db_path,idem_model_path,tstone_path,model_folder,conn_side)
+            return mod
 
-        mod.load_data(db_path,idem_model_path,tstone_path,model_folder,conn_side)
+        if self.model_cache is None:
+            mod=load()
+        else:
+            mod=self.model_cache.get('psi',[db_path,idem_model_path,tstone_path,
+                model_folder],load,conn_side)
         model_name=mod.name
         
         self.psi_models[model_name]=mod
@@ -3661,8 +4241,10 @@ class HspiceDeck:
         return ins
 
     def load_spice_model(self,mod_path):
-        mod=Subckt()
-        mod.load_data(mod_path)
+        if self.model_cache is None:
+            mod=Subckt(mod_path)
+        else:
+            mod=self.model_cache.get('subckt',[mod_path],lambda: Subckt(mod_path))
         self.spice_models[mod.name]=mod
         EventLogger.msg(f'spice model loaded: {mod.name}. path: {mod_path}')
         return mod.name
@@ -4765,153 +5347,127 @@ class HspiceDeck:
         self.set_brd_model_type(brd_model)
 
         self.include_lines=[]
-    
-        lines=[]                
-
-        lines+=self.text_for_header()        
-        lines+=self.text_for_sim_options()
-        lines+=self.text_for_newline()
-        lines+=self.text_for_global_params()
-        lines+=self.text_for_newline()
-        if self.user_data:
-            lines+=self.text_for_commented_tittle('User Data')
-            if isinstance(self.user_data,str):
-                lines.append(self.user_data)
-            else:
-                for user_data_line in self.user_data:
-                    lines.append(user_data_line+'\n')
-        
-        lines+=self.text_for_analysis()
-        lines+=self.text_for_newline()
-        lines+=self.text_for_bode_variable()
-        lines+=self.text_for_newline()
-        lines+=self.text_for_loading_conditions(folder_file[0])
-        lines+=self.text_for_newline()
-        
-        lines+=self.text_for_commented_tittle('PDN')
-        lines+=self.text_for_rl_connector_model(folder_file[0])
-        lines+=self.text_for_newline()
-        if self.die_instances:
-            lines+=self.text_for_comment('dies')
-            for line in self.die_params:            
-                lines.append(line+'\n')
-                
-            for ins_name in self.die_instances:
-                die_ins=self.die_instances[ins_name]     
-                lines+=self.text_for_include(die_ins.model.fpath,folder_file[0])                            
-            lines+=self.text_for_include(self.die_ins_file,folder_file[0])        
-            lines+=self.text_for_newline()
-
-        if self.c4_groups:
-            lines+=self.text_for_insgroup_models(self.c4_groups,'c4 Bump models',folder_file[0])            
-            lines+=self.text_for_comment('C4 Bump instances')
-            lines+=self.text_for_include(self.c4_ins_file,folder_file[0])                      
-            lines+=self.text_for_newline()                            
-        
-        if self.pkg_instance:
-            lines+=self.text_for_comment('pkg')   
-            lines+=self.text_for_psi_external_instance(self.pkg_id,
-            self.pkg_instance.model,self.pkg_tstone_ins_file,
-            self.pkg_ins_file,
-            folder_file[0])                                                              
-            lines+=self.text_for_newline()                 
-        
-        if self.pkg_patch_instance:
-            lines+=self.text_for_comment('pkg patch')   
-            lines+=self.text_for_psi_external_instance(self.pkg_id,
-            self.pkg_patch_instance.model,self.pkg_patch_tstone_ins_file,
-            self.pkg_patch_ins_file,
-            folder_file[0])                                                              
-            lines+=self.text_for_newline()    
-        
-        if self.pkg_int_instance:
-            lines+=self.text_for_comment('pkg int')   
-            lines+=self.text_for_psi_external_instance(self.pkg_id,
-            self.pkg_int_instance.model,self.pkg_int_tstone_ins_file,
-            self.pkg_int_ins_file,
-            folder_file[0])                                                              
-            lines+=self.text_for_newline()  
-
-        if self.mli_groups:
-            lines+=self.text_for_insgroup_models(self.mli_groups,'MLI Models',folder_file[0])            
-            lines+=self.text_for_comment('MLI Instances')
-            lines+=self.text_for_include(self.mli_ins_file,
-            folder_file[0])        
-            lines+=self.text_for_newline()
-
-        if self.skt_groups:
-            lines+=self.text_for_insgroup_models(self.skt_groups,'Socket Models',folder_file[0])            
-            lines+=self.text_for_comment('Socket Instances')
-            lines+=self.text_for_include(self.skt_ins_file,
-            folder_file[0])        
-            lines+=self.text_for_newline()
-
-        if self.brd_instance:
-            lines+=self.text_for_comment('brd')     
-            lines+=self.text_for_psi_external_instance(self.brd_id,
-            self.brd_instance.model,self.brd_tstone_ins_file,
-            self.brd_ins_file,
-            folder_file[0])         
-            lines+=self.text_for_newline()                        
-
-        if self.attd_cap_groups:
-            lines+=self.text_for_insgroup_models(self.attd_cap_groups,
-            'Capacitor models',folder_file[0])
-            lines+=self.text_for_newline()         
-            lines+=self.text_for_comment('Capacitor instances')
-            lines+=self.text_for_include(self.cap_ins_file,
-            folder_file[0])
-            lines+=self.text_for_newline()      
-        
-        #VR
-        if analysis_type != analysis_type.LIN and analysis_type!=analysis_type.TUNE_VR:
-            lines+=self.text_for_commented_tittle('Voltage source')        
-            if self.vr_instance:            
-                lines+=self.text_for_comment('VR')                
-                if not self.vr_info.tlvr_enabled:
-                    lines+=self.text_for_include(self.vr_mod_file,
-                    folder_file[0])
+        start=folder_file[0]
+
+        with DeckWriter(file_path) as deck:
+            deck.section('header',self.text_for_header()+self.text_for_sim_options()
+                         +self.text_for_newline())
+            deck.section('global params',self.text_for_global_params()
+                         +self.text_for_newline())
+            if self.user_data:
+                lines=self.text_for_commented_tittle('User Data')
+                if isinstance(self.user_data,str):
+                    lines.append(self.user_data)
                 else:
-                    lines+=self.text_for_include(self.tlvr_mod_file,
-                    folder_file[0])
-
+                    for user_data_line in self.user_data:
+                        lines.append(user_data_line+'\n')
+                deck.section('user data',lines)
+            
+            deck.section('analysis',self.text_for_analysis()+self.text_for_newline()
+                         +self.text_for_bode_variable()+self.text_for_newline())
+            deck.section('loading conditions',self.text_for_loading_conditions(start)
+                         +self.text_for_newline())
+            
+            deck.section('pdn',self.text_for_commented_tittle('PDN')
+                         +self.text_for_rl_connector_model(start)+self.text_for_newline())
+            if self.die_instances:
+                lines=self.text_for_comment('dies')
+                for line in self.die_params:            
+                    lines.append(line+'\n')
                     
-                lines+=self.text_for_vr_ins()
-            else:
-                EventLogger.raise_warning(f"No VR instance!")
-        
-        
-        #shorts
-        lines+=self.text_for_short_ports()
-
-        #tstone        
-        lines+=self.text_for_tstone_instances(folder_file[0])
-
-        #VR_TUNE        
-        if analysis_type == analysis_type.TUNE_VR: 
-            lines+=self.text_for_vr_tune_conns()                         
-
-        #LIN
-        if analysis_type == analysis_type.LIN: 
-            snp_fpath=Io.update_file_extension(file_path,'')
-            lines+=self.text_for_lin_ports(snp_fpath,folder_file[0])
-
-        
-        #probes        
-        lines+=self.text_for_newline()
-        lines+=self.text_for_comment('Probes') 
-        if self.probe_v_ac_ports:                
-            lines+=self.text_for_include(self.ac_vprobe_file,
-            folder_file[0])
-        if self.probe_v_tran_ports:
-            lines+=self.text_for_include(self.tran_vprobe_file,
-            folder_file[0])                                   
+                for ins_name in self.die_instances:
+                    die_ins=self.die_instances[ins_name]     
+                    lines+=self.text_for_include(die_ins.model.fpath,start)                            
+                lines+=self.text_for_include(self.die_ins_file,start)        
+                lines+=self.text_for_newline()
+                deck.section('dies',lines)
+
+            if self.c4_groups:
+                deck.section('c4',self.text_for_insgroup_models(self.c4_groups,'c4 Bump models',start)
+                             +self.text_for_comment('C4 Bump instances')
+                             +self.text_for_include(self.c4_ins_file,start)
+                             +self.text_for_newline())
             
-        
-        lines+=self.text_for_end_file()   
+            for name,ins,tstone_ins_file,ins_file in (
+                    ('pkg',self.pkg_instance,self.pkg_tstone_ins_file,self.pkg_ins_file),
+                    ('pkg patch',self.pkg_patch_instance,self.pkg_patch_tstone_ins_file,
+                     self.pkg_patch_ins_file),
+                    ('pkg int',self.pkg_int_instance,self.pkg_int_tstone_ins_file,
+                     self.pkg_int_ins_file)):
+                if ins:
+                    deck.section(name,self.text_for_comment(name)
+                                 +self.text_for_psi_external_instance(self.pkg_id,
+                                 ins.model,tstone_ins_file,ins_file,start)
+                                 +self.text_for_newline())
+
+            if self.mli_groups:
+                deck.section('mli',self.text_for_insgroup_models(self.mli_groups,'MLI Models',start)
+                             +self.text_for_comment('MLI Instances')
+                             +self.text_for_include(self.mli_ins_file,start)
+                             +self.text_for_newline())
+
+            if self.skt_groups:
+                deck.section('skt',self.text_for_insgroup_models(self.skt_groups,'Socket Models',start)
+                             +self.text_for_comment('Socket Instances')
+                             +self.text_for_include(self.skt_ins_file,start)
+                             +self.text_for_newline())
+
+            if self.brd_instance:
+                deck.section('brd',self.text_for_comment('brd')
+                             +self.text_for_psi_external_instance(self.brd_id,
+                             self.brd_instance.model,self.brd_tstone_ins_file,
+                             self.brd_ins_file,start)
+                             +self.text_for_newline())
+
+            if self.attd_cap_groups:
+                deck.section('caps',self.text_for_insgroup_models(self.attd_cap_groups,
+                             'Capacitor models',start)
+                             +self.text_for_newline()
+                             +self.text_for_comment('Capacitor instances')
+                             +self.text_for_include(self.cap_ins_file,start)
+                             +self.text_for_newline())
+            
+            #VR
+            if analysis_type != analysis_type.LIN and analysis_type!=analysis_type.TUNE_VR:
+                lines=self.text_for_commented_tittle('Voltage source')        
+                if self.vr_instance:            
+                    lines+=self.text_for_comment('VR')                
+                    if not self.vr_info.tlvr_enabled:
+                        lines+=self.text_for_include(self.vr_mod_file,start)
+                    else:
+                        lines+=self.text_for_include(self.tlvr_mod_file,start)
+                    lines+=self.text_for_vr_ins()
+                else:
+                    EventLogger.raise_warning(f"No VR instance!")
+                deck.section('vr',lines)
+            
+            #shorts
+            deck.section('shorts',self.text_for_short_ports())
+
+            #tstone        
+            deck.section('tstone',self.text_for_tstone_instances(start))
+
+            #VR_TUNE        
+            if analysis_type == analysis_type.TUNE_VR: 
+                deck.section('vr tune',self.text_for_vr_tune_conns())
+
+            #LIN
+            if analysis_type == analysis_type.LIN: 
+                snp_fpath=Io.update_file_extension(file_path,'')
+                deck.section('lin',self.text_for_lin_ports(snp_fpath,start))
+
+            #probes        
+            lines=self.text_for_newline()+self.text_for_comment('Probes') 
+            if self.probe_v_ac_ports:                
+                lines+=self.text_for_include(self.ac_vprobe_file,start)
+            if self.probe_v_tran_ports:
+                lines+=self.text_for_include(self.tran_vprobe_file,start)
+            deck.section('probes',lines)
+            
+            deck.section('end',self.text_for_end_file())
         
         self.main_files.append(file_path)
-        self.create_text_file(file_path,lines) 
+        self.record_sections(deck)
 
         EventLogger.info('main file saved:'+ file_path)
 
@@ -5068,6 +5624,25 @@ class HspiceDeck:
 
         self.connect_lf_icct_by_model_filename(ports,mod_path,'icct',params)          
 
+def _build_deck_group(state,decks,model_cache=None,index_dir=None):
+    """Build a group of decks sharing the same models, in a worker process.
+    """
+    if model_cache is not None:
+        HspiceDeck.model_cache=model_cache
+    elif HspiceDeck.model_cache is None:
+        HspiceDeck.model_cache=ModelCache()
+    if index_dir is not None and (Subckt.index is None or 
+            os.path.dirname(Subckt.index.index_path)!=index_dir):
+        Subckt.index=SubcktIndex(index_dir)
+    factory=DeckFactory()
+    factory.state=state
+    #keep only the models of the previous groups this group needs
+    HspiceDeck.model_cache.retain(factory.deck_inputs(decks[0]))
+    results=[factory.build_deck_timed(deck_data) for deck_data in decks]
+    if Subckt.index is not None:
+        Subckt.index.save()
+    return results
+
 class DeckBuildState(Enum):
     """Enumeration class for representing the different states of the deck building process
 
@@ -5101,6 +5676,20 @@ class DeckFactory:
 
         self.subproc_batch_size=4
         self.hspice_mt=1
+        self.run_cache=None
+        #processes building decks, >1 requires the calling script to be
+        #protected by if __name__=='__main__' on Windows
+        self.build_workers=1
+        self.build_report=[]
+        self.model_cache=ModelCache()
+        #SubcktIndex keeping the parsed subckts between runs, None to parse
+        #the subckt files of every run
+        self.subckt_index=None
+        #RunJournal recording the jobs of build_and_run, None to not record them
+        self.journal=None
+        self.batch=None
+        #skip the jobs completed with the same inputs in a previous session
+        self.resume=True
     
     def clone_template(self,dst_folder =os.curdir):
         """This function create the template excel file to build the decks 
@@ -5634,9 +6223,50 @@ class DeckFactory:
             if run:                
                 self.main_files_to_run+=deck.main_files            
 
-    def build_decks(self,fpath,sheet='1',col_offset=2):
-        """Buld multiple decks based on an Excel file containing the description
-        of each deck.
+    def deck_inputs(self,deck_data):
+        """Find the layouts and models a deck is built from.
+
+        :param deck_data: deck description table
+        :type deck_data: dict
+        :return: Model folders and files of the deck
+        :rtype: tuple[str]
+        """
+        inputs=[]
+        for sec in TextProcessor.find_dict_key(deck_data,['pkg*','brd*','caps*','die*'],True):
+            par=TextProcessor.find_dict_key(deck_data[sec],['folder','model file'])
+            if par and deck_data[sec][par]:
+                inputs.append(os.path.abspath(deck_data[sec][par]))
+        return tuple(sorted(inputs))
+
+    def build_deck_timed(self,deck_data):
+        """Build a deck, catching its errors.
+
+        :param deck_data: deck description table
+        :type deck_data: dict
+        :return: Case name, build time, error message and traceback, and the
+        files added to main_files_to_run, tuning_main_files_to_run and
+        tuning_scripts
+        :rtype: dict
+        """
+        sec=TextProcessor.find_dict_key(deck_data,'case')
+        par=TextProcessor.find_dict_key(deck_data[sec],['name'])
+        lens=(len(self.main_files_to_run),len(self.tuning_main_files_to_run),
+              len(self.tuning_scripts))
+        result={'case':deck_data[sec][par],'time':0,'error':None,'traceback':None}
+        start=time.perf_counter()
+        try:
+            self.build_deck(deck_data)
+        except Exception as e:
+            result['error']=f'{type(e).__name__}: {e}'
+            result['traceback']=traceback.format_exc()
+        result['time']=time.perf_counter()-start
+        result['main_files']=self.main_files_to_run[lens[0]:]
+        result['tuning_main_files']=self.tuning_main_files_to_run[lens[1]:]
+        result['tuning_scripts']=self.tuning_scripts[lens[2]:]
+        return result
+
+    def parse_decks(self,fpath,sheet='1',col_offset=2):
+        """Read the description of each deck from an Excel file.
 
         :param fpath: path to the Excel file containing the deck description
         :type fpath: str
@@ -5644,16 +6274,14 @@ class DeckFactory:
         :type sheet: str, optional
         :param col_offset: Column offset to start reading the deck parameters. defaults to 2
         :type col_offset: int, optional
+        :return: deck description tables, one per column
+        :rtype: list[dict]
         """
         table = pd.read_excel(fpath, sheet_name=sheet, na_filter=False,dtype=str)
         col_count=len(table.columns)        
         
         base_deck_table=[]
-        deck_table=[]
-        deck_data={}
-
-        self.built_cases=[]
-        
+        decks=[]
         for i in range(col_offset,col_count):
             case_column=i
             deck_table = table.iloc[:, [0, 1, case_column]].values.tolist()
@@ -5663,10 +6291,82 @@ class DeckFactory:
             else:
                 deck_table=self.override_deck_table(base_deck_table,deck_table)
             
-            deck_data=self.parse_deck_table(deck_table)   
-            
-            self.build_deck(deck_data)
-        
+            decks.append(self.parse_deck_table(deck_table))
+        return decks
+
+    def build_decks(self,fpath,sheet='1',col_offset=2,workers=None):
+        """Buld multiple decks based on an Excel file containing the description
+        of each deck.
+
+        Decks built from the same layouts and models are built together, so 
+        every file is parsed once. Groups of decks are built in parallel 
+        processes when workers is larger than 1. A deck that fails is reported
+        in build_report and does not stop the other decks.
+
+        :param fpath: path to the Excel file containing the deck description
+        :type fpath: str
+        :param sheet: name of the sheet to parse, defaults to '1'
+        :type sheet: str, optional
+        :param col_offset: Column offset to start reading the deck parameters. defaults to 2
+        :type col_offset: int, optional
+        :param workers: Number of processes building decks. If None,
+        build_workers is used, defaults to None
+        :type workers: int, optional
+        :return: Case name, build time and error of each deck
+        :rtype: list[dict]
+        """
+        workers=self.build_workers if workers is None else workers
+        self.built_cases=[]
+
+        groups={}
+        for deck_data in self.parse_decks(fpath,sheet,col_offset):
+            sec=TextProcessor.find_dict_key(deck_data,'case')
+            par=TextProcessor.find_dict_key(deck_data[sec],['name'])
+            case=deck_data[sec][par]
+            par=TextProcessor.find_dict_key(deck_data[sec],['execute'])
+            if case in self.built_cases:
+                print(f'Duplicated case ignored!: {case}')
+                continue
+            self.built_cases.append(case)
+            if not TextProcessor.match(deck_data[sec][par],['yes','true']):
+                continue
+            groups.setdefault(self.deck_inputs(deck_data),[]).append(deck_data)
+
+        results=[]
+        if workers<=1 or len(groups)<=1:
+            prev_cache,prev_index=HspiceDeck.model_cache,Subckt.index
+            if self.subckt_index is not None:
+                Subckt.index=self.subckt_index
+            try:
+                for decks in groups.values():
+                    results+=_build_deck_group(self.state,decks,self.model_cache)
+            finally:
+                HspiceDeck.model_cache,Subckt.index=prev_cache,prev_index
+        else:
+            index_dir=(None if self.subckt_index is None else
+                       os.path.dirname(self.subckt_index.index_path))
+            with ProcessPoolExecutor(max_workers=min(workers,len(groups))) as pool:
+                futures=[pool.submit(_build_deck_group,self.state,decks,None,index_dir)
+                         for decks in groups.values()]
+                for future in as_completed(futures):
+                    results+=future.result()
+
+        #keep the order of the Excel file
+        order={case:i for i,case in enumerate(self.built_cases)}
+        results.sort(key=lambda result: order[result['case']])
+        for result in results:
+            self.main_files_to_run+=result['main_files']
+            self.tuning_main_files_to_run+=result['tuning_main_files']
+            self.tuning_scripts+=result['tuning_scripts']
+            if result['error'] is None:
+                print(f"Deck built: {result['case']} ({result['time']:.1f} s)")
+            else:
+                print(f"Deck failed: {result['case']} ({result['time']:.1f} s). {result['error']}")
+        self.build_report=[{key:result[key] for key in ('case','time','error','traceback')}
+                           for result in results]
+        failed=sum(result['error'] is not None for result in results)
+        print(f'{len(results)-failed} decks built, {failed} failed')
+        return self.build_report
 
     def run_main_files(self,tool_path,main_files_to_run):
         """Runs multiple Spice main files in bach mode.
@@ -5675,43 +6375,220 @@ class DeckFactory:
         :type tool_folder: str
         :param main_files_to_run: list of files to run
         :type main_files_to_run: list[str]
+        :return: Number of files run, the files completed in a previous 
+        session or restored from the run cache are not counted
+        :rtype: int
         """
         pm=ProcessManager()                
+        to_store={}
+        jobs={}
+        settings={'tool':tool_path,'mt':self.hspice_mt}
         for fname in main_files_to_run:            
+            folder=os.path.dirname(os.path.abspath(fname))
+            stem=os.path.splitext(os.path.basename(fname))[0]
+            inputs_hash=None
+            if self.journal is not None:
+                inputs_hash=self.journal.inputs_hash([fname],settings)
+                if self.resume and self.journal.is_done(self.batch,self.state.name,
+                                                        fname,inputs_hash):
+                    print(f'Skipped {fname}, completed in a previous session')
+                    continue
             command=Cmds.run_hspice_cmd(tool_path,fname,self.hspice_mt)        
-            pm.schedule_subprocess(command)
+            if self.run_cache is not None:
+                #restore the outputs of identical decks run before
+                key=self.run_cache.key([fname],settings,[f'{stem}.*'])
+                if self.run_cache.restore(key,folder)[0]:
+                    print(f'Restored cached results of {fname}')
+                    if self.journal is not None:
+                        self.journal.add(self.batch,self.state.name,fname,command,
+                                         None,inputs_hash,settings)
+                        self.journal.finish(self.batch,self.state.name,fname,'completed',
+                            outputs=self.journal.files.new_outputs([f'{stem}.*'],folder,0,[fname]))
+                    continue
+            process_id=pm.schedule_subprocess(command)
+            jobs[process_id]=(fname,[f'{stem}.*'],folder)
+            if self.journal is not None:
+                self.journal.add(self.batch,self.state.name,fname,command,None,
+                                 inputs_hash,settings)
+            if self.run_cache is not None:
+                to_store[process_id]=(fname,key)
+        self._record_jobs(pm,jobs)
+        start_time=time.time()-2
         pm.start(self.subproc_batch_size)
+
+        for process_id,(fname,key) in to_store.items():
+            #failed runs are not cached
+            info=pm.job_info(process_id)
+            if info['state']=='completed' and info['returncode']==0:
+                stem=os.path.splitext(os.path.basename(fname))[0]
+                fpaths=self.run_cache.new_outputs([f'{stem}.*'],
+                    os.path.dirname(os.path.abspath(fname)),start_time,[fname])
+                if fpaths:
+                    self.run_cache.store(key,fpaths)
+        return len(jobs)
     
-    def run_tuning_scripts(self):
+    def run_tuning_scripts(self,rerun=False):
         """Runs the Matlab tuning scripts in batch mode
+
+        :param rerun: Run the scripts completed in a previous session too,
+        e.g. when the tuning decks were run again, defaults to False
+        :type rerun: bool, optional
         """
         pm=ProcessManager()   
-        
+        jobs={}
         for fpath in self.tuning_scripts:
             folder, filename = os.path.split(fpath)
             cmd=Cmds.run_matlab_cmd(Io.update_file_extension(filename,'') )            
-            pm.schedule_subprocess(cmd,folder)
+            if self.journal is not None:
+                settings=self._tuning_results(fpath)
+                inputs_hash=self.journal.inputs_hash([fpath],settings)
+                if (self.resume and not rerun and 
+                        self.journal.is_done(self.batch,self.state.name,fpath,inputs_hash)):
+                    print(f'Skipped {fpath}, completed in a previous session')
+                    continue
+                self.journal.add(self.batch,self.state.name,fpath,cmd,folder,
+                                 inputs_hash,settings)
+            jobs[pm.schedule_subprocess(cmd,folder)]=(fpath,[],folder)
+        self._record_jobs(pm,jobs)
         pm.start(self.subproc_batch_size)
 
+    def _tuning_results(self,fpath):
+        """Hash the results of the tuning deck read by a Matlab tuning 
+        script, so the script is run again when the tuning deck results change
 
-    def build_and_run(self,fpath,Hspice_path=r'C:\synopsys\Hspice_P-2019.06-SP2-3\WIN64\hspice.exe'):
+        :param fpath: Matlab tuning script path
+        :type fpath: str
+        :return: Hash of each existing result file, by file name
+        :rtype: dict
+        """
+        results={}
+        for ext in ('.lis','.ac0','.s2p'):
+            result=Io.update_file_extension(fpath,ext)
+            if os.path.isfile(result):
+                results[os.path.basename(result)]=self.journal.files.file_hash(result)
+        return {'tuning_results':results}
+
+    def _check_journal(self):
+        if self.journal is None:
+            raise ValueError('No journal is set, set the journal attribute to '
+                             'a RunJournal before build_and_run to record the jobs')
+
+    def _record_jobs(self,pm,jobs):
+        """Record the start and the end of the scheduled subprocesses in the
+        journal while they run.
+
+        :param pm: Process manager running the subprocesses
+        :type pm: ProcessManager
+        :param jobs: Job name, output wildcards and output folder of each 
+        subprocess id
+        :type jobs: dict
+        """
+        if self.journal is None:
+            return
+        batch,stage=self.batch,self.state.name
+
+        def on_start(proc):
+            self.journal.start(batch,stage,jobs[proc.id][0])
+
+        def on_exit(proc):
+            job,patterns,folder=jobs[proc.id]
+            outputs=self.journal.files.new_outputs(patterns,folder,
+                                                   proc.start_time-2,[job])
+            self.journal.finish(batch,stage,job,proc.state,proc.returncode,outputs)
+
+        pm.on_start=on_start
+        pm.on_exit=on_exit
+
+    def build_and_run(self,fpath,Hspice_path=r'C:\synopsys\Hspice_P-2019.06-SP2-3\WIN64\hspice.exe',
+                      batch=None):
         """Build, tune and run multiple Hspice decks.
 
+        When a journal is set, the jobs are recorded in it and, if resume
+        is True, the jobs completed in a previous session with the same 
+        inputs are not run again.
+
         :param fpath: path to the Excel file containing the deck description.
         :type fpath: str
         :param Hspice_path: Hscpie.exe path, defaults to 'C:\\synopsys\\Hspice_P-2019.06-SP2-3\\WIN64\\hspice.exe'
         :type Hspice_path: str, optional
+        :param batch: Name of the batch in the journal, defaults to None.
+        If None, the Excel file path is used.
+        :type batch: str, optional
         """
         self.main_files_to_run=[]
         self.tuning_main_files_to_run=[]
         self.tuning_scripts=[]                
+        self.batch=os.path.abspath(fpath) if batch is None else batch
+        if self.journal is not None:
+            interrupted=self.journal.interrupt(self.batch)
+            if interrupted:
+                print(f'{interrupted} jobs of the previous session were interrupted')
         self.state= DeckBuildState.TUNE_BUILD       
         self.build_decks(fpath)
         self.state= DeckBuildState.TUNE_SPICERUN       
-        self.run_main_files(Hspice_path,self.tuning_main_files_to_run)
+        tuned=self.run_main_files(Hspice_path,self.tuning_main_files_to_run)
         self.state= DeckBuildState.TUNE_MATLABRUN               
-        self.run_tuning_scripts()
+        self.run_tuning_scripts(rerun=tuned>0)
         self.state= DeckBuildState.MAIN_BUILD               
         self.build_decks(fpath)
         self.state= DeckBuildState.MAIN_RUN
-        self.run_main_files(Hspice_path,self.main_files_to_run)
\ No newline at end of file
+        self.run_main_files(Hspice_path,self.main_files_to_run)
+        if self.journal is not None:
+            self.run_summary()
+
+    def retry_failed(self,batch=None):
+        """Run again the jobs of a batch that failed, were terminated or 
+        interrupted, with their recorded commands. The decks are not built
+        again.
+
+        :param batch: Name of the batch in the journal, defaults to None.
+        If None, the last batch run by this factory is used.
+        :type batch: str, optional
+        :raises ValueError: No journal is set
+        :return: Summary of the batch
+        :rtype: dict
+        """
+        self._check_journal()
+        self.batch=self.batch if batch is None else batch
+        self.journal.interrupt(self.batch)
+        for state in (DeckBuildState.TUNE_SPICERUN,DeckBuildState.TUNE_MATLABRUN,
+                      DeckBuildState.MAIN_RUN):
+            self.state=state
+            pm=ProcessManager()
+            jobs={}
+            for job in self.journal.jobs(self.batch,state.name,RunJournal.unfinished):
+                patterns=([] if state==DeckBuildState.TUNE_MATLABRUN else
+                          [f"{os.path.splitext(os.path.basename(job['job']))[0]}.*"])
+                folder=job['cwd'] or os.path.dirname(os.path.abspath(job['job']))
+                #the inputs may have been fixed since the job failed
+                settings=(self._tuning_results(job['job']) 
+                          if state==DeckBuildState.TUNE_MATLABRUN else job['settings'])
+                inputs_hash=self.journal.inputs_hash([job['job']],settings)
+                self.journal.add(self.batch,state.name,job['job'],job['command'],
+                                 job['cwd'],inputs_hash,settings)
+                jobs[pm.schedule_subprocess(job['command'],job['cwd'])]=(job['job'],patterns,folder)
+            if jobs:
+                self._record_jobs(pm,jobs)
+                pm.start(self.subproc_batch_size)
+        return self.run_summary()
+
+    def run_summary(self,batch=None):
+        """Print and return the summary of a batch recorded in the journal
+
+        :param batch: Name of the batch in the journal, defaults to None.
+        If None, the last batch run by this factory is used.
+        :type batch: str, optional
+        :raises ValueError: No journal is set
+        :return: Number of jobs, number of jobs per state and per stage,
+        total run time in seconds and the jobs that did not complete
+        :rtype: dict
+        """
+        self._check_journal()
+        summary=self.journal.summary(self.batch if batch is None else batch)
+        print(f"Batch {self.batch if batch is None else batch}: {summary['jobs']} jobs, "
+              f"run time {summary['run_time']:.1f} s")
+        for stage,states in summary['stages'].items():
+            print(f'  {stage}: '+', '.join(f'{count} {state}' for state,count in states.items()))
+        for job in summary['unfinished']:
+            print(f"  {job['state']}: {job['job']} (exit code {job['exit_code']})")
+        return summary
\ No newline at end of file
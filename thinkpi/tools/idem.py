@@ -130,11 +130,25 @@ class idem:
                           orderStep=2, orderMax=10, bandwidth=2e9,
                           DC=1, tol=0.001,
                           output_formats=["Touchstone","HSPICE-LAPLACE"],
-                          fitting_xml=None, passivity_xml=None):
+                          fitting_xml=None, passivity_xml=None, cache=None):
         sparamfile=os.path.abspath(sparamfile)
         cirfile=os.path.abspath(cirfile)
         
         cirFile_no_ext=os.path.splitext(cirfile)[0]
+
+        if cache is not None:
+            # Restore the model of an identical previous run if possible
+            settings={'tool':self.idemmp_fitting_path,'orderMin':orderMin,
+                      'orderStep':orderStep,'orderMax':orderMax,
+                      'bandwidth':bandwidth,'DC':DC,'tol':tol,
+                      'output_formats':output_formats}
+            inputs=[fpath for fpath in (sparamfile,fitting_xml,passivity_xml) if fpath]
+            return cache.run(inputs,
+                             lambda: self.create_idem_model(sparamfile,cirfile,
+                                orderMin,orderStep,orderMax,bandwidth,DC,tol,
+                                output_formats,fitting_xml,passivity_xml),
+                             [f'{os.path.basename(cirFile_no_ext)}*'],settings,
+                             os.path.dirname(cirfile))
           
         midmod=cirFile_no_ext+".mod.h5"
         try:
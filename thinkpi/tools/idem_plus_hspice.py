@@ -11,7 +11,7 @@ class idem_plus_hspice:
         timeout=None,
         hspice_path=None,sparam_main_fpath='main_s.sp',
         idem_main_fpath='main_macro.sp',        
-        termination_fpath=None): 
+        termination_fpath=None,cache=None): 
         """_summary_
 
         :param idemmp_folder: _description_
@@ -36,6 +36,9 @@ class idem_plus_hspice:
         :type idem_main_fpath: str, optional
         :param termination_fpath: _description_, defaults to None
         :type termination_fpath: _type_, optional        
+        :param cache: Cache of the Hspice and IDEM runs. If provided, runs with
+        identical inputs and settings are restored from it, defaults to None
+        :type cache: :class:`runcache.RunCache()`, optional
         """
            
 
@@ -55,9 +58,7 @@ class idem_plus_hspice:
             term_df)
 
             cmd=sysutils.Cmds.run_hspice_cmd(hspice_path,sparam_main_fpath)
-            proc=sysutils.ProcessManager()
-            proc.schedule_subprocess(commands=cmd,timeout=timeout)
-            proc.start()
+            self.run_hspice(cmd,sparam_main_fpath,hspice_path,timeout,cache)
 
         #create idem decks
         idem_hspice_deck=hspice_deck.HspiceDeck()
@@ -92,25 +93,22 @@ class idem_plus_hspice:
                 mod_h5_fpath=sysutils.Io.update_file_extension(macromodel_it,
                 '.mod.h5')              
 
-                #fitting
-                proc=sysutils.ProcessManager()
-                cmd=sysutils.Cmds.idemmp_fitting(idemmp_fitting_path,sparam_fpath,
-                mod_h5_fpath,order_min,order_step,order_max,bw,1,tol,fitting_xml)
-                proc.clear_queue()
-                proc.schedule_subprocess(commands=cmd,timeout=timeout)
-                proc.start()
-                #passive
-                cmd=sysutils.Cmds.idemmp_passivity(idemmp_passivity_path,
-                mod_h5_fpath,mod_h5_fpath,1,passivity_xml)
-                proc.clear_queue()
-                proc.schedule_subprocess(commands=cmd,timeout=timeout)
-                proc.start()
-                #export
-                cmd=sysutils.Cmds.idemmp_export(idemmp_export_path,
-                mod_h5_fpath,macromodel_it)
-                proc.clear_queue()
-                proc.schedule_subprocess(commands=cmd,timeout=timeout)
-                proc.start()
+                #fitting, passivity enforcement and export
+                cmds=[sysutils.Cmds.idemmp_fitting(idemmp_fitting_path,sparam_fpath,
+                mod_h5_fpath,order_min,order_step,order_max,bw,1,tol,fitting_xml),
+                      sysutils.Cmds.idemmp_passivity(idemmp_passivity_path,
+                mod_h5_fpath,mod_h5_fpath,1,passivity_xml),
+                      sysutils.Cmds.idemmp_export(idemmp_export_path,
+                mod_h5_fpath,macromodel_it)]
+                inputs=[fpath for fpath in (sparam_fpath,fitting_xml,passivity_xml) 
+                        if fpath]
+                settings={'tool':idemmp_folder,'case':row}
+                if cache is None:
+                    self.run_cmds(cmds,timeout)
+                else:
+                    out_folder,out_fname=os.path.split(os.path.abspath(macromodel_it))
+                    cache.run(inputs,lambda: self.run_cmds(cmds,timeout),
+                              [f'{os.path.splitext(out_fname)[0]}*'],settings,out_folder)
                 
                 if idem_main_fpath:
                     deck_it=sysutils.Io.custom_file_path(idem_main_fpath,f'{i}')
@@ -118,13 +116,48 @@ class idem_plus_hspice:
                     term_df)
                     #run hspice
                     cmd=sysutils.Cmds.run_hspice_cmd(hspice_path,deck_it)
-
-                    proc.clear_queue()
-                    proc.schedule_subprocess(commands=cmd,timeout=timeout)
-                    proc.start()
+                    self.run_hspice(cmd,deck_it,hspice_path,timeout,cache)
                 
             except Exception as e:
                 print(e)            
 
         
-       
\ No newline at end of file
+       
+
+    def run_cmds(self,cmds,timeout=None):
+        """Run commands one after the other
+
+        :param cmds: Commands to run
+        :type cmds: list[str]
+        :param timeout: Timeout of each command in seconds, defaults to None
+        :type timeout: float, optional
+        :return: True if all the commands completed successfully
+        :rtype: bool
+        """
+        proc=sysutils.ProcessManager()
+        for cmd in cmds:
+            proc.schedule_subprocess(commands=cmd,timeout=timeout)
+        proc.start(1)
+        return all(job['state']=='completed' for job in proc.job_info())
+
+    def run_hspice(self,cmd,deck_fpath,hspice_path,timeout=None,cache=None):
+        """Run a Hspice deck, or restore its outputs from the cache
+
+        :param cmd: Hspice command
+        :type cmd: str
+        :param deck_fpath: Path of the deck
+        :type deck_fpath: str
+        :param hspice_path: Hspice executable path
+        :type hspice_path: str
+        :param timeout: Timeout in seconds, defaults to None
+        :type timeout: float, optional
+        :param cache: Cache of the runs, defaults to None
+        :type cache: :class:`runcache.RunCache()`, optional
+        :return: True if the run completed successfully
+        :rtype: bool
+        """
+        if cache is None:
+            return self.run_cmds([cmd],timeout)
+        stem=os.path.splitext(os.path.basename(deck_fpath))[0]
+        return cache.run([deck_fpath],lambda: self.run_cmds([cmd],timeout),
+                         [f'{stem}.*'],{'tool':hspice_path})
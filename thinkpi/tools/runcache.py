@@ -0,0 +1,301 @@
+import os
+import re
+import json
+import glob
+import time
+import shutil
+import hashlib
+import threading
+
+
+class RunFiles:
+    """Input and output files of tool runs.
+
+    The inputs of a run are its input files and all the files they include
+    transitively (.inc, .include, .lib, .hdl and Touchstone file references).
+    File hashes are memorized while the files do not change.
+    """
+    include_pattern=re.compile(
+        r"""^\s*\.(?:inc|include|lib|hdl)\s+['"]?([^'"\s]+)['"]?""",
+        re.IGNORECASE | re.MULTILINE)
+    file_pattern=re.compile(r"""\b(?:tstonefile|file)\s*=\s*['"]?([^'"\s]+)['"]?""",
+                            re.IGNORECASE)
+    skip_outputs=('.bat',)
+
+    def __init__(self):
+        self._file_hashes={}
+
+    def file_hash(self,fpath):
+        """Hash the content of a file. Hashes are reused while the size and
+        modification time of the file do not change.
+
+        :param fpath: File path
+        :type fpath: str
+        :return: SHA-256 of the file content
+        :rtype: str
+        """
+        stat=os.stat(fpath)
+        memo_key=(os.path.abspath(fpath),stat.st_size,stat.st_mtime_ns)
+        if memo_key not in self._file_hashes:
+            h=hashlib.sha256()
+            with open(fpath,'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20),b''):
+                    h.update(chunk)
+            self._file_hashes[memo_key]=h.hexdigest()
+        return self._file_hashes[memo_key]
+
+    def _resolve(self,name,folder):
+        for path in (os.path.join(folder,name),name):
+            if os.path.isfile(path):
+                return os.path.abspath(path)
+        return None
+
+    def dependencies(self,fpath):
+        """Find all the files included by a Spice file, transitively
+
+        :param fpath: Spice file path
+        :type fpath: str
+        :return: Pairs of the included name and its resolved path. The path is
+        None if the file does not exist.
+        :rtype: list[tuple[str, str]]
+        """
+        deps=[]
+        seen={os.path.abspath(fpath)}
+        to_parse=[os.path.abspath(fpath)]
+        while to_parse:
+            parent=to_parse.pop()
+            with open(parent,errors='ignore') as f:
+                # Join continuation lines
+                text=re.sub(r'\n\+',' ',f.read())
+            folder=os.path.dirname(parent)
+            for pattern,parse in ((self.include_pattern,True),
+                                  (self.file_pattern,False)):
+                for name in pattern.findall(text):
+                    path=self._resolve(name,folder)
+                    deps.append((name,path))
+                    if path is not None and path not in seen:
+                        seen.add(path)
+                        if parse:
+                            to_parse.append(path)
+        return deps
+
+    def key(self,inputs,settings=None,outputs=None):
+        """Compute the key of a run, the hash of its inputs, settings and
+        output names
+
+        :param inputs: Input files of the run, e.g. the main deck
+        :type inputs: list[str]
+        :param settings: Tool settings that change the results, e.g. the
+        tool path or the command line options, defaults to None
+        :type settings: dict, optional
+        :param outputs: Wildcards of the output files, defaults to None.
+        The outputs are restored under their stored names, so runs writing
+        differently named outputs, e.g. decks with another name, differ.
+        :type outputs: list[str], optional
+        :return: Run key
+        :rtype: str
+        """
+        h=hashlib.sha256()
+        h.update(json.dumps([settings,sorted(outputs or [])],
+                            sort_keys=True,default=str).encode())
+        for fpath in inputs:
+            h.update(self.file_hash(fpath).encode())
+            for name,path in sorted(set(self.dependencies(fpath)),
+                                    key=lambda dep: (dep[0],dep[1] or '')):
+                h.update(name.encode())
+                h.update(b'missing' if path is None else self.file_hash(path).encode())
+        return h.hexdigest()
+
+    def new_outputs(self,patterns,folder,start_time,inputs=()):
+        """Find the output files written since a given time
+
+        :param patterns: Wildcards of the output files
+        :type patterns: list[str]
+        :param folder: Folder of the output files
+        :type folder: str
+        :param start_time: Time stamp of the run start
+        :type start_time: float
+        :param inputs: Input files to exclude, defaults to ()
+        :type inputs: tuple[str], optional
+        :return: Output file paths
+        :rtype: list[str]
+        """
+        inputs={os.path.abspath(fpath) for fpath in inputs}
+        fpaths=set()
+        for pattern in patterns:
+            for fpath in glob.glob(os.path.join(folder,pattern)):
+                if (os.path.isfile(fpath)
+                        and os.path.abspath(fpath) not in inputs
+                        and not fpath.lower().endswith(self.skip_outputs)
+                        and os.path.getmtime(fpath)>=start_time):
+                    fpaths.add(fpath)
+        return sorted(fpaths)
+
+
+class RunCache(RunFiles):
+    """Local content-addressed cache of simulation results.
+
+    A run is identified by the hash of its input files, all the files they
+    include transitively (.inc, .include, .lib, .hdl and Touchstone file
+    references) and the tool settings. When a run with the same hash was
+    already executed, its stored outputs are copied back instead of running
+    the tool again. The least recently used runs are evicted once the cache
+    grows beyond max_size bytes.
+    """
+    def __init__(self,cache_dir=None,max_size=10e9):
+        """Initialize the cache
+
+        :param cache_dir: Folder of the cache, defaults to None. If None,
+        .thinkpi/run_cache in the user home folder is used.
+        :type cache_dir: str, optional
+        :param max_size: Maximum size of the stored outputs in bytes,
+        defaults to 10e9
+        :type max_size: float, optional
+        """
+        super().__init__()
+        if cache_dir is None:
+            cache_dir=os.path.join(os.path.expanduser('~'),'.thinkpi','run_cache')
+        self.cache_dir=cache_dir
+        self.max_size=max_size
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self.lock=threading.Lock()
+        os.makedirs(os.path.join(self.cache_dir,'objects'),exist_ok=True)
+        self.index=self._load_index()
+
+    @property
+    def index_fpath(self):
+        return os.path.join(self.cache_dir,'index.json')
+
+    def _load_index(self):
+        try:
+            with open(self.index_fpath) as f:
+                return json.load(f)
+        except (FileNotFoundError,json.JSONDecodeError):
+            return {}
+
+    def _save_index(self):
+        tmp_fpath=f'{self.index_fpath}.{os.getpid()}.tmp'
+        with open(tmp_fpath,'w') as f:
+            json.dump(self.index,f)
+        os.replace(tmp_fpath,self.index_fpath)
+
+    def _object_dir(self,key):
+        return os.path.join(self.cache_dir,'objects',key)
+
+    def restore(self,key,dst_folder):
+        """Copy the stored outputs of a run to a folder
+
+        :param key: Cache key
+        :type key: str
+        :param dst_folder: Destination folder
+        :type dst_folder: str
+        :return: True and the stored result on a hit, otherwise False and None
+        :rtype: tuple[bool, object]
+        """
+        with self.lock:
+            entry=self.index.get(key)
+            if entry is None or not os.path.isdir(self._object_dir(key)):
+                self.misses+=1
+                return False,None
+            for fname in entry['files']:
+                shutil.copy2(os.path.join(self._object_dir(key),fname),
+                             os.path.join(dst_folder,fname))
+            entry['last_used']=time.time()
+            self.hits+=1
+            self._save_index()
+            return True,entry.get('result')
+
+    def store(self,key,fpaths,result=None):
+        """Store the outputs of a run
+
+        :param key: Cache key
+        :type key: str
+        :param fpaths: Output files of the run
+        :type fpaths: list[str]
+        :param result: JSON serializable result of the run, defaults to None
+        :type result: object, optional
+        """
+        obj_dir=self._object_dir(key)
+        tmp_dir=f'{obj_dir}.{os.getpid()}.tmp'
+        shutil.rmtree(tmp_dir,ignore_errors=True)
+        os.makedirs(tmp_dir)
+        size=0
+        for fpath in fpaths:
+            shutil.copy2(fpath,tmp_dir)
+            size+=os.path.getsize(fpath)
+        with self.lock:
+            shutil.rmtree(obj_dir,ignore_errors=True)
+            os.replace(tmp_dir,obj_dir)
+            self.index[key]={'files':[os.path.basename(fpath) for fpath in fpaths],
+                             'size':size,'last_used':time.time(),'result':result}
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        size=sum(entry['size'] for entry in self.index.values())
+        for key,entry in sorted(self.index.items(),key=lambda item: item[1]['last_used']):
+            if size<=self.max_size:
+                break
+            shutil.rmtree(self._object_dir(key),ignore_errors=True)
+            del self.index[key]
+            size-=entry['size']
+            self.evictions+=1
+
+    def run(self,inputs,func,outputs,settings=None,folder=None):
+        """Run a simulation, or restore its outputs if it was already run
+
+        :param inputs: Input files of the run
+        :type inputs: list[str]
+        :param func: Function running the simulation. It must return a true
+        value, e.g. True, on success, which is stored as the result of the 
+        run. Runs returning a false value failed and are not stored. An exit
+        code must be converted, e.g. returncode==0, since a failed run's
+        non zero code is a true value.
+        :type func: callable
+        :param outputs: Wildcards of the output files
+        :type outputs: list[str]
+        :param settings: Tool settings that change the results, defaults to None
+        :type settings: dict, optional
+        :param folder: Folder of the output files, defaults to None. If None,
+        the folder of the first input file is used.
+        :type folder: str, optional
+        :return: Result of func, or the stored result on a hit
+        :rtype: object
+        """
+        folder=os.path.dirname(os.path.abspath(inputs[0])) if folder is None else folder
+        key=self.key(inputs,settings,outputs)
+        hit,result=self.restore(key,folder)
+        if hit:
+            return result
+        # File systems may store modification times with a coarse resolution
+        start_time=time.time()-2
+        result=func()
+        fpaths=self.new_outputs(outputs,folder,start_time,inputs)
+        if fpaths and result:
+            self.store(key,fpaths,result)
+        return result
+
+    @property
+    def size(self):
+        return sum(entry['size'] for entry in self.index.values())
+
+    @property
+    def stats(self):
+        """Hit and miss statistics of the cache
+
+        :return: Number of hits, misses, evictions, stored runs and size in bytes
+        :rtype: dict
+        """
+        return {'hits':self.hits,'misses':self.misses,'evictions':self.evictions,
+                'runs':len(self.index),'size':self.size}
+
+    def clear(self):
+        """Delete all the stored runs
+        """
+        with self.lock:
+            for key in list(self.index):
+                shutil.rmtree(self._object_dir(key),ignore_errors=True)
+            self.index={}
+            self._save_index()
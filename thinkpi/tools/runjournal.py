@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from thinkpi.tools.runcache import RunFiles
+
+
+class RunJournal:
+    """Local SQLite journal of batch runs.
+
+    Every job of a batch is recorded with the hash of its inputs, its state,
+    start and end times, exit code and output files, as soon as it changes.
+    When a session is interrupted, the journal tells which jobs completed, so
+    the batch can be resumed, only the failed jobs retried, or a summary of
+    the run reported.
+
+    A job is identified by its batch, stage and name, e.g. the Excel file of
+    the decks, 'MAIN_RUN' and the path of the main deck.
+    """
+    unfinished=('pending','running','failed','terminated','interrupted')
+
+    def __init__(self,db_path=None):
+        """Initialize the journal
+
+        :param db_path: Path of the SQLite database, defaults to None. If None,
+        .thinkpi/run_journal.db in the user home folder is used.
+        :type db_path: str, optional
+        """
+        if db_path is None:
+            db_path=os.path.join(os.path.expanduser('~'),'.thinkpi','run_journal.db')
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)),exist_ok=True)
+        self.db_path=db_path
+        self.lock=threading.Lock()
+        self.files=RunFiles()
+        self._execute('PRAGMA journal_mode=WAL')
+        self._execute("""CREATE TABLE IF NOT EXISTS jobs (
+                            batch TEXT NOT NULL,
+                            stage TEXT NOT NULL,
+                            job TEXT NOT NULL,
+                            command TEXT,
+                            cwd TEXT,
+                            inputs_hash TEXT,
+                            settings TEXT,
+                            state TEXT NOT NULL,
+                            start_time REAL,
+                            end_time REAL,
+                            exit_code INTEGER,
+                            outputs TEXT,
+                            attempts INTEGER NOT NULL DEFAULT 0,
+                            PRIMARY KEY (batch,stage,job))""")
+
+    def _execute(self,sql,params=()):
+        with self.lock:
+            con=sqlite3.connect(self.db_path,timeout=30)
+            con.row_factory=sqlite3.Row
+            try:
+                with con:
+                    return con.execute(sql,params).fetchall()
+            finally:
+                con.close()
+
+    def inputs_hash(self,inputs,settings=None):
+        """Hash the inputs of a job: its input files, the files they include
+        and the tool settings
+
+        :param inputs: Input files of the job
+        :type inputs: list[str]
+        :param settings: Tool settings that change the results, defaults to None
+        :type settings: dict, optional
+        :return: Inputs hash
+        :rtype: str
+        """
+        return self.files.key(inputs,settings)
+
+    def add(self,batch,stage,job,command=None,cwd=None,inputs_hash=None,settings=None):
+        """Record a job waiting to run. A job already in the journal is reset
+        to pending, its attempts are kept.
+
+        :param batch: Batch name
+        :type batch: str
+        :param stage: Stage of the batch
+        :type stage: str
+        :param job: Job name
+        :type job: str
+        :param command: Command running the job, defaults to None
+        :type command: str, optional
+        :param cwd: Working folder of the command, defaults to None
+        :type cwd: str, optional
+        :param inputs_hash: Hash of the job inputs, defaults to None
+        :type inputs_hash: str, optional
+        :param settings: Tool settings included in the inputs hash, defaults to None
+        :type settings: dict, optional
+        """
+        self._execute("""INSERT INTO jobs (batch,stage,job,command,cwd,inputs_hash,settings,state)
+                         VALUES (?,?,?,?,?,?,?,'pending')
+                         ON CONFLICT (batch,stage,job) DO UPDATE SET
+                             command=excluded.command,cwd=excluded.cwd,
+                             inputs_hash=excluded.inputs_hash,settings=excluded.settings,
+                             state='pending',start_time=NULL,end_time=NULL,
+                             exit_code=NULL,outputs=NULL""",
+                      (batch,stage,job,command,cwd,inputs_hash,json.dumps(settings)))
+
+    def start(self,batch,stage,job):
+        """Record the start of a job
+
+        :param batch: Batch name
+        :type batch: str
+        :param stage: Stage of the batch
+        :type stage: str
+        :param job: Job name
+        :type job: str
+        """
+        self._execute("""UPDATE jobs SET state='running',start_time=?,attempts=attempts+1
+                         WHERE batch=? AND stage=? AND job=?""",
+                      (time.time(),batch,stage,job))
+
+    def finish(self,batch,stage,job,state,exit_code=None,outputs=()):
+        """Record the end of a job
+
+        :param batch: Batch name
+        :type batch: str
+        :param stage: Stage of the batch
+        :type stage: str
+        :param job: Job name
+        :type job: str
+        :param state: 'completed', 'failed' or 'terminated'
+        :type state: str
+        :param exit_code: Exit code of the command, defaults to None
+        :type exit_code: int, optional
+        :param outputs: Output files of the job, defaults to ()
+        :type outputs: list[str], optional
+        """
+        end_time=time.time()
+        self._execute("""UPDATE jobs SET state=?,start_time=COALESCE(start_time,?),
+                             end_time=?,exit_code=?,outputs=?
+                         WHERE batch=? AND stage=? AND job=?""",
+                      (state,end_time,end_time,exit_code,
+                       json.dumps([os.path.abspath(fpath) for fpath in outputs]),
+                       batch,stage,job))
+
+    def interrupt(self,batch):
+        """Mark the jobs left pending or running by a previous session as
+        interrupted
+
+        :param batch: Batch name
+        :type batch: str
+        :return: Number of interrupted jobs
+        :rtype: int
+        """
+        where="WHERE batch=? AND state IN ('pending','running')"
+        count=self._execute(f'SELECT COUNT(*) FROM jobs {where}',(batch,))[0][0]
+        self._execute(f"UPDATE jobs SET state='interrupted' {where}",(batch,))
+        return count
+
+    def is_done(self,batch,stage,job,inputs_hash=None):
+        """Check if a job completed with the same inputs and its outputs
+        still exist
+
+        :param batch: Batch name
+        :type batch: str
+        :param stage: Stage of the batch
+        :type stage: str
+        :param job: Job name
+        :type job: str
+        :param inputs_hash: Hash of the current job inputs. If None, the
+        inputs are not compared, defaults to None
+        :type inputs_hash: str, optional
+        :return: True if the job does not need to run again
+        :rtype: bool
+        """
+        rows=self._execute("""SELECT state,inputs_hash,outputs FROM jobs
+                              WHERE batch=? AND stage=? AND job=?""",(batch,stage,job))
+        if not rows or rows[0]['state']!='completed':
+            return False
+        if inputs_hash is not None and rows[0]['inputs_hash']!=inputs_hash:
+            return False
+        return all(os.path.isfile(fpath) for fpath in json.loads(rows[0]['outputs'] or '[]'))
+
+    def jobs(self,batch=None,stage=None,states=None):
+        """List the recorded jobs
+
+        :param batch: Only list the jobs of this batch, defaults to None
+        :type batch: str, optional
+        :param stage: Only list the jobs of this stage, defaults to None
+        :type stage: str, optional
+        :param states: Only list the jobs in these states, defaults to None
+        :type states: list[str], optional
+        :return: Recorded fields of each job
+        :rtype: list[dict]
+        """
+        sql='SELECT * FROM jobs WHERE 1'
+        params=[]
+        for column,value in (('batch',batch),('stage',stage)):
+            if value is not None:
+                sql+=f' AND {column}=?'
+                params.append(value)
+        if states is not None:
+            sql+=f" AND state IN ({','.join('?'*len(states))})"
+            params+=list(states)
+        jobs=[]
+        for row in self._execute(sql+' ORDER BY rowid',params):
+            job=dict(row)
+            job['outputs']=json.loads(job['outputs'] or '[]')
+            job['settings']=json.loads(job['settings'] or 'null')
+            jobs.append(job)
+        return jobs
+
+    def batches(self):
+        """List the recorded batches
+
+        :return: Batch name, number of jobs and time of the last job end
+        :rtype: list[dict]
+        """
+        return [dict(row) for row in self._execute(
+                    """SELECT batch,COUNT(*) AS jobs,MAX(end_time) AS last_time
+                       FROM jobs GROUP BY batch ORDER BY last_time""")]
+
+    def summary(self,batch):
+        """Summarize the jobs of a batch
+
+        :param batch: Batch name
+        :type batch: str
+        :return: Number of jobs, number of jobs per state and per stage,
+        total run time in seconds and the jobs that did not complete
+        :rtype: dict
+        """
+        jobs=self.jobs(batch)
+        summary={'jobs':len(jobs),'states':{},'stages':{},'run_time':0.0,'unfinished':[]}
+        for job in jobs:
+            summary['states'][job['state']]=summary['states'].get(job['state'],0)+1
+            stage=summary['stages'].setdefault(job['stage'],{})
+            stage[job['state']]=stage.get(job['state'],0)+1
+            if job['start_time'] is not None and job['end_time'] is not None:
+                summary['run_time']+=job['end_time']-job['start_time']
+            if job['state'] in self.unfinished:
+                summary['unfinished'].append({key:job[key] for key in
+                                              ('stage','job','state','exit_code')})
+        return summary
+
+    def clear(self,batch=None):
+        """Delete the recorded jobs
+
+        :param batch: Only delete the jobs of this batch, defaults to None
+        :type batch: str, optional
+        """
+        if batch is None:
+            self._execute('DELETE FROM jobs')
+        else:
+            self._execute('DELETE FROM jobs WHERE batch=?',(batch,))
@@ -1,5 +1,7 @@
 import threading
 import subprocess
+import queue
+import signal
 import time
 import os
 import re
@@ -323,6 +325,175 @@ class EventLogger:
         EventLogger.log_event('ERROR',msg)
         raise ValueError(f"\n\033[2;37;41mError!:{msg} \033[0;0m")
 
+class LogTailer:
+    """Follow a log file written by a long running external tool.
+
+    Only the bytes appended since the last read are read. Filesystem change 
+    notifications are used when the optional watchdog package is installed, 
+    otherwise the file is polled with an interval that grows while the log is 
+    idle, up to max_poll seconds. Completion or failure of the run is detected 
+    from the log lines themselves.
+    """
+    def __init__(self, path, pattern='*.log', newer_than=None, on_line=None,
+                 success=None, failure=None, min_poll=0.05, max_poll=1):
+        """Initialize the tailer
+
+        :param path: Folder of the log file, or the log file itself
+        :type path: str
+        :param pattern: Wildcard of the log file name in the folder, the newest 
+        matching file is followed. Defaults to '*.log'
+        :type pattern: str, optional
+        :param newer_than: Only follow a log file modified after this time stamp.
+        Defaults to None
+        :type newer_than: float, optional
+        :param on_line: Called with every new line, defaults to None
+        :type on_line: callable, optional
+        :param success: Regular expression of a line marking a successful run, 
+        defaults to None
+        :type success: str, optional
+        :param failure: Regular expression of a line marking a failed run. 
+        The run stays failed even if a success line follows, defaults to None
+        :type failure: str, optional
+        :param min_poll: Shortest time between reads in seconds, defaults to 0.05
+        :type min_poll: float, optional
+        :param max_poll: Longest time between reads in seconds, defaults to 1
+        :type max_poll: float, optional
+        """
+        self.path=path
+        self.pattern=pattern
+        self.newer_than=newer_than
+        self.on_line=on_line
+        self.success=None if success is None else re.compile(success)
+        self.failure=None if failure is None else re.compile(failure)
+        self.min_poll=min_poll
+        self.max_poll=max_poll
+        self.log_fname=None
+        #identity of the followed file, to detect it was replaced
+        self.file_id=None
+        self.offset=0
+        self.partial=b''
+        self.last_line=None
+        self.status=None
+        self.changed=threading.Event()
+        self.observer=None
+
+    def find_log_file(self):
+        """Find the newest log file matching the pattern
+
+        :return: Path of the log file, None if it does not exist yet
+        :rtype: str
+        """
+        if os.path.isfile(self.path):
+            fnames=[self.path]
+        else:
+            fnames=glob.glob(os.path.join(self.path,self.pattern))
+        fnames=[fname for fname in fnames
+                if self.newer_than is None or os.path.getmtime(fname)>self.newer_than]
+        return max(fnames,key=os.path.getctime) if fnames else None
+
+    def _watch(self):
+        """Start filesystem notifications if watchdog is installed
+        """
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return
+
+        tailer=self
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                tailer.changed.set()
+
+        folder=self.path if os.path.isdir(self.path) else os.path.dirname(self.path)
+        self.observer=Observer()
+        self.observer.schedule(Handler(),folder or os.curdir)
+        self.observer.start()
+
+    def read_new(self, final=False):
+        """Read the lines appended to the log file since the last read.
+        If the file was truncated or replaced, i.e. it got shorter or its 
+        inode or creation time changed, it is read from the beginning.
+
+        :param final: If True, a last line without a line break is also 
+        returned, defaults to False
+        :type final: bool, optional
+        :return: New complete lines
+        :rtype: list[str]
+        """
+        if self.log_fname is None:
+            self.log_fname=self.find_log_file()
+            if self.log_fname is None:
+                return []
+        try:
+            with open(self.log_fname,'rb') as f:
+                stat=os.fstat(f.fileno())
+                file_id=(stat.st_dev,stat.st_ino,getattr(stat,'st_birthtime',None))
+                if stat.st_size<self.offset or file_id!=self.file_id:
+                    #a new run, its status is read again
+                    self.offset=0
+                    self.partial=b''
+                    self.status=None
+                    self.file_id=file_id
+                f.seek(self.offset)
+                data=f.read()
+        except FileNotFoundError:
+            self.log_fname,self.file_id,self.offset,self.partial=None,None,0,b''
+            return []
+        self.offset+=len(data)
+
+        *lines,self.partial=(self.partial+data).split(b'\n')
+        if final and self.partial:
+            lines.append(self.partial)
+            self.partial=b''
+        lines=[line.decode('utf-8',errors='replace').rstrip('\r') for line in lines]
+        for line in lines:
+            if line.strip():
+                self.last_line=line
+            if self.failure is not None and self.failure.search(line):
+                self.status=False
+            elif (self.success is not None and self.status is not False 
+                    and self.success.search(line)):
+                #a failed run is not marked successful by a later success line
+                self.status=True
+            if self.on_line:
+                self.on_line(line)
+        return lines
+
+    def follow(self, stop_event=None, stop_on_status=False):
+        """Read the log file until stop_event is set, or until the run 
+        completes or fails if stop_on_status is True.
+        The log is read one last time after stopping.
+
+        :param stop_event: Event that stops following, defaults to None
+        :type stop_event: threading.Event, optional
+        :param stop_on_status: If True, stop as soon as a success or failure 
+        line is read, defaults to False
+        :type stop_on_status: bool, optional
+        :return: True if a success line was read, False if a failure line 
+        was read, otherwise None
+        :rtype: bool
+        """
+        self._watch()
+        poll=self.min_poll
+        try:
+            while not (stop_event is not None and stop_event.is_set()):
+                if self.read_new():
+                    poll=self.min_poll
+                else:
+                    poll=min(2*poll,self.max_poll)
+                if stop_on_status and self.status is not None:
+                    return self.status
+                self.changed.wait(poll)
+                self.changed.clear()
+            self.read_new(final=True)
+        finally:
+            if self.observer is not None:
+                self.observer.stop()
+                self.observer.join()
+        return self.status
+
+
 class Cmds:
     """A class containing methods to create batch mode commands
     """
@@ -419,24 +590,120 @@ class SubProc:
         self.subprocess=None  
         self.cwd=None
         self.start_time=None
+        self.end_time=None
         self.timeout=None
         self.was_terminated=False
+        self.output=[]
+        self.readers=[]
         
-    def start(self):
+    def start(self, on_line=None, on_exit=None):
         """
-        This function starts the subprocess by running the command passed to it 
+        This function starts the subprocess by running the command passed to it.
+        stdout and stderr are read line by line while the subprocess runs, so a 
+        child that writes a lot of output never blocks on a full pipe.
+
+        :param on_line: Called with (subprocess, line) for every output line, 
+        defaults to None
+        :type on_line: callable, optional
+        :param on_exit: Called with the subprocess once it exits, defaults to None
+        :type on_exit: callable, optional
         """
         print(f"starting subprocess {self.id}")       
         command=self.commands[0]  #only supports one command
         print('cmd: '+command)
         self.subprocess = subprocess.Popen(command, stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,shell=True,cwd=self.cwd)    
-        self.start_time=time.time()            
+        stderr=subprocess.PIPE,shell=True,cwd=self.cwd,
+        start_new_session=(os.name!='nt'))    
+        self.start_time=time.time()
+        self.readers=[threading.Thread(target=self._read, args=(pipe,on_line),
+                                       daemon=True)
+                      for pipe in (self.subprocess.stdout,self.subprocess.stderr)]
+        for reader in self.readers:
+            reader.start()
+        threading.Thread(target=self._wait, args=(on_exit,), daemon=True).start()
         return self.subprocess
 
+    def _read(self, pipe, on_line):
+        """Read a pipe of the subprocess until it is closed
+
+        :param pipe: stdout or stderr of the subprocess
+        :type pipe: file
+        :param on_line: Called with (subprocess, line) for every line
+        :type on_line: callable
+        """
+        for line in iter(pipe.readline, b''):
+            line=line.decode('utf-8', errors='replace')
+            self.output.append(line)
+            if on_line:
+                on_line(self,line)
+        pipe.close()
+
+    def _wait(self, on_exit):
+        """Wait for the subprocess to exit, terminating it on timeout
+
+        :param on_exit: Called with the subprocess once it exits
+        :type on_exit: callable
+        """
+        try:
+            self.subprocess.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            self.terminate()
+            self.subprocess.wait()
+        for reader in self.readers:
+            reader.join()
+        self.end_time=time.time()
+        if on_exit:
+            on_exit(self)
+
     def terminate(self):
-        self.subprocess.terminate()
+        """Terminate the subprocess together with the processes started by its shell
+        """
         self.was_terminated=True
+        if os.name=='nt':
+            subprocess.run(f'taskkill /F /T /PID {self.subprocess.pid}',
+                           stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+        else:
+            try:
+                os.killpg(self.subprocess.pid,signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    @property
+    def returncode(self):
+        """Exit code of the subprocess, None if it did not exit yet
+        """
+        return None if self.subprocess is None else self.subprocess.returncode
+
+    @property
+    def state(self):
+        """State of the subprocess: 'pending', 'running', 'completed',
+        'failed' or 'terminated'
+        """
+        if self.subprocess is None:
+            return 'pending'
+        if self.end_time is None:
+            return 'running'
+        if self.was_terminated:
+            return 'terminated'
+        return 'completed' if self.returncode==0 else 'failed'
+
+    @property
+    def wall_time(self):
+        """Run time of the subprocess in seconds, None if it did not start yet
+        """
+        if self.start_time is None:
+            return None
+        end_time=time.time() if self.end_time is None else self.end_time
+        return end_time-self.start_time
+
+    def info(self):
+        """Return the state of the subprocess
+
+        :return: id, command, state, exit code and wall time in seconds
+        :rtype: dict
+        """
+        return {'id':self.id,'command':self.commands[0],'state':self.state,
+                'returncode':self.returncode,'wall_time':self.wall_time}
         
 class ProcessManager:
     def __init__(self):
@@ -444,11 +711,15 @@ class ProcessManager:
         self.id_counter = 0        
         self.running = False        
         self.console_lock = threading.Lock()
+        self.exited = queue.Queue()
+        #called with the subprocess when it starts and when it exits
+        self.on_start = None
+        self.on_exit = None
 
     def __del__(self):
         # Kill all subprocesses
         for process in self.subprocesses_queue:
-            if process.subprocess:
+            if process.subprocess and process.subprocess.poll() is None:
                 process.subprocess.terminate()
     
     def clear_queue(self):
@@ -474,68 +745,62 @@ class ProcessManager:
     def check_status(self, process_id):
         for process in self.subprocesses_queue:
             if process.id == process_id:
-                process.poll()
-                if process.returncode is None:
-                    return "running"
-                else:
-                    return "completed"
+                return process.state
         return "invalid id"
 
-    def run(self, batch_size=float("inf")):        
-        while self.running:                    
-            #process that started
-            started_procs=[]
-            pending_procs=[]
-            for proc in self.subprocesses_queue:
-                if proc.subprocess:
-                    started_procs.append(proc)
-                else:
-                    pending_procs.append(proc)            
-            #from the started process, check which one is completed
-            completed_procs=[]
-            running_procs=[]            
-            timout_procs=[] 
-            for proc in started_procs:
-                proc.subprocess.poll()                
-                if proc.subprocess.returncode is None:                       
-                    if proc.timeout:
-                        #kill process that timeout
-                        elapsed_time =time.time()-proc.start_time
-                        if elapsed_time>proc.timeout:
-                            proc.terminate()
-                            timout_procs.append(proc)
-                    else:
-                        running_procs.append(proc)
-                else:
-                    completed_procs.append(proc) 
+    def job_info(self, process_id=None):
+        """Return the state, exit code and wall time of the scheduled subprocesses
 
-                
-                               
-            for i in range(batch_size-len(running_procs)):                
-                if i<len(pending_procs):
-                    pending_procs[i].start()
-                    time.sleep(0.1)                
-            #print completed
-            for proc in completed_procs:
+        :param process_id: id returned by schedule_subprocess. If None, all the 
+        subprocesses are returned, defaults to None
+        :type process_id: int, optional
+        :return: Information of one subprocess, or a list for all of them
+        :rtype: dict or list[dict]
+        """
+        if process_id is None:
+            return [process.info() for process in self.subprocesses_queue]
+        for process in self.subprocesses_queue:
+            if process.id == process_id:
+                return process.info()
+        return None
+
+    def print_line(self, proc, line):
+        with self.console_lock:
+            print(f'[{proc.id}] {line}', end='')
+
+    def run(self, batch_size=float("inf")):
+        pending_procs=[proc for proc in self.subprocesses_queue 
+                       if proc.subprocess is None]
+        running_procs=[proc for proc in self.subprocesses_queue 
+                       if proc.state=='running']
+        completed_procs=[proc for proc in self.subprocesses_queue 
+                         if proc not in pending_procs and proc not in running_procs]
+        while self.running:
+            #start pending processes as soon as a slot is free
+            while pending_procs and len(running_procs)<batch_size:
+                proc=pending_procs.pop(0)
+                proc.start(self.print_line,self.exited.put)
+                running_procs.append(proc)
+                if self.on_start:
+                    self.on_start(proc)
+            if not running_procs:
+                print(f'Done')
+                self.running=False
+                break
+            #block until a process exits
+            proc=self.exited.get()
+            running_procs.remove(proc)
+            completed_procs.append(proc)
+            if self.on_exit:
+                self.on_exit(proc)
+            with self.console_lock:
                 if proc.was_terminated:
-                    continue
-                output = proc.subprocess.stdout.read()                
-                if output:
-                    print(f"Subprocess {proc.id} has completed with output:")
-                    print(f"")
-                    print(output.decode('utf-8'))
-                    self.print_progress(running_procs,pending_procs,completed_procs)
-            #print timout
-            for proc in timout_procs:                                
-                print(f"Subprocess {proc.id} has been terminated with timeout = {proc.timeout} s\n")
+                    print(f"Subprocess {proc.id} has been terminated with timeout = {proc.timeout} s\n")
+                else:
+                    print(f"Subprocess {proc.id} has completed with exit code "
+                          f"{proc.returncode} in {proc.wall_time:.1f} s")
                 self.print_progress(running_procs,pending_procs,completed_procs)
-                    
-            
 
-            if len(completed_procs)==len(self.subprocesses_queue):
-                print(f'Done')
-                self.running=False                                                                     
-            time.sleep(2)
     def print_progress(self,running_procs,pending_procs,completed_procs):
         print(f'Running: {len(running_procs)}')
         print(f'Pending: {len(pending_procs)}')
@@ -548,4 +813,3 @@ class ProcessManager:
         print('')        
         self.running = True
         self.run(batch_size)
-            
\ No newline at end of file